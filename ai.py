@@ -0,0 +1,198 @@
+import time
+from collections import OrderedDict
+import engine
+
+# Expectimax player for the packed 4x4 board of engine.py
+
+# Weights of the board heuristic
+LOST_PENALTY = 200000.0
+MONOTONICITY_POWER = 4.0
+MONOTONICITY_WEIGHT = 47.0
+SUM_POWER = 3.5
+SUM_WEIGHT = 11.0
+MERGES_WEIGHT = 700.0
+EMPTY_WEIGHT = 270.0
+
+# Chance of each spawned exponent, same as random.choice([2, 4]) in end_move
+SPAWN_PROBABILITY = 1.0 / len(engine.SPAWN_EXPONENTS)
+
+
+#score one row: empty cells and merges are good, unsorted and big tiles are bad
+def row_heuristic(line):
+    total = sum(exp ** SUM_POWER for exp in line)
+    empty = line.count(0)
+
+    merges = 0
+    previous = 0
+    counter = 0
+    for exp in line:
+        if not exp:
+            continue
+        if exp == previous:
+            counter += 1
+        elif counter > 0:
+            merges += 1 + counter
+            counter = 0
+        previous = exp
+    if counter > 0:
+        merges += 1 + counter
+
+    mono_left = 0.0
+    mono_right = 0.0
+    for i in range(1, len(line)):
+        if line[i - 1] > line[i]:
+            mono_left += line[i - 1] ** MONOTONICITY_POWER - line[i] ** MONOTONICITY_POWER
+        else:
+            mono_right += line[i] ** MONOTONICITY_POWER - line[i - 1] ** MONOTONICITY_POWER
+
+    return (LOST_PENALTY + EMPTY_WEIGHT * empty + MERGES_WEIGHT * merges
+            - MONOTONICITY_WEIGHT * min(mono_left, mono_right) - SUM_WEIGHT * total)
+
+
+HEURISTIC = [row_heuristic(engine.unpack_row(row)) for row in range(1 << 16)]
+
+
+def evaluate(board):  # Heuristic value of a board, rows plus columns
+    mask = engine.ROW_MASK
+    t = engine.transpose(board)
+    return (HEURISTIC[board & mask] + HEURISTIC[(board >> 16) & mask]
+            + HEURISTIC[(board >> 32) & mask] + HEURISTIC[board >> 48]
+            + HEURISTIC[t & mask] + HEURISTIC[(t >> 16) & mask]
+            + HEURISTIC[(t >> 32) & mask] + HEURISTIC[t >> 48])
+
+
+class SearchTimeout(Exception):  # Raised inside the search when the time budget runs out
+    pass
+
+
+#depth-limited expectimax with a bounded transposition table and a time budget
+class Expectimax:
+    def __init__(self, max_depth=6, time_budget=0.05, table_size=200000, prob_cutoff=1e-4):
+        self.max_depth = max_depth  # Deepest iteration, in moves
+        self.time_budget = time_budget  # Seconds per move, None searches max_depth fully
+        self.table_size = table_size  # Entries kept in the transposition table
+        self.prob_cutoff = prob_cutoff  # Spawn paths less likely than this are evaluated directly
+        self.table = OrderedDict()  # board -> (depth, value), least recently used first
+        self.nodes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.search_time = 0.0
+        self.depth_reached = 0  # Depth of the last completed iteration
+        self.searched = 0  # Depth the last chance_node or max_node searched fully, less where prob_cutoff stopped it
+        self.deadline = None
+        self.stop = None  # Callable, the search gives up as soon as it returns true
+
+    @property
+    def nodes_per_sec(self):
+        return self.nodes / self.search_time if self.search_time else 0.0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def reset_stats(self):
+        self.nodes = self.lookups = self.hits = 0
+        self.search_time = 0.0
+
+    #best move for the board, None when no move changes it
+    def best_move(self, board):
+        start = time.perf_counter()
+        self.deadline = start + self.time_budget if self.time_budget else None
+        best = None
+        try:
+            for depth in range(1, self.max_depth + 1):
+                best = self.search_root(board, depth)
+                self.depth_reached = depth
+                if best is None:
+                    break
+        except SearchTimeout:
+            pass
+        if best is None:  # The budget ran out before depth 1 finished
+            best = self.search_root(board, 1, check_time=False)
+        self.search_time += time.perf_counter() - start
+        return best
+
+    def search_root(self, board, depth, check_time=True):
+        best = None
+        best_value = -1.0
+        deadline = self.deadline
+        if not check_time:
+            self.deadline = None
+        try:
+            for direction in (engine.LEFT, engine.RIGHT, engine.UP, engine.DOWN):
+                new, _, moved = engine.move(board, direction)
+                if not moved:
+                    continue
+                value = self.chance_node(new, depth, 1.0)
+                if value > best_value:
+                    best, best_value = direction, value
+        finally:
+            self.deadline = deadline
+        return best
+
+    #average over every spawn: each empty cell, each exponent
+    #
+    #the table keeps the depth searched fully, not the depth asked for: a subtree
+    #cut short by prob_cutoff on an unlikely path must not stand in later for a
+    #full search of the same board reached on a likely one
+    def chance_node(self, board, depth, prob):
+        self.nodes += 1
+        if depth <= 0 or prob < self.prob_cutoff:
+            self.searched = 0
+            return evaluate(board)
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+        if self.stop is not None and self.stop():
+            raise SearchTimeout
+
+        self.lookups += 1
+        value = self.lookup(board, depth)
+        if value is not None:
+            self.hits += 1
+            self.searched = depth
+            return value
+
+        cells = engine.empty_cells(board)
+        if not cells:
+            self.searched = depth
+            return evaluate(board)
+        cell_prob = prob / len(cells)
+        total = 0.0
+        searched = depth
+        for index in cells:
+            for exp in engine.SPAWN_EXPONENTS:
+                total += self.max_node(board | exp << (4 * index), depth, cell_prob * SPAWN_PROBABILITY)
+                searched = min(searched, self.searched)
+        value = total * SPAWN_PROBABILITY / len(cells)
+        if searched > 0:
+            self.store(board, searched, value)
+        self.searched = searched
+        return value
+
+    def lookup(self, board, depth):  # Value of board searched at least depth deep, None if it is not in the table
+        entry = self.table.get(board)
+        if entry is not None and entry[0] >= depth:
+            self.table.move_to_end(board)
+            return entry[1]
+        return None
+
+    def store(self, board, depth, value):
+        self.table[board] = (depth, value)
+        self.table.move_to_end(board)
+        if len(self.table) > self.table_size:
+            self.table.popitem(last=False)
+
+    #value of the best move after a spawn
+    def max_node(self, board, depth, prob):
+        self.nodes += 1
+        best = 0.0
+        searched = depth  # A board without moves is done at any depth
+        for direction in (engine.LEFT, engine.RIGHT, engine.UP, engine.DOWN):
+            new, _, moved = engine.move(board, direction)
+            if moved:
+                value = self.chance_node(new, depth - 1, prob)
+                searched = min(searched, self.searched + 1)
+                if value > best:
+                    best = value
+        self.searched = searched
+        return best
@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+
+import batch
+import engine
+import replay
+
+# Statistics over large game corpora
+#
+#   python -m analytics games.r2048 results.npy --workers 8 --out summary.json
+#
+# Inputs are .r2048 replay files and .npy result arrays written by selfplay. Both
+# are read a chunk at a time (records streamed from the file, result arrays
+# memory mapped), every chunk is reduced to a Stats on a worker, and the parent
+# merges those. A Stats is a few fixed size sketches: a histogram of the biggest
+# tiles and t-digest style quantile summaries, so memory stays the same whatever
+# the size of the corpus, and only a few chunks are in flight at any time.
+#
+# Replays are played again (4x4 ones with the NumPy batch engine) to find the
+# move that first made a 2048 and the move after which the board was full
+# with no merge left, i.e. has_merge failed. Selfplay stops a game at its first
+# 2048, so a result row gives both from its move count. --fast uses the headers
+# of 4x4 records only; other sizes are played again anyway, since their header
+# keeps a hash of the final board and not its tiles. The summary counts the games
+# the move indices were measured on ('timed_games').
+
+CHUNK_RECORDS = replay.BATCH_SIZE  # Replay records per task
+CHUNK_RESULTS = 1000000  # Rows of a result array per task
+COMPRESSION = 200  # Accuracy of the quantile digests, about COMPRESSION / 2 centroids
+QUANTILES = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+
+#mergeable quantile sketch: weighted centroids, small near the tails
+class Digest:
+    def __init__(self, compression=COMPRESSION):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(len(values))]))
+
+    def merge(self, other):
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+
+    #sort the centroids and join neighbours that fall in the same unit of the
+    #scale k(q) = compression / (2 pi) * asin(2q - 1)
+    def compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means = means[order]
+        weights = weights[order]
+        centers = (np.cumsum(weights) - weights / 2) / weights.sum()
+        k = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * centers - 1))
+        starts = np.concatenate([[0], np.nonzero(np.diff(k))[0] + 1])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        centers = np.cumsum(self.weights) - self.weights / 2
+        return float(np.interp(q * self.count, np.concatenate([[0], centers, [self.count]]),
+                               np.concatenate([[self.min], self.means, [self.max]])))
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        result = {'count': self.count, 'mean': self.total / self.count, 'min': self.min, 'max': self.max}
+        for q in QUANTILES:
+            result[f"p{q * 100:g}"] = self.quantile(q)
+        return result
+
+
+#sketches of a set of games, merged from chunk to chunk
+class Stats:
+    def __init__(self):
+        self.games = 0
+        self.won = 0
+        self.timed = 0  # Games that went into time_to_win and stuck_at
+        self.unreplayable = 0  # Non-4x4 games of version 1 replay files, counted in games, scores and moves only
+        self.mismatched = 0  # Replays whose final board or score differ from the record
+        self.scores = Digest()
+        self.moves = Digest()
+        self.time_to_win = Digest()  # Moves until the first 2048 tile, games that made one
+        self.stuck_at = Digest()  # Moves until has_merge failed, lost games
+        self.max_tiles = np.zeros(engine.MAX_EXPONENT + 1, dtype=np.int64)  # Games per exponent of the biggest tile
+
+    def add_tiles(self, exponents):
+        self.add_tile_counts(np.bincount(np.asarray(exponents, dtype=np.int64), minlength=len(self.max_tiles)))
+
+    def add_tile_counts(self, counts):  # Add a histogram of exponents
+        if len(counts) > len(self.max_tiles):
+            self.max_tiles = np.pad(self.max_tiles, (0, len(counts) - len(self.max_tiles)))
+        self.max_tiles[:len(counts)] += counts
+
+    def merge(self, other):
+        self.games += other.games
+        self.won += other.won
+        self.timed += other.timed
+        self.unreplayable += other.unreplayable
+        self.mismatched += other.mismatched
+        self.scores.merge(other.scores)
+        self.moves.merge(other.moves)
+        self.time_to_win.merge(other.time_to_win)
+        self.stuck_at.merge(other.stuck_at)
+        self.add_tile_counts(other.max_tiles)
+
+    def summary(self):
+        return {
+            'games': self.games,
+            'won': self.won,
+            'win_rate': self.won / self.games if self.games else 0.0,
+            'mismatched_replays': self.mismatched,
+            'score': self.scores.summary(),
+            'moves': self.moves.summary(),
+            'max_tile': {str(1 << exp): int(count) for exp, count in enumerate(self.max_tiles) if count and exp},
+            'timed_games': self.timed,
+            'unreplayable_games': self.unreplayable,
+            'time_to_2048': self.time_to_win.summary(),
+            'stuck_at': self.stuck_at.summary(),
+        }
+
+
+#stats of a chunk of replay records, replay_moves plays them again for the move indices
+def analyze_records(records, replay_moves=True):
+    stats = Stats()
+    stats.games = len(records)
+    stats.scores.add([record.score for record in records])
+    stats.moves.add([record.count for record in records])
+    packed = [record for record in records if (record.rows, record.cols) == (engine.ROWS, engine.COL)]
+    others = [record for record in records if (record.rows, record.cols) != (engine.ROWS, engine.COL)]
+    stats.unreplayable = sum(not record.replayable for record in others)
+    others = [record for record in others if record.replayable]
+
+    if packed:
+        finals = np.array([record.final for record in packed], dtype=np.uint64)
+        exps = batch.max_exponent(finals)
+        stats.add_tiles(exps)
+        stats.won += int((exps >= engine.WIN_EXPONENT).sum())
+        if replay_moves:
+            won_at = np.full(len(packed), -1, dtype=np.int64)
+            stuck_at = np.full(len(packed), -1, dtype=np.int64)
+
+            def observe(moves, index, boards):
+                current = boards[index]
+                first = (won_at[index] < 0) & (batch.max_exponent(current) >= engine.WIN_EXPONENT)
+                won_at[index[first]] = moves
+                first = (stuck_at[index] < 0) & batch.is_lost(current)
+                stuck_at[index[first]] = moves
+
+            ok = replay.replay_batch(packed, observe)
+            stats.timed += len(packed)
+            stats.mismatched += int((~ok).sum())
+            stats.time_to_win.add(won_at[won_at >= 0])
+            stats.stuck_at.add(stuck_at[stuck_at >= 0])
+
+    if others:  # Their keys are hashes, the tiles come from playing them again, even with --fast
+        stats.timed += len(others)
+        exps = []
+        for record in others:
+            board = replay.new_board(record.seed, record.rows, record.cols)
+            won_at = None
+            ok = True
+            for moves, direction in enumerate(replay.unpack_moves(record.moves, record.count), 1):
+                _, moved, _ = board.move(direction, with_paths=False)
+                if not moved:
+                    ok = False
+                    break
+                board.spawn()
+                if won_at is None and board.has_won():
+                    won_at = moves
+            if board.is_lost():
+                stats.stuck_at.add([board.moves])
+            if won_at is not None:
+                stats.time_to_win.add([won_at])
+                stats.won += 1
+            exps.append(board.max_exp)
+            stats.mismatched += not (ok and replay.board_key(board) == record.final and board.score == record.score)
+        stats.add_tiles(exps)
+    return stats
+
+
+def analyze_results(path, start, stop):  # Stats of rows [start, stop) of a selfplay .npy file
+    results = np.load(path, mmap_mode='r')[start:stop]
+    stats = Stats()
+    stats.games = len(results)
+    stats.won = int(results['won'].sum())
+    stats.timed = len(results)
+    stats.scores.add(results['score'])
+    stats.moves.add(results['moves'])
+    won = results['won']
+    stats.time_to_win.add(results['moves'][won])  # Selfplay stops a game at its first 2048
+    stats.stuck_at.add(results['moves'][~won])  # and a lost game at the move that left no move
+    stats.add_tiles(np.log2(np.maximum(results['max_tile'], 1)).astype(np.int64))
+    return stats
+
+
+def tasks(paths, replay_moves=True, chunk_records=CHUNK_RECORDS, chunk_results=CHUNK_RESULTS):  # (function, args) per chunk
+    for path in paths:
+        if path.endswith('.npy'):
+            rows = len(np.load(path, mmap_mode='r'))
+            for start in range(0, rows, chunk_results):
+                yield analyze_results, (path, start, min(start + chunk_results, rows))
+            continue
+        chunk = []
+        for record in replay.read_records(path):
+            chunk.append(record)
+            if len(chunk) >= chunk_records:
+                yield analyze_records, (chunk, replay_moves)
+                chunk = []
+        if chunk:
+            yield analyze_records, (chunk, replay_moves)
+
+
+#run the tasks on a pool with at most two per worker queued, yields their results in order
+def run_tasks(work, workers):
+    if workers == 1:
+        for function, args in work:
+            yield function(*args)
+        return
+    with Pool(workers) as pool:
+        pending = deque()
+        for function, args in work:
+            pending.append(pool.apply_async(function, args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def analyze(paths, workers=None, replay_moves=True):  # Merged Stats of every game in the files
+    stats = Stats()
+    for chunk in run_tasks(tasks(paths, replay_moves), workers or os.cpu_count() or 1):
+        stats.merge(chunk)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize .r2048 replay files and selfplay .npy results.')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--fast', action='store_true', help='use the headers of 4x4 records only, no time to 2048 or stuck move for them')
+    parser.add_argument('--out', help='write the summary JSON here instead of printing it')
+    args = parser.parse_args(argv)
+
+    summary = analyze(args.paths, args.workers, not args.fast).summary()
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(summary, f, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
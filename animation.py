@@ -0,0 +1,60 @@
+import time
+from collections import namedtuple
+
+# Time based tile animations
+#
+# The rules are resolved instantly; the planner only knows where each drawn tile
+# starts and ends, and works out positions from the time since the move began,
+# so the main loop never blocks on an animation.
+
+SLIDE_TIME = 0.1  # Seconds the tiles take to slide to their targets
+POP_TIME = 0.08  # Seconds a spawned tile takes to grow to full size
+
+# One drawn tile of a move: kind is 'move', 'merge' or 'spawn'
+Transition = namedtuple('Transition', 'tile start end kind')
+
+
+def interpolate(start, end, progress):  # Point between start and end, progress from 0 to 1
+    return (start[0] + (end[0] - start[0]) * progress, start[1] + (end[1] - start[1]) * progress)
+
+
+#plays the transitions of one move at a time
+class AnimationPlanner:
+    def __init__(self, slide_time=SLIDE_TIME, pop_time=POP_TIME, clock=time.perf_counter):
+        self.slide_time = slide_time
+        self.pop_time = pop_time
+        self.clock = clock
+        self.sliding = []  # Transitions of the tiles that slide
+        self.settled = []  # Tiles of the board after the move
+        self.spawned = set()  # Tiles of settled that grow in
+        self.started = None  # Start time of the running animation, None when idle
+
+    @property
+    def active(self):
+        if self.started is None:
+            return False
+        if self.clock() - self.started >= self.slide_time + self.pop_time:
+            self.started = None
+        return self.started is not None
+
+    #start animating a move, settled are the tiles of the board after it
+    def start(self, transitions, settled):
+        self.sliding = [t for t in transitions if t.kind != 'spawn']
+        self.spawned = {id(t.tile) for t in transitions if t.kind == 'spawn'}
+        self.settled = list(settled)
+        self.started = self.clock()
+
+    def finish(self):  # Jump to the end of the running animation
+        self.started = None
+
+    #tiles to draw now as (tile, scale) pairs, tile.x and tile.y are set to the current position
+    def frame(self):
+        elapsed = self.clock() - self.started
+        if elapsed < self.slide_time:
+            progress = elapsed / self.slide_time
+            for tile, start, end, _ in self.sliding:
+                tile.x, tile.y = interpolate(start, end, progress)
+            return [(t.tile, 1.0) for t in self.sliding]
+
+        grow = min(1.0, (elapsed - self.slide_time) / self.pop_time) if self.pop_time else 1.0
+        return [(tile, grow if id(tile) in self.spawned else 1.0) for tile in self.settled]
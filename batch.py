@@ -0,0 +1,167 @@
+import numpy as np
+import engine
+
+# Vectorized 2048 for many games at once
+#
+# N boards are kept as a uint64 array using the same packing as engine.py, so
+# one step of every game is a handful of NumPy table lookups instead of a Python
+# loop over boards.
+
+ROW_MASK = np.uint64(0xFFFF)
+NIBBLE_MASK = np.uint64(0xF)
+CELL_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)  # Bit offset of every cell
+ROW_SHIFTS = (np.uint64(0), np.uint64(16), np.uint64(32), np.uint64(48))
+COL_SHIFTS = (np.uint64(0), np.uint64(4), np.uint64(8), np.uint64(12))
+SPAWN_EXPONENTS = np.array(engine.SPAWN_EXPONENTS, dtype=np.uint64)
+
+# The row tables of the engine as arrays
+ROW_LEFT = np.array(engine.ROW_LEFT, dtype=np.uint64)
+ROW_RIGHT = np.array(engine.ROW_RIGHT, dtype=np.uint64)
+COL_UP = np.array(engine.COL_UP, dtype=np.uint64)
+COL_DOWN = np.array(engine.COL_DOWN, dtype=np.uint64)
+SCORE_LEFT = np.array(engine.SCORE_LEFT, dtype=np.int64)
+SCORE_RIGHT = np.array(engine.SCORE_RIGHT, dtype=np.int64)
+ROW_HAS_PAIR = np.array(engine.ROW_HAS_PAIR, dtype=bool)
+
+
+def rows(boards):  # The four 16 bit rows of every board as table indices
+    return [((boards >> shift) & ROW_MASK).astype(np.intp) for shift in ROW_SHIFTS]
+
+
+def transpose(boards):  # Swap rows and columns of every board
+    a1 = boards & np.uint64(0xF0F00F0FF0F00F0F)
+    a2 = boards & np.uint64(0x0000F0F00000F0F0)
+    a3 = boards & np.uint64(0x0F0F00000F0F0000)
+    a = a1 | (a2 << np.uint64(12)) | (a3 >> np.uint64(12))
+    b1 = a & np.uint64(0xFF00FF0000FF00FF)
+    b2 = a & np.uint64(0x00FF00FF00000000)
+    b3 = a & np.uint64(0x00000000FF00FF00)
+    return b1 | (b2 >> np.uint64(24)) | (b3 << np.uint64(24))
+
+
+def move_all(boards, direction):  # Apply the same move to every board
+    if direction in (engine.LEFT, engine.RIGHT):
+        table = ROW_LEFT if direction == engine.LEFT else ROW_RIGHT
+        scores = SCORE_LEFT if direction == engine.LEFT else SCORE_RIGHT
+        parts = rows(boards)
+        shifts = ROW_SHIFTS
+    else:
+        table = COL_UP if direction == engine.UP else COL_DOWN
+        scores = SCORE_LEFT if direction == engine.UP else SCORE_RIGHT
+        parts = rows(transpose(boards))
+        shifts = COL_SHIFTS
+
+    new = np.zeros_like(boards)
+    score = np.zeros(len(boards), dtype=np.int64)
+    for part, shift in zip(parts, shifts):
+        new |= table[part] << shift
+        score += scores[part]
+    return new, score
+
+
+#apply one move per board, returns (new boards, score gained, moved mask)
+def move(boards, directions):
+    boards = np.asarray(boards, dtype=np.uint64)
+    directions = np.broadcast_to(np.asarray(directions), boards.shape)
+    new = boards.copy()
+    score = np.zeros(len(boards), dtype=np.int64)
+    for direction in range(4):
+        selected = directions == direction
+        if selected.any():
+            new[selected], score[selected] = move_all(boards[selected], direction)
+    return new, score, new != boards
+
+
+def cells(boards):  # (N, 16) array with the exponent of every cell
+    return (boards[:, None] >> CELL_SHIFTS) & NIBBLE_MASK
+
+
+def to_grid(boards):  # (N, ROWS, COL) array of exponents
+    return cells(np.asarray(boards, dtype=np.uint64)).reshape(-1, engine.ROWS, engine.COL).astype(np.uint8)
+
+
+def from_grid(grid):  # Pack a (N, ROWS, COL) array of exponents
+    flat = np.asarray(grid, dtype=np.uint64).reshape(len(grid), engine.CELLS)
+    return np.bitwise_or.reduce(flat << CELL_SHIFTS, axis=1)
+
+
+#put a random 2 or 4 on an empty cell of every board selected by mask
+def spawn(boards, rng, mask=None):
+    empty = cells(boards) == 0
+    counts = empty.sum(axis=1)
+    selected = counts > 0
+    if mask is not None:
+        selected &= mask
+
+    # Pick the k-th empty cell of each board with k uniform in [0, counts)
+    picks = (rng.random(len(boards)) * counts).astype(np.int64)
+    index = np.argmax(np.cumsum(empty, axis=1) > picks[:, None], axis=1).astype(np.uint64)
+    exps = SPAWN_EXPONENTS[rng.integers(0, len(SPAWN_EXPONENTS), len(boards))]
+
+    boards = boards.copy()
+    boards[selected] |= exps[selected] << (index[selected] * np.uint64(4))
+    return boards
+
+
+def new_boards(n, rng):  # Starting boards with two 2 tiles, like generate_tiles
+    boards = np.zeros(n, dtype=np.uint64)
+    for _ in range(2):
+        empty = cells(boards) == 0
+        picks = (rng.random(n) * empty.sum(axis=1)).astype(np.int64)
+        index = np.argmax(np.cumsum(empty, axis=1) > picks[:, None], axis=1).astype(np.uint64)
+        boards |= np.uint64(1) << (index * np.uint64(4))
+    return boards
+
+
+def has_merge(boards):  # Whether two equal tiles touch, like engine.has_merge
+    result = np.zeros(len(boards), dtype=bool)
+    for part in rows(boards) + rows(transpose(boards)):
+        result |= ROW_HAS_PAIR[part]
+    return result
+
+
+def is_lost(boards):  # Full boards without any possible merge
+    return (cells(boards) != 0).all(axis=1) & ~has_merge(boards)
+
+
+def max_exponent(boards):  # Exponent of the biggest tile of every board
+    return cells(boards).max(axis=1).astype(np.uint8)
+
+
+#many games stepped together
+class BatchGame:
+    def __init__(self, n, seed=None, win_exponent=engine.WIN_EXPONENT):
+        self.rng = np.random.default_rng(seed)
+        self.win_exponent = win_exponent
+        self.boards = new_boards(n, self.rng)
+        self.scores = np.zeros(n, dtype=np.int64)
+        self.moves = np.zeros(n, dtype=np.int64)  # Moves that changed the board
+        self.lost = np.zeros(n, dtype=bool)
+        self.won = np.zeros(n, dtype=bool)
+
+    def __len__(self):
+        return len(self.boards)
+
+    #one move per board, finished games are left alone
+    def step(self, directions):
+        active = ~(self.lost | self.won)
+        new, score, moved = move(self.boards, directions)
+        moved &= active
+        new = spawn(new, self.rng, moved)
+
+        self.boards = np.where(moved, new, self.boards)
+        self.scores += np.where(moved, score, 0)
+        self.moves += moved
+        self.lost |= active & is_lost(self.boards)
+        self.won |= active & (max_exponent(self.boards) >= self.win_exponent)
+        return moved, self.lost.copy(), self.won.copy()
+
+    def reset(self, mask=None):  # Start new games on the selected boards
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+        count = int(mask.sum())
+        self.boards[mask] = new_boards(count, self.rng)
+        self.scores[mask] = 0
+        self.moves[mask] = 0
+        self.lost[mask] = False
+        self.won[mask] = False
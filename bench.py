@@ -0,0 +1,382 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+# Headless benchmarks for the hot paths
+#
+#   python bench.py --out baseline.json
+#   python bench.py --compare baseline.json   # exits with 1 on a regression
+#
+# Every benchmark returns one number. The JSON output keeps its unit and whether
+# higher is better, so a comparison knows which way a regression goes.
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BENCHMARKS = {}  # name -> (function, unit, higher is better)
+
+
+def benchmark(name, unit, higher_is_better):  # Register a benchmark function
+    def register(function):
+        BENCHMARKS[name] = (function, unit, higher_is_better)
+        return function
+    return register
+
+
+def load_game():  # Import main.py and open its (dummy) window
+    import main
+    main.get_window()
+    return main
+
+
+def best_rate(function, count, repeat):  # Best calls per second of function over a few runs
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(count)
+        elapsed = time.perf_counter() - start
+        best = max(best, count / elapsed)
+    return best
+
+
+def random_boards(count, seed=1):  # Mid-game 4x4 boards
+    import engine
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = engine.new_board(rng)
+        for _ in range(rng.randrange(20, 200)):
+            new, _, _ = engine.step(board, rng.randrange(4), rng)
+            if engine.is_lost(new):
+                break
+            board = new
+        boards.append(board)
+    return boards
+
+
+@benchmark('cold_start', 'ms', False)
+def cold_start(scale):  # Fresh interpreter to the first main menu frame, from main.py --startup-profile
+    import subprocess
+    best = None
+    for _ in range(max(1, scale)):
+        output = subprocess.run([sys.executable, os.path.join(HERE, 'main.py'), '--startup-profile'],
+                                capture_output=True, text=True, check=True).stdout
+        for line in output.splitlines():
+            if line.startswith('first frame'):
+                value = float(line.split()[2])
+                best = value if best is None else min(best, value)
+    return best
+
+
+@benchmark('engine_moves', 'moves/s', True)
+def engine_moves(scale):
+    import engine
+    boards = random_boards(256)
+    move = engine.move
+
+    def run(count):
+        for i in range(count):
+            move(boards[i & 255], i & 3)
+    return best_rate(run, 200000 * scale, 3)
+
+
+@benchmark('move_tiles', 'moves/s', True)
+def move_tiles_rate(scale):  # The full move_tiles path: board move, tiles rebuild, spawn
+    main = load_game()
+    import view
+    import engine
+    rng = random.Random(2)
+    directions = engine.DIRECTION_NAMES
+
+    def run(count):
+        board, tiles, _ = new_game(main)
+        for i in range(count):
+            if view.move_tiles(board, tiles, directions[rng.randrange(4)]) == "lost":
+                board, tiles, _ = new_game(main)
+    return best_rate(run, 5000 * scale, 3)
+
+
+def new_game(main):  # Seeded board, tiles and recorder without touching the menus
+    from collections import deque
+    import animation
+    return main.new_game(animation.AnimationPlanner(), deque())
+
+
+def draw_time(fill, scale):  # Median milliseconds of one draw() with fill tiles on the board
+    main = load_game()
+    import view
+    from board import Board
+    board = Board(view.ROWS, view.COL)
+    rng = random.Random(fill)
+    for index in rng.sample(range(view.ROWS * view.COL), fill):
+        board.set(index, rng.randrange(1, 12))
+    tiles = view.tiles_from_board(board)
+    times = []
+    for _ in range(100 * scale):
+        start = time.perf_counter()
+        view.draw(main.WINDOW, tiles)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+@benchmark('draw_empty', 'ms/frame', False)
+def draw_empty(scale):
+    return draw_time(0, scale)
+
+
+@benchmark('draw_half', 'ms/frame', False)
+def draw_half(scale):
+    return draw_time(8, scale)
+
+
+@benchmark('draw_full', 'ms/frame', False)
+def draw_full(scale):
+    return draw_time(16, scale)
+
+
+@benchmark('idle_frame', 'ms/frame', False)
+def idle_frame(scale):  # Median milliseconds of a render_frame() of a full board that did not change
+    main = load_game()
+    import view
+    import animation
+    from board import Board
+    board = Board(view.ROWS, view.COL)
+    for index in range(view.ROWS * view.COL):
+        board.set(index, index % 11 + 1)
+    tiles = view.tiles_from_board(board)
+    planner = animation.AnimationPlanner()
+    view.draw(main.WINDOW, tiles, planner)
+    times = []
+    for _ in range(1000 * scale):
+        start = time.perf_counter()
+        view.render_frame(main.WINDOW, tiles, planner, None)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+@benchmark('scripted_game', 's/game', False)
+def scripted_game(scale):  # A seeded game fed a fixed key sequence, every frame drawn, animations skipped
+    main = load_game()
+    import view
+    import animation
+    from collections import deque
+    keys = ['left', 'down', 'right', 'down']
+    best = None
+    for _ in range(max(1, scale)):
+        random.seed(5)
+        planner = animation.AnimationPlanner()
+        board, tiles, _ = main.new_game(planner, deque())
+        start = time.perf_counter()
+        for i in range(2000):
+            if view.move_tiles(board, tiles, keys[i % 4], planner) == "lost":
+                break
+            while planner.active:
+                view.draw(main.WINDOW, tiles, planner)
+                planner.finish()
+            view.draw(main.WINDOW, tiles, planner)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@benchmark('menu_idle_cpu', 'cpu %', False)
+def menu_idle_cpu(scale):  # CPU used while a menu is open and the mouse is still
+    main = load_game()
+    import pygame
+    seconds = 0.5 * scale
+    pygame.event.clear()
+    pygame.time.set_timer(pygame.QUIT, int(seconds * 1000), 1)  # Close the menu after a while
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    main.PAUSE_MENU.run(main.WINDOW)
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    pygame.event.clear()
+    return 100.0 * cpu / wall
+
+
+@benchmark('ai_nodes', 'nodes/s', True)
+def ai_nodes(scale):
+    import ai
+    boards = random_boards(10 * scale, seed=3)
+    search = ai.Expectimax(max_depth=2, time_budget=None)
+    for board in boards:
+        search.best_move(board)
+    return search.nodes_per_sec
+
+
+@benchmark('parallel_nodes', 'nodes/s', True)
+def parallel_nodes(scale):  # The ai_nodes boards at depth 3 on a pool of every core, started before timing
+    import parallel
+    boards = random_boards(10 * scale, seed=3)
+    search = parallel.ParallelExpectimax(max_depth=3, time_budget=None)
+    search.start()
+    try:
+        for board in boards:
+            search.best_move(board)
+        return search.nodes_per_sec
+    finally:
+        search.close()
+
+
+@benchmark('batch_moves', 'board-moves/s', True)
+def batch_moves(scale):
+    import numpy as np
+    import batch
+    game = batch.BatchGame(10000, seed=1)
+    rng = np.random.default_rng(2)
+    steps = 20 * scale
+    start = time.perf_counter()
+    for _ in range(steps):
+        game.step(rng.integers(0, 4, len(game)))
+        game.reset(game.lost | game.won)
+    return steps * len(game) / (time.perf_counter() - start)
+
+
+@benchmark('env_steps', 'env-steps/s', True)
+def env_steps(scale):
+    import numpy as np
+    import env
+    envs = env.VectorEnv(4096, seed=1)
+    envs.reset()
+    actions = np.random.default_rng(2).integers(0, 4, (20 * scale, len(envs)))
+    start = time.perf_counter()
+    for step in actions:
+        envs.step(step)
+    return actions.size / (time.perf_counter() - start)
+
+
+@benchmark('mosaic_frame', 'ms/frame', False)
+def mosaic_frame(scale):  # Median step and draw of 64 greedy games in the mosaic view
+    main = load_game()
+    import view
+    import pygame
+    import mosaic
+    spectator = mosaic.Mosaic(64, (view.WIDTH, view.HEIGHT), 'greedy', seed=5)
+    pygame.display.update(spectator.draw(main.WINDOW))
+    times = []
+    for frame in range(300 * scale):
+        start = time.perf_counter()
+        spectator.update(1 / view.FPS, frame / view.FPS)
+        pygame.display.update(spectator.draw(main.WINDOW))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+@benchmark('ntuple_train', 'games/s', True)
+def ntuple_train(scale):  # TD self-play from zero weights in this process
+    import numpy as np
+    import ntuple
+    network = ntuple.NTupleNetwork()
+    games = 500 * scale
+    start = time.perf_counter()
+    ntuple.train_games(network, games, np.random.default_rng(1))
+    return games / (time.perf_counter() - start)
+
+
+@benchmark('ntuple_value', 'us/board', False)
+def ntuple_value(scale):  # Value of one board at a time, like the autoplay policy asks for it
+    import ntuple
+    network = ntuple.NTupleNetwork()
+    boards = random_boards(1000 * scale, seed=4)
+    return 1e6 / best_rate(lambda count: [network.value(board) for board in boards[:count]], len(boards), 3)
+
+
+@benchmark('export_gif', 'frames/s', True)
+def export_gif(scale):  # GIF of a recorded random game in this process
+    import tempfile
+    import export
+    import replay
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'bench.r2048')
+        replay.record_games(path, 1, 'random', seed=8)
+        record = next(replay.read_records(path))
+        start = time.perf_counter()
+        frames, _ = export.export(record, os.path.join(folder, 'bench.gif'), workers=1)
+        elapsed = time.perf_counter() - start
+    return frames / elapsed
+
+
+@benchmark('solver_positions', 'positions/s', True)
+def solver_positions(scale):  # Exact solution of 2x3 boards to 128
+    import tempfile
+    import solver
+    with tempfile.TemporaryDirectory() as folder:
+        report = solver.solve(2, 3, 7, os.path.join(folder, 'bench.s2048'), log=lambda *_: None)
+    return report['positions_per_sec']
+
+
+@benchmark('replay_verify', 'moves/s', True)
+def replay_verify(scale):  # One core on full chunks, python -m replay verify --workers 1 2 4 ... scales it
+    import tempfile
+    import replay
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'bench.r2048')
+        replay.record_games(path, replay.BATCH_SIZE * scale, 'random', seed=7)
+        games, moves, bad, skipped, elapsed = replay.verify([path], workers=1)
+    return moves / elapsed
+
+
+#run the selected benchmarks, returns {name: {value, unit, higher_is_better}}
+def run(names=None, scale=1, log=print):
+    results = {}
+    for name, (function, unit, higher_is_better) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        value = function(scale)
+        results[name] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+        if log:
+            log(f"{name:<16} {value:>14,.3f} {unit}")
+    return results
+
+
+#compare results with a baseline, returns the names that got worse by more than threshold
+def compare(results, baseline, threshold=0.1, log=print):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]['value']
+        new = result['value']
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if result['higher_is_better'] else change
+        flag = 'REGRESSION' if worse > threshold else ''
+        if flag:
+            regressions.append(name)
+        if log:
+            log(f"{name:<16} {old:>14,.3f} -> {new:>14,.3f} {result['unit']:<14} {change:+7.1%} {flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the 2048 engine, rendering and menus.')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', metavar='BASELINE', help='flag regressions against a stored JSON result')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown before a regression, 0.1 = 10%%')
+    parser.add_argument('--scale', type=int, default=1, help='multiply the amount of work of every benchmark')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='run only these benchmarks')
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.scale)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
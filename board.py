@@ -0,0 +1,213 @@
+import random
+import engine
+
+# Board of any size (tested up to 32x32) stored as a flat list of exponents
+#
+# Cell (row, col) is at index row * cols + col. Next to the cells the board keeps
+# a few running totals that every change updates:
+#   - the empty cells of every row as a bit mask, and their number per row in a
+#     Fenwick tree, so a spawn walks O(log rows) steps down the tree and selects
+#     the k-th bit of one row a byte at a time, without rejection sampling or a
+#     scan of the board (filling or emptying a cell is O(log rows) too)
+#   - a count per exponent and the biggest exponent, for the win check, O(1)
+#   - the number of touching equal pairs, for the game over check, O(1)
+# Spawn cells are counted in index order like engine.spawn_cell, so the pick only
+# depends on the cells and the RNG: a seeded game plays out the same on a Board,
+# on a packed engine board and after History puts a board back to an old
+# position. The 4x4 board also keeps its engine.py packing and moves through the
+# engine tables.
+
+NEIGHBOURS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+POPCOUNT = [bin(byte).count('1') for byte in range(256)]  # Set bits of every byte
+SELECT = [[bit for bit in range(8) if byte >> bit & 1] for byte in range(256)]  # Positions of the set bits of every byte
+
+
+class Board:
+    def __init__(self, rows=engine.ROWS, cols=engine.COL, rng=random):
+        self.rows = rows
+        self.cols = cols
+        self.rng = rng  # Random source of the spawns
+        self.score = 0  # Sum of the merged tiles
+        self.moves = 0  # Moves that changed the board
+        size = rows * cols
+        self.cells = [0] * size  # Exponent of every cell, 0 for empty
+        self.empty = size  # Number of empty cells
+        self.row_bits = [(1 << cols) - 1] * rows  # Bit col set when (row, col) is empty
+        self.tree = [0] + [cols * (i & -i) for i in range(1, rows + 1)]  # Fenwick tree of the empty cells per row
+        self.tree_top = 1 << (rows.bit_length() - 1)  # Biggest power of two up to rows
+        self.counts = [size]  # Number of cells holding each exponent
+        self.max_exp = 0  # Biggest exponent on the board
+        self.pairs = 0  # Touching cells with the same tile
+        self.packed = 0 if (rows, cols) == (engine.ROWS, engine.COL) else None  # engine.py board, 4x4 only
+        self.limit = engine.MAX_EXPONENT if self.packed is not None else None  # Merge cap of the packing
+
+        self.neighbours = []
+        for index in range(size):
+            row, col = divmod(index, cols)
+            self.neighbours.append([r * cols + c for r, c in ((row + dr, col + dc) for dr, dc in NEIGHBOURS)
+                                    if 0 <= r < rows and 0 <= c < cols])
+        self.lines = [self.build_lines(direction) for direction in range(4)]
+
+    def build_lines(self, direction):  # Cell indices of every line, starting at the side tiles move to
+        if direction in (engine.LEFT, engine.RIGHT):
+            lines = [[row * self.cols + col for col in range(self.cols)] for row in range(self.rows)]
+        else:
+            lines = [[row * self.cols + col for row in range(self.rows)] for col in range(self.cols)]
+        if direction in (engine.RIGHT, engine.DOWN):
+            for line in lines:
+                line.reverse()
+        return lines
+
+    @classmethod
+    def from_cells(cls, rows, cols, cells):  # Board holding (row, col, value) triples
+        board = cls(rows, cols)
+        for row, col, value in cells:
+            board.set(row * cols + col, value.bit_length() - 1)
+        return board
+
+    @classmethod
+    def from_packed(cls, packed):  # 4x4 board from an engine.py integer
+        board = cls(engine.ROWS, engine.COL)
+        for index in range(engine.CELLS):
+            exp = (packed >> (4 * index)) & 0xF
+            if exp:
+                board.set(index, exp)
+        return board
+
+    def __len__(self):  # Number of tiles
+        return len(self.cells) - self.empty
+
+    def get(self, row, col):  # Exponent at (row, col)
+        return self.cells[row * self.cols + col]
+
+    def tiles(self):  # (row, col, value) of every tile
+        return [(index // self.cols, index % self.cols, 1 << exp) for index, exp in enumerate(self.cells) if exp]
+
+    #change one cell and update the running totals
+    def set(self, index, exp):
+        cells = self.cells
+        old = cells[index]
+        if old == exp:
+            return
+
+        for other in self.neighbours[index]:
+            if old and cells[other] == old:
+                self.pairs -= 1
+            if exp and cells[other] == exp:
+                self.pairs += 1
+        cells[index] = exp
+        if self.packed is not None:
+            self.packed ^= (old ^ exp) << (4 * index)
+
+        if not old or not exp:  # A cell filled or emptied
+            row, col = divmod(index, self.cols)
+            self.row_bits[row] ^= 1 << col
+            delta = -1 if not old else 1
+            self.empty += delta
+            tree = self.tree
+            i = row + 1
+            while i < len(tree):
+                tree[i] += delta
+                i += i & -i
+
+        counts = self.counts
+        if exp >= len(counts):
+            counts.extend([0] * (exp + 1 - len(counts)))
+        counts[old] -= 1
+        counts[exp] += 1
+        if exp > self.max_exp:
+            self.max_exp = exp
+        while self.max_exp and not counts[self.max_exp]:
+            self.max_exp -= 1
+
+    def random_free(self, rng=None):  # A random empty cell, None if the board is full
+        rng = rng or self.rng
+        if not self.empty:
+            return None
+        if self.packed is not None:
+            cells = engine.empty_cells(self.packed)
+            return cells[rng.randrange(len(cells))]
+
+        k = rng.randrange(self.empty)  # Take the k-th empty cell in index order
+        tree = self.tree
+        row = 0
+        step = self.tree_top
+        while step:  # Down the tree to the row holding it
+            if row + step < len(tree) and tree[row + step] <= k:
+                row += step
+                k -= tree[row]
+            step >>= 1
+        bits = self.row_bits[row]
+        col = 0
+        while True:  # Then a byte at a time through the row
+            byte = bits & 0xFF
+            if k < POPCOUNT[byte]:
+                return row * self.cols + col + SELECT[byte][k]
+            k -= POPCOUNT[byte]
+            bits >>= 8
+            col += 8
+
+    #add a random 2 or 4 like end_move, returns (index, exponent) or None if the board is full
+    def spawn(self, rng=None):
+        rng = rng or self.rng
+        index = self.random_free(rng)
+        if index is None:
+            return None
+        exp = engine.SPAWN_EXPONENTS[rng.randrange(len(engine.SPAWN_EXPONENTS))]
+        self.set(index, exp)
+        return index, exp
+
+    #apply a move, returns (score gained, moved, paths) with paths as (from index, to index, merged)
+    def move(self, direction, with_paths=True):
+        if self.packed is not None:
+            return self.move_packed(direction, with_paths)
+
+        cells = self.cells
+        score = 0
+        paths = []
+        changes = []
+        for line in self.lines[direction]:
+            values = [cells[i] for i in line]
+            out, gained, line_paths = engine.slide_line(values, self.limit)
+            if out != values:
+                score += gained
+                changes.extend((i, exp) for i, exp, old in zip(line, out, values) if exp != old)
+            if with_paths:
+                paths.extend((line[src], line[dst], merged) for src, dst, merged in line_paths)
+        for index, exp in changes:
+            self.set(index, exp)
+        if changes:
+            self.score += score
+            self.moves += 1
+        return score, bool(changes), paths
+
+    def move_packed(self, direction, with_paths):  # 4x4 move through the engine tables
+        old = self.packed
+        new, score, moved = engine.move(old, direction)
+        paths = []
+        if with_paths:
+            paths = [(row * self.cols + col, new_row * self.cols + new_col, merged)
+                     for (row, col), (new_row, new_col), merged in engine.transitions(old, direction)]
+        if moved:
+            self.score += score
+            self.moves += 1
+            self.set_packed(new)
+        return score, moved, paths
+
+    def set_packed(self, packed):  # Change the cells of a 4x4 board to an engine.py board
+        diff = self.packed ^ packed
+        index = 0
+        while diff:
+            if diff & 0xF:
+                self.set(index, (packed >> (4 * index)) & 0xF)
+            diff >>= 4
+            index += 1
+
+    def has_merge(self):  # Whether two equal tiles touch, O(1)
+        return self.pairs > 0
+
+    def is_lost(self):  # Full board without any possible merge, O(1)
+        return not self.empty and not self.pairs
+
+    def has_won(self, exponent=engine.WIN_EXPONENT):  # Whether a tile reached 2 ** exponent, O(1)
+        return self.max_exp >= exponent
@@ -0,0 +1,271 @@
+import random
+
+# Headless 2048 rules for the 4x4 board (no pygame needed)
+#
+# The board is packed into one 64 bit integer, 4 bits per cell. Each cell holds
+# the exponent of the tile (0 = empty, 1 = 2, 2 = 4, ..., 11 = 2048). Cell
+# (row, col) lives at bit 4 * (row * COL + col), so one row is a 16 bit chunk
+# with column 0 in the lowest nibble.
+
+ROWS = 4  # Number of rows of the packed board
+COL = 4  # Number of columns of the packed board
+CELLS = ROWS * COL
+
+LEFT, RIGHT, UP, DOWN = 0, 1, 2, 3  # Move codes
+DIRECTIONS = {'left': LEFT, 'right': RIGHT, 'up': UP, 'down': DOWN}  # Names used by main.py
+DIRECTION_NAMES = ('left', 'right', 'up', 'down')
+
+WIN_EXPONENT = 11  # 2 ** 11 = 2048
+MAX_EXPONENT = 15  # Biggest exponent a nibble can hold
+SPAWN_EXPONENTS = (1, 2)  # Same odds as random.choice([2, 4]) in end_move
+
+ROW_MASK = 0xFFFF
+
+
+#slide one line of exponents towards index 0 and merge equal neighbours once,
+#tiles at limit do not merge (None for no limit)
+def slide_line(line, limit=MAX_EXPONENT):
+    out = []  # Exponents after the move
+    paths = []  # (source index, target index, merged) for every tile of the line
+    score = 0
+    can_merge = False  # Whether the last tile in out may still take a merge
+    for i, exp in enumerate(line):
+        if not exp:
+            continue
+        if can_merge and out[-1] == exp and (limit is None or exp < limit):
+            out[-1] += 1
+            score += 1 << out[-1]
+            paths.append((i, len(out) - 1, True))
+            can_merge = False
+        else:
+            out.append(exp)
+            paths.append((i, len(out) - 1, False))
+            can_merge = True
+    out.extend([0] * (len(line) - len(out)))
+    return out, score, paths
+
+
+def unpack_row(row):  # Split a 16 bit row into its 4 exponents
+    return [(row >> (4 * i)) & 0xF for i in range(COL)]
+
+
+def pack_row(line):  # Join 4 exponents into a 16 bit row
+    row = 0
+    for i, exp in enumerate(line):
+        row |= exp << (4 * i)
+    return row
+
+
+def reverse_row(row):  # Mirror a 16 bit row
+    return ((row >> 12) | ((row >> 4) & 0x00F0) | ((row << 4) & 0x0F00) | (row << 12)) & ROW_MASK
+
+
+def unpack_col(row):  # Spread a 16 bit row into a column of the packed board
+    return (row & 0xF) | (row & 0xF0) << 12 | (row & 0xF00) << 24 | (row & 0xF000) << 36
+
+
+def transpose(board):  # Swap rows and columns of the packed board
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+#precompute the result of every possible row for each move
+#
+#a row is its first cell plus the 3 cells after it (row >> 4), which is a smaller
+#number, so every row is built from rows already done instead of calling
+#slide_line 65536 times: an empty first cell changes nothing, otherwise the first
+#tile either merges with the next tile of the rest or stays in front of it
+def build_tables():
+    size = 1 << 16
+    compact = [0] * size  # The tiles of a row pushed together, without merging
+    row_left = [0] * size
+    score_left = [0] * size
+    for row in range(1, size):
+        first = row & 0xF
+        rest = row >> 4
+        if not first:
+            compact[row] = compact[rest]
+            row_left[row] = row_left[rest]
+            score_left[row] = score_left[rest]
+            continue
+        tiles = compact[rest]
+        compact[row] = first | tiles << 4
+        if tiles & 0xF == first and first < MAX_EXPONENT:
+            tail = tiles >> 4  # The rest without the tile that merged
+            row_left[row] = (first + 1) | row_left[tail] << 4
+            score_left[row] = (2 << first) + score_left[tail]
+        else:
+            row_left[row] = first | row_left[rest] << 4
+            score_left[row] = score_left[rest]
+
+    reverse = [reverse_row(row) for row in range(size)]
+    row_right = [0] * size
+    score_right = [0] * size
+    for row in range(size):
+        row_right[reverse[row]] = reverse[row_left[row]]
+        score_right[reverse[row]] = score_left[row]
+    col_up = [unpack_col(row) for row in row_left]
+    col_down = [unpack_col(row) for row in row_right]
+    has_pair = [False] * size
+    for row in range(16, size):
+        first = row & 0xF
+        has_pair[row] = has_pair[row >> 4] or (first != 0 and first == (row >> 4) & 0xF)
+    return row_left, row_right, col_up, col_down, score_left, score_right, has_pair
+
+
+ROW_LEFT, ROW_RIGHT, COL_UP, COL_DOWN, SCORE_LEFT, SCORE_RIGHT, ROW_HAS_PAIR = build_tables()
+
+# Columns of the empty cells of every row, the 16 possible tuples are shared
+EMPTY_COLS_OF = [tuple(col for col in range(COL) if not mask >> col & 1) for mask in range(1 << COL)]
+FILLED_PAIR = [bool(byte & 0xF) | bool(byte >> 4) << 1 for byte in range(256)]  # Filled-cell bits of two cells
+EMPTY_COLS = [EMPTY_COLS_OF[FILLED_PAIR[row & 0xFF] | FILLED_PAIR[row >> 8] << 2] for row in range(1 << 16)]
+
+
+#apply one move, returns (new board, score gained, whether anything moved)
+def move(board, direction):
+    if direction == LEFT:
+        r0, r1, r2, r3 = board & ROW_MASK, (board >> 16) & ROW_MASK, (board >> 32) & ROW_MASK, board >> 48
+        new = ROW_LEFT[r0] | ROW_LEFT[r1] << 16 | ROW_LEFT[r2] << 32 | ROW_LEFT[r3] << 48
+        score = SCORE_LEFT[r0] + SCORE_LEFT[r1] + SCORE_LEFT[r2] + SCORE_LEFT[r3]
+    elif direction == RIGHT:
+        r0, r1, r2, r3 = board & ROW_MASK, (board >> 16) & ROW_MASK, (board >> 32) & ROW_MASK, board >> 48
+        new = ROW_RIGHT[r0] | ROW_RIGHT[r1] << 16 | ROW_RIGHT[r2] << 32 | ROW_RIGHT[r3] << 48
+        score = SCORE_RIGHT[r0] + SCORE_RIGHT[r1] + SCORE_RIGHT[r2] + SCORE_RIGHT[r3]
+    elif direction == UP:
+        t = transpose(board)
+        c0, c1, c2, c3 = t & ROW_MASK, (t >> 16) & ROW_MASK, (t >> 32) & ROW_MASK, t >> 48
+        new = COL_UP[c0] | COL_UP[c1] << 4 | COL_UP[c2] << 8 | COL_UP[c3] << 12
+        score = SCORE_LEFT[c0] + SCORE_LEFT[c1] + SCORE_LEFT[c2] + SCORE_LEFT[c3]
+    elif direction == DOWN:
+        t = transpose(board)
+        c0, c1, c2, c3 = t & ROW_MASK, (t >> 16) & ROW_MASK, (t >> 32) & ROW_MASK, t >> 48
+        new = COL_DOWN[c0] | COL_DOWN[c1] << 4 | COL_DOWN[c2] << 8 | COL_DOWN[c3] << 12
+        score = SCORE_RIGHT[c0] + SCORE_RIGHT[c1] + SCORE_RIGHT[c2] + SCORE_RIGHT[c3]
+    else:
+        raise ValueError(f"unknown direction: {direction!r}")
+    return new, score, new != board
+
+
+#where every tile goes for a move, as ((row, col), (new row, new col), merged)
+def transitions(board, direction):
+    result = []
+    for line in range(ROWS if direction in (LEFT, RIGHT) else COL):
+        if direction in (LEFT, RIGHT):
+            cells = [(line, col) for col in range(COL)]
+        else:
+            cells = [(row, line) for row in range(ROWS)]
+        if direction in (RIGHT, DOWN):
+            cells.reverse()
+        _, _, paths = slide_line([get_exponent(board, row, col) for row, col in cells])
+        for src, dst, merged in paths:
+            result.append((cells[src], cells[dst], merged))
+    return result
+
+
+def get_exponent(board, row, col):  # Exponent stored at (row, col)
+    return (board >> (4 * (row * COL + col))) & 0xF
+
+
+def empty_mask(board):  # One bit (the lowest of the nibble) set for every empty cell
+    x = board | (board >> 2)
+    x |= x >> 1
+    return ~x & 0x1111111111111111
+
+
+def count_empty(board):  # Number of empty cells
+    return bin(empty_mask(board)).count('1')
+
+
+def empty_cells(board):  # Indices of the empty cells
+    return ([col for col in EMPTY_COLS[board & ROW_MASK]]
+            + [4 + col for col in EMPTY_COLS[(board >> 16) & ROW_MASK]]
+            + [8 + col for col in EMPTY_COLS[(board >> 32) & ROW_MASK]]
+            + [12 + col for col in EMPTY_COLS[board >> 48]])
+
+
+def has_merge(board):  # Whether two equal tiles touch, the game is lost when none do on a full board
+    t = transpose(board)
+    return (ROW_HAS_PAIR[board & ROW_MASK] or ROW_HAS_PAIR[(board >> 16) & ROW_MASK]
+            or ROW_HAS_PAIR[(board >> 32) & ROW_MASK] or ROW_HAS_PAIR[board >> 48]
+            or ROW_HAS_PAIR[t & ROW_MASK] or ROW_HAS_PAIR[(t >> 16) & ROW_MASK]
+            or ROW_HAS_PAIR[(t >> 32) & ROW_MASK] or ROW_HAS_PAIR[t >> 48])
+
+
+def is_lost(board):  # Full board without any possible merge
+    return not empty_mask(board) and not has_merge(board)
+
+
+def max_exponent(board):  # Exponent of the biggest tile
+    best = 0
+    while board:
+        exp = board & 0xF
+        if exp > best:
+            best = exp
+        board >>= 4
+    return best
+
+
+def has_won(board, exponent=WIN_EXPONENT):  # Whether a tile reached 2 ** exponent
+    return max_exponent(board) >= exponent
+
+
+#pick the cell and exponent of the next spawned tile, None if the board is full
+def spawn_cell(board, rng=random):
+    rows = (EMPTY_COLS[board & ROW_MASK], EMPTY_COLS[(board >> 16) & ROW_MASK],
+            EMPTY_COLS[(board >> 32) & ROW_MASK], EMPTY_COLS[board >> 48])
+    count = len(rows[0]) + len(rows[1]) + len(rows[2]) + len(rows[3])
+    if not count:
+        return None
+    k = rng.randrange(count)  # Same pick as empty_cells(board)[k]
+    for row, cols in enumerate(rows):
+        if k < len(cols):
+            index = row * COL + cols[k]
+            break
+        k -= len(cols)
+    return index, SPAWN_EXPONENTS[rng.randrange(len(SPAWN_EXPONENTS))]
+
+
+def spawn(board, rng=random):  # Add a random 2 or 4 to an empty cell
+    cell = spawn_cell(board, rng)
+    if cell is None:
+        return board
+    index, exp = cell
+    return board | exp << (4 * index)
+
+
+def new_board(rng=random):  # Starting board with two 2 tiles, like generate_tiles
+    board = 0
+    for _ in range(2):
+        cells = empty_cells(board)
+        board |= 1 << (4 * cells[rng.randrange(len(cells))])
+    return board
+
+
+#move and spawn like one turn of the game, returns (new board, score gained, moved)
+def step(board, direction, rng=random):
+    new, score, moved = move(board, direction)
+    if moved:
+        new = spawn(new, rng)
+    return new, score, moved
+
+
+def pack(cells):  # Build a board from (row, col, value) triples
+    board = 0
+    for row, col, value in cells:
+        board |= (value.bit_length() - 1) << (4 * (row * COL + col))
+    return board
+
+
+def unpack(board):  # List the (row, col, value) triples of the tiles on the board
+    cells = []
+    for i in range(CELLS):
+        exp = (board >> (4 * i)) & 0xF
+        if exp:
+            cells.append((i // COL, i % COL, 1 << exp))
+    return cells
@@ -0,0 +1,251 @@
+import os
+from multiprocessing import Pipe, Process, shared_memory
+
+import numpy as np
+
+import batch
+import engine
+
+# Gym style environments for training agents on the game's rules
+#
+#   envs = env.VectorEnv(256, seed=0)
+#   obs, info = envs.reset()
+#   obs, rewards, dones, info = envs.step(actions)   # info['action_mask'] is (K, 4)
+#
+# The rules are the ones of main.py: a move that changes the board spawns a 2 or
+# a 4 like end_move, a move that changes nothing leaves the board alone and
+# spawns nothing like move_tiles, and a game ends when it is lost or when
+# check_win sees a 2048. Finished games start over at once, so obs always holds
+# live games while score, max_tile and won describe the game that just ended.
+#
+# Every array returned lives in a buffer that the next step overwrites, copy it
+# to keep it. AsyncVectorEnv spreads the games over worker processes that write
+# those buffers straight into shared memory.
+
+OBS_TYPES = ('onehot', 'log2')
+PLANES = np.arange(engine.MAX_EXPONENT + 1, dtype=np.uint64)  # One-hot plane of every exponent, 0 is empty
+
+
+#(shape, dtype) of every buffer of an environment of num_envs games
+def buffer_specs(num_envs, obs='onehot', dtype=np.float32):
+    if obs not in OBS_TYPES:
+        raise ValueError(f"unknown observation type: {obs!r}")
+    obs_shape = (num_envs, engine.ROWS, engine.COL) + ((len(PLANES),) if obs == 'onehot' else ())
+    return {
+        'obs': (obs_shape, np.dtype(dtype)),
+        'rewards': ((num_envs,), np.dtype(np.float32)),  # Score gained by the step
+        'dones': ((num_envs,), np.dtype(bool)),
+        'action_mask': ((num_envs, 4), np.dtype(bool)),  # Moves that change the board
+        'score': ((num_envs,), np.dtype(np.int64)),  # Score of the game, the final one when done
+        'max_tile': ((num_envs,), np.dtype(np.int32)),
+        'won': ((num_envs,), np.dtype(bool)),
+        'actions': ((num_envs,), np.dtype(np.intp)),  # Written by AsyncVectorEnv.step_async
+    }
+
+
+def allocate(specs, buffer=None):  # Arrays for the specs, laid out one after another in buffer if given
+    arrays = {}
+    offset = 0
+    for name, (shape, dtype) in specs.items():
+        offset = -(-offset // 16) * 16
+        if buffer is None:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        offset += int(np.prod(shape)) * dtype.itemsize
+    return arrays, offset
+
+
+#k games stepped together in this process
+class VectorEnv:
+    def __init__(self, num_envs, seed=None, obs='onehot', dtype=np.float32,
+                 win_exponent=engine.WIN_EXPONENT, buffers=None):
+        self.num_envs = num_envs
+        self.obs_type = obs
+        self.win_exponent = win_exponent
+        self.rng = np.random.default_rng(seed)
+        if buffers is None:
+            buffers, _ = allocate(buffer_specs(num_envs, obs, dtype))
+        self.buffers = buffers
+        self.index = np.arange(num_envs)
+        self.boards = np.zeros(num_envs, dtype=np.uint64)
+        self.scores = np.zeros(num_envs, dtype=np.int64)
+        self.after = np.zeros((4, num_envs), dtype=np.uint64)  # Board after each move, for the masks and the step
+        self.after_score = np.zeros((4, num_envs), dtype=np.int64)
+
+    def __len__(self):
+        return self.num_envs
+
+    def reset(self):  # Start every game over, returns (obs, info)
+        self.boards[:] = batch.new_boards(self.num_envs, self.rng)
+        self.scores[:] = 0
+        out = self.buffers
+        out['rewards'][:] = 0
+        out['dones'][:] = False
+        out['won'][:] = False
+        self.update()
+        out['score'][:] = 0
+        out['max_tile'][:] = 1 << batch.max_exponent(self.boards).astype(np.int32)
+        return out['obs'], self.info()
+
+    #play one move per game, returns (obs, rewards, dones, info)
+    def step(self, actions):
+        out = self.buffers
+        actions = np.asarray(actions, dtype=np.intp)
+        moved = out['action_mask'][self.index, actions]
+        gained = self.after_score[actions, self.index]
+        self.boards[:] = batch.spawn(self.after[actions, self.index], self.rng, moved)
+        self.scores += gained
+        np.copyto(out['rewards'], gained)
+
+        exps = batch.max_exponent(self.boards)
+        won = exps >= self.win_exponent
+        self.update()
+        dones = won | ~out['action_mask'].any(axis=1)  # No move changes the board: lost
+        out['dones'][:] = dones
+        out['won'][:] = won
+        out['score'][:] = self.scores
+        out['max_tile'][:] = 1 << exps.astype(np.int32)
+
+        if dones.any():
+            finished = np.nonzero(dones)[0]
+            self.boards[finished] = batch.new_boards(len(finished), self.rng)
+            self.scores[finished] = 0
+            self.update(finished)
+        return out['obs'], out['rewards'], out['dones'], self.info()
+
+    #fill the observation, the moves and the action mask of the boards at index (all by default)
+    def update(self, index=None):
+        out = self.buffers
+        if index is None:
+            boards = self.boards
+            for direction in range(4):
+                self.after[direction], self.after_score[direction] = batch.move_all(boards, direction)
+            np.not_equal(self.after, boards, out=out['action_mask'].T)
+            exps = batch.cells(boards).reshape(out['obs'].shape[:3])
+            if self.obs_type == 'onehot':
+                np.equal(exps[..., None], PLANES, out=out['obs'], casting='unsafe')
+            else:
+                out['obs'][:] = exps
+            return
+
+        boards = self.boards[index]
+        for direction in range(4):
+            self.after[direction, index], self.after_score[direction, index] = batch.move_all(boards, direction)
+        out['action_mask'][index] = (self.after[:, index] != boards).T
+        exps = batch.cells(boards).reshape((len(boards),) + out['obs'].shape[1:3])
+        out['obs'][index] = exps[..., None] == PLANES if self.obs_type == 'onehot' else exps
+
+    def info(self):
+        out = self.buffers
+        return {'action_mask': out['action_mask'], 'score': out['score'], 'max_tile': out['max_tile'], 'won': out['won']}
+
+    def close(self):
+        pass
+
+
+def run_worker(conn, shm_name, num_envs, start, stop, seed, obs, dtype, win_exponent):  # One AsyncVectorEnv process
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        arrays, _ = allocate(buffer_specs(num_envs, obs, dtype), shm.buf)
+        env = VectorEnv(stop - start, seed, obs, dtype, win_exponent,
+                        buffers={name: array[start:stop] for name, array in arrays.items()})
+        actions = env.buffers['actions']
+        while True:
+            command = conn.recv()
+            if command == 'close':
+                break
+            try:
+                if command == 'reset':
+                    env.reset()
+                else:
+                    env.step(actions)
+                conn.send(None)
+            except Exception as error:  # Hand it to the learner instead of dying silently
+                conn.send(error)
+        del env, arrays, actions
+    finally:
+        shm.close()
+
+
+#the games of a VectorEnv split over worker processes, all writing into one shared buffer
+class AsyncVectorEnv:
+    def __init__(self, num_envs, workers=None, seed=None, obs='onehot', dtype=np.float32,
+                 win_exponent=engine.WIN_EXPONENT):
+        workers = max(1, min(workers or os.cpu_count() or 1, num_envs))
+        self.num_envs = num_envs
+        specs = buffer_specs(num_envs, obs, dtype)
+        _, size = allocate(specs)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        self.buffers, _ = allocate(specs, self.shm.buf)
+        self.waiting = False
+
+        bounds = np.linspace(0, num_envs, workers + 1).astype(int)
+        seeds = np.random.SeedSequence(seed).spawn(workers)
+        self.conns = []
+        self.processes = []
+        for (start, stop), worker_seed in zip(zip(bounds[:-1], bounds[1:]), seeds):
+            conn, child = Pipe()
+            process = Process(target=run_worker, daemon=True,
+                              args=(child, self.shm.name, num_envs, int(start), int(stop), worker_seed, obs, dtype, win_exponent))
+            process.start()
+            child.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+
+    def __len__(self):
+        return self.num_envs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def send(self, command):
+        for conn in self.conns:
+            conn.send(command)
+        self.waiting = True
+
+    def wait(self):
+        errors = [conn.recv() for conn in self.conns]
+        self.waiting = False
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def reset(self):
+        self.send('reset')
+        self.wait()
+        return self.buffers['obs'], self.info()
+
+    def step_async(self, actions):  # Start a step and return at once, the learner runs meanwhile
+        self.buffers['actions'][:] = actions
+        self.send('step')
+
+    def step_wait(self):  # Finish the step started by step_async
+        self.wait()
+        out = self.buffers
+        return out['obs'], out['rewards'], out['dones'], self.info()
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def info(self):
+        out = self.buffers
+        return {'action_mask': out['action_mask'], 'score': out['score'], 'max_tile': out['max_tile'], 'won': out['won']}
+
+    def close(self):
+        if self.shm is None:
+            return
+        if self.waiting:
+            self.wait()
+        for conn in self.conns:
+            conn.send('close')
+        for process in self.processes:
+            process.join()
+        self.buffers = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
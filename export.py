@@ -0,0 +1,375 @@
+import argparse
+import math
+import os
+import shutil
+import subprocess
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pygame
+
+import animation
+import engine
+import replay
+import view
+
+# Headless export of replays to animated GIFs, PNG frames or ffmpeg videos
+#
+#   python -m export games.r2048 clip.gif --game 3          # animated GIF
+#   python -m export games.r2048 frames/ --game 3           # one PNG per frame
+#   python -m export games.r2048 clip.mp4 --game 3          # piped to ffmpeg, if installed
+#
+# Frames are drawn by the game's own view.py (Tile, draw and move_tiles with
+# the same SeededRNG spawns) on a dummy SDL window, with an AnimationPlanner
+# whose clock is the frame time instead of the wall clock. The moves are split
+# into chunks and every worker of a process pool plays the game up to its chunk
+# without drawing, then draws only its own frames, reusing the tile sprites.
+#
+# GIF frames share one palette built from the tile sprites, so a worker can
+# encode its frames on its own: every frame after the first of a chunk only
+# keeps the rectangle that changed, unchanged pixels in it are transparent, and
+# repeated frames just lengthen the one before. The parent writes the header and
+# the encoded frames in order.
+
+FPS = 25  # Frames per second of the clip, GIF delays are in 1/100 s
+SCALE = 0.5  # Size of the clip relative to the window
+CHUNK_MOVES = 100  # Moves per task
+HOLD = 2.0  # Seconds the final board stays on screen
+TRANSPARENT = 255  # Palette index of unchanged pixels, the other 255 are colors
+WINDOW = None  # Hidden window of this process the frames are drawn on
+
+
+def open_window():  # The hidden window frames are drawn on, also the pool initializer
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_NO_SIGNAL_HANDLERS', '1')  # Let the pool stop its workers with SIGTERM
+    global WINDOW
+    if WINDOW is None:
+        pygame.display.init()
+        pygame.font.init()
+        WINDOW = pygame.display.set_mode((view.WIDTH, view.HEIGHT))
+    return WINDOW
+
+
+def frame_size(scale):
+    return max(1, round(view.WIDTH * scale)), max(1, round(view.HEIGHT * scale))
+
+
+def move_frames(fps):  # Frames drawn per move, the last one shows the settled board
+    return math.ceil((animation.SLIDE_TIME + animation.POP_TIME) * fps)
+
+
+def clip_frame(window, frame):  # Copy the window into the frame surface, scaled to its size
+    if frame.get_size() == window.get_size():
+        frame.blit(window, (0, 0))
+    else:
+        pygame.transform.smoothscale(window, frame.get_size(), frame)
+    return frame
+
+
+def packed_pixels(frame):  # (height, width) array of 0xRRGGBB colors of a frame surface
+    return pygame.surfarray.array2d(frame).T & 0xFFFFFF
+
+
+#frames of moves [start, stop) of a record, the starting board first for start 0
+#
+#every frame is the same surface at the clip size, use it before taking the next
+def render_frames(record, start, stop, fps=FPS, scale=SCALE):
+    if (record.rows, record.cols) != (view.ROWS, view.COL):
+        raise ValueError(f"the game is {record.rows}x{record.cols}, view.py draws {view.ROWS}x{view.COL} (set its ROWS and COL to match)")
+    window = open_window()
+    frame = pygame.Surface(frame_size(scale), 0, 32)  # 0xRRGGBB pixels
+    moves = replay.unpack_moves(record.moves, record.count)
+    board = replay.new_board(record.seed, record.rows, record.cols)
+    for direction in moves[:start]:  # Catch up without drawing
+        board.move(direction, with_paths=False)
+        board.spawn()
+    tiles = view.tiles_from_board(board)
+
+    now = [0.0]
+    planner = animation.AnimationPlanner(clock=lambda: now[0])
+    steps = move_frames(fps)
+    if start == 0:
+        view.draw(window, tiles, planner)
+        yield clip_frame(window, frame)
+    for direction in moves[start:stop]:
+        now[0] = 0.0
+        view.move_tiles(board, tiles, engine.DIRECTION_NAMES[direction], planner)
+        for step in range(1, steps + 1):
+            now[0] = step / fps
+            view.draw(window, tiles, planner)
+            yield clip_frame(window, frame)
+
+
+def sample_palette(max_exp, scale=SCALE):  # Up to 255 colors, the most common ones of every tile drawn
+    window = open_window()
+    frame = pygame.Surface(frame_size(scale), 0, 32)
+    tiles = {}
+    for exp in range(1, max_exp + 1):
+        row, col = divmod(exp - 1, view.COL)
+        tiles[exp - 1] = view.Tile(1 << exp, row, col)
+    view.draw(window, tiles)
+    sheets = [packed_pixels(clip_frame(window, frame))]
+    window.fill(view.BACKGROUND_COLOR)
+    for tile in tiles.values():
+        tile.draw(window, 0.5)  # Growing tiles blend into the background
+    sheets.append(packed_pixels(clip_frame(window, frame)))
+    colors, counts = np.unique(np.concatenate([sheet.ravel() for sheet in sheets]), return_counts=True)
+    return colors[np.argsort(-counts, kind='stable')[:TRANSPARENT]]
+
+
+def unpack_rgb(colors):  # 0xRRGGBB ints to an (N, 3) array
+    return np.stack([colors >> 16, (colors >> 8) & 0xFF, colors & 0xFF], axis=1)
+
+
+#maps 0xRRGGBB pixels to palette indices, nearest color for colors not in the palette
+class Quantizer:
+    def __init__(self, palette):
+        self.palette = unpack_rgb(palette).astype(np.int32)
+        self.lookup = np.full(1 << 24, TRANSPARENT, dtype=np.uint8)  # TRANSPARENT: not looked up yet
+        self.lookup[palette] = np.arange(len(palette), dtype=np.uint8)
+
+    def __call__(self, packed):
+        indices = self.lookup[packed]
+        unknown = indices == TRANSPARENT
+        if unknown.any():
+            colors = np.unique(packed[unknown])
+            distance = ((unpack_rgb(colors).astype(np.int32)[:, None, :] - self.palette[None, :, :]) ** 2).sum(axis=2)
+            self.lookup[colors] = distance.argmin(axis=1)
+            indices = self.lookup[packed]
+        return indices
+
+
+#GIF LZW code stream of palette indices
+#
+#frames are mostly long runs of one index (tile colors, unchanged pixels), so
+#the input is split into runs and a run follows the codes of byte, byte byte,
+#byte byte byte, ... that the table already has instead of one lookup per pixel
+def lzw(data, min_size=8):
+    clear = 1 << min_size
+    end = clear + 1
+    out = bytearray()
+    size = min_size + 1
+    limit = 1 << size  # The code that needs one bit more
+    acc = clear  # Bits not written yet, starting with a clear code
+    bits = size
+    table = {}
+    get = table.get
+    chains = {}  # byte -> codes of runs of 1, 2, 3, ... of it
+    next_code = end + 1
+
+    values = np.frombuffer(data, dtype=np.uint8)
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(values)) + 1])
+    lengths = np.diff(np.append(starts, len(values))).tolist()
+    values = values[starts].tolist()
+    prefix = values[0]
+    lengths[0] -= 1
+    for byte, length in zip(values, lengths):
+        while length:  # Extend the current match as far as the table goes
+            code = get(prefix << 8 | byte)
+            if code is None:
+                break
+            prefix = code
+            length -= 1
+        while length:  # Emit the match, add it plus this byte, start over at this byte
+            acc |= prefix << bits
+            bits += size
+            if bits >= 64:
+                out += (acc & 0xFFFFFFFFFFFFFFFF).to_bytes(8, 'little')
+                acc >>= 64
+                bits -= 64
+            if next_code < 4096:
+                table[prefix << 8 | byte] = next_code
+                if next_code == limit:
+                    size += 1
+                    limit <<= 1
+                next_code += 1
+            else:  # Table full, start over
+                acc |= clear << bits
+                bits += size
+                table = {}
+                get = table.get
+                chains = {}
+                next_code = end + 1
+                size = min_size + 1
+                limit = 1 << size
+            length -= 1
+
+            chain = chains.get(byte)
+            if chain is None:
+                chain = chains[byte] = [byte]
+            code = get(chain[-1] << 8 | byte)
+            while code is not None:
+                chain.append(code)
+                code = get(code << 8 | byte)
+            if length < len(chain):  # The run ends inside the known codes
+                prefix = chain[length]
+                length = 0
+            else:
+                prefix = chain[-1]
+                length -= len(chain) - 1
+    acc |= prefix << bits
+    bits += size
+    acc |= end << bits
+    bits += size
+    out += acc.to_bytes((bits + 7) // 8, 'little')
+    return bytes(out)
+
+
+def gif_image(indices, left=0, top=0):  # Image descriptor and data of a (height, width) index array
+    height, width = indices.shape
+    data = lzw(indices.tobytes())
+    blocks = b''.join(bytes([len(data[i:i + 255])]) + data[i:i + 255] for i in range(0, len(data), 255))
+    return (b',' + left.to_bytes(2, 'little') + top.to_bytes(2, 'little') + width.to_bytes(2, 'little')
+            + height.to_bytes(2, 'little') + b'\x00' + b'\x08' + blocks + b'\x00')
+
+
+def graphic_control(delay):  # Do not dispose, TRANSPARENT is transparent, delay in 1/100 s
+    return b'!\xf9\x04\x05' + min(delay, 0xFFFF).to_bytes(2, 'little') + bytes([TRANSPARENT]) + b'\x00'
+
+
+#encode frames against the previous one, returns [[delay, image], ...]
+#
+#only the rectangle around the changed pixels is quantized and encoded
+def gif_frames(frames, quantizer, delay):
+    encoded = []
+    previous = None
+    for frame in frames:
+        pixels = packed_pixels(frame)
+        if previous is None:
+            encoded.append([delay, gif_image(quantizer(pixels))])
+            previous = pixels
+            continue
+        changed = pixels != previous
+        rows = np.nonzero(changed.any(axis=1))[0]
+        if not len(rows):  # Same picture, show the last one longer
+            encoded[-1][0] += delay
+            continue
+        cols = np.nonzero(changed.any(axis=0))[0]
+        box = np.s_[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        crop = np.where(changed[box], quantizer(pixels[box]), TRANSPARENT).astype(np.uint8)
+        encoded.append([delay, gif_image(crop, int(cols[0]), int(rows[0]))])
+        previous = pixels
+    return encoded
+
+
+def gif_file(f, size, palette, chunks, hold):  # Write the GIF of the encoded chunks
+    table = np.zeros((256, 3), dtype=np.uint8)
+    table[:len(palette)] = unpack_rgb(palette)
+    f.write(b'GIF89a' + size[0].to_bytes(2, 'little') + size[1].to_bytes(2, 'little') + b'\xf7\x00\x00')
+    f.write(table.tobytes())
+    f.write(b'!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')  # Loop forever
+    last = None
+    for frames in chunks:
+        for frame in frames:
+            if last is not None:
+                f.write(graphic_control(last[0]) + last[1])
+            last = frame
+    if last is not None:
+        f.write(graphic_control(last[0] + hold) + last[1])
+    f.write(b';')
+
+
+def run_task(task):  # Render one chunk of moves to the output of the task
+    record, start, stop, fps, scale, output, target = task
+    frames = render_frames(record, start, stop, fps, scale)
+    if output == 'gif':
+        return gif_frames(frames, Quantizer(target), round(100 / fps))
+    if output == 'png':
+        first = 0 if start == 0 else 1 + start * move_frames(fps)  # Frames before this chunk
+        count = 0
+        for count, frame in enumerate(frames, 1):
+            pygame.image.save(frame, os.path.join(target, f"frame_{first + count - 1:06d}.png"))
+        return count
+    return [pygame.image.tobytes(frame, 'RGB') for frame in frames]  # Raw RGB for ffmpeg
+
+
+#render a replay record to path: .gif, a folder for PNG frames, or any video ffmpeg writes
+#
+#returns (frames, seconds of clip)
+def export(record, path, fps=FPS, scale=SCALE, workers=None, chunk_moves=CHUNK_MOVES, hold=HOLD):
+    if path.lower().endswith('.gif'):
+        output = 'gif'
+    elif path.endswith(os.sep) or os.path.isdir(path):
+        output = 'png'
+    elif shutil.which('ffmpeg'):
+        output = 'ffmpeg'
+    else:
+        raise RuntimeError(f"ffmpeg is not installed, cannot write {path}: use a .gif path or a folder for PNG frames")
+    # Raw frames travel back to the parent, so their chunks are smaller
+    chunk_moves = chunk_moves if output != 'ffmpeg' else max(1, chunk_moves // 10)
+    workers = workers or os.cpu_count() or 1
+    size = frame_size(scale)
+
+    target = None
+    if output == 'gif':
+        board = replay.new_board(record.seed, record.rows, record.cols)
+        for direction in replay.unpack_moves(record.moves, record.count):
+            board.move(direction, with_paths=False)
+            board.spawn()
+        target = sample_palette(max(board.max_exp, 11), scale)
+    elif output == 'png':
+        os.makedirs(path, exist_ok=True)
+        target = path
+    tasks = [(record, start, min(start + chunk_moves, record.count), fps, scale, output, target)
+             for start in range(0, max(record.count, 1), chunk_moves)]
+
+    pool = Pool(workers, initializer=open_window) if workers > 1 and len(tasks) > 1 else None
+    results = pool.imap(run_task, tasks) if pool else map(run_task, tasks)
+    frames = 1 + record.count * move_frames(fps)
+    try:
+        if output == 'gif':
+            with open(path, 'wb') as f:
+                gif_file(f, size, target, results, round(100 * hold))
+        elif output == 'png':
+            for _ in results:
+                pass
+        else:
+            command = ['ffmpeg', '-loglevel', 'error', '-y', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                       '-s', f"{size[0]}x{size[1]}", '-r', str(fps), '-i', '-', '-pix_fmt', 'yuv420p', path]
+            with subprocess.Popen(command, stdin=subprocess.PIPE) as ffmpeg:
+                last = None
+                for chunk in results:
+                    for last in chunk:
+                        ffmpeg.stdin.write(last)
+                for _ in range(round(hold * fps)):
+                    ffmpeg.stdin.write(last)
+                ffmpeg.stdin.close()
+            if ffmpeg.returncode:
+                raise RuntimeError(f"ffmpeg failed with exit code {ffmpeg.returncode}")
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return frames, frames / fps + hold
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render a .r2048 replay to a GIF, PNG frames or a video.')
+    parser.add_argument('replay', help='.r2048 file')
+    parser.add_argument('out', help='.gif file, folder (for PNG frames) or video file (needs ffmpeg)')
+    parser.add_argument('--game', type=int, default=0, help='index of the game in the file')
+    parser.add_argument('--fps', type=int, default=FPS)
+    parser.add_argument('--scale', type=float, default=SCALE, help='clip size relative to the window')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--hold', type=float, default=HOLD, help='seconds the final board is shown')
+    args = parser.parse_args(argv)
+
+    for index, record in enumerate(replay.read_records(args.replay)):
+        if index == args.game:
+            break
+    else:
+        parser.error(f"{args.replay} has no game {args.game}")
+    if not record.replayable:
+        parser.error(f"game {args.game} is a non-4x4 game of a version 1 file, its spawns cannot be replayed")
+    start = time.perf_counter()
+    frames, seconds = export(record, args.out, args.fps, args.scale, args.workers, hold=args.hold)
+    elapsed = time.perf_counter() - start
+    print(f"{record.count} moves, {frames} frames ({seconds:.1f}s of clip) in {elapsed:.1f}s, "
+          f"{seconds / elapsed:.1f}x real time, saved to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
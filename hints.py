@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from multiprocessing import Pipe, Process, RawValue
+
+# Move hints searched in a background process
+#
+# The game asks for a hint whenever the board is settled and keeps drawing at
+# full speed: the search runs in its own process (a thread would hold the GIL),
+# sends back the best move after every finished depth and stops as soon as the
+# game asks for another board or cancels. Finished results are cached per board,
+# so going back to a position (undo, redo) shows its hint at once.
+
+MAX_DEPTH = 8  # Deepest iteration, in moves
+CACHE_SIZE = 100000  # Boards whose hint is kept
+
+
+def run_worker(conn, current, max_depth):  # The search process
+    import ai
+    search = ai.Expectimax(max_depth=max_depth, time_budget=None)
+    while True:
+        request = conn.recv()
+        if request is None:
+            return
+        generation, board, start_depth = request
+        if current.value != generation:  # Already replaced by a newer request
+            continue
+        search.stop = lambda: current.value != generation
+        for depth in range(start_depth, max_depth + 1):
+            try:
+                move = search.search_root(board, depth)
+            except ai.SearchTimeout:
+                break
+            conn.send((board, depth, move))
+            if move is None:
+                break
+
+
+#best moves of the boards the game asked about, deepened in the background
+class HintEngine:
+    def __init__(self, max_depth=MAX_DEPTH, cache_size=CACHE_SIZE):
+        self.max_depth = max_depth
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # board -> (depth, move) of the deepest finished search
+        self.board = None  # Board being searched
+        self.generation = 0
+        self.current = None  # Shared generation, the worker stops when it changes
+        self.conn = None
+        self.process = None
+
+    def start(self):  # Start the worker, the first hint takes a moment while it builds its tables
+        if self.process is None:
+            self.current = RawValue('q', 0)
+            self.conn, child = Pipe()
+            self.process = Process(target=run_worker, args=(child, self.current, self.max_depth), daemon=True)
+            self.process.start()
+            child.close()
+
+    def request(self, board):  # Search board unless it is already being searched or fully known
+        if board == self.board:
+            return
+        self.start()
+        self.cancel()
+        depth, _ = self.cache.get(board, (0, None))
+        if depth >= self.max_depth:
+            return
+        self.board = board
+        self.conn.send((self.generation, board, depth + 1))
+
+    def cancel(self):  # Stop the running search at once
+        if self.process is None:
+            return
+        self.generation += 1
+        self.current.value = self.generation
+        self.board = None
+
+    def poll(self):  # Take in the results the worker sent so far
+        while self.conn is not None and self.conn.poll():
+            board, depth, move = self.conn.recv()
+            if depth > self.cache.get(board, (0, None))[0]:
+                self.cache[board] = (depth, move)
+                self.cache.move_to_end(board)
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+    def hint(self, board):  # (move, depth) of the best known hint for board, None if there is none yet
+        entry = self.result(board)
+        if entry is None or entry[1] is None:
+            return None
+        return entry[1], entry[0]
+
+    def result(self, board):  # (depth, move) of the deepest finished search of board, move None when none is left
+        self.poll()
+        return self.cache.get(board)
+
+    def pending(self, board):  # Whether the search of board may still send a better hint
+        depth, move = self.cache.get(board, (0, None))
+        return board == self.board and depth < self.max_depth and not (depth and move is None)
+
+    def close(self):
+        if self.process is None:
+            return
+        self.cancel()
+        self.conn.send(None)
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+        self.process = self.conn = None
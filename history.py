@@ -0,0 +1,144 @@
+import struct
+import sys
+from array import array
+
+import replay
+from board import Board
+
+# Undo, redo and saved games for seeded games
+#
+# With a SeededRNG a position is just the board, the score and the RNG counter,
+# the seed is the same for the whole game. History keeps those in flat arrays
+# (one 64 bit slot for a 4x4 board, one bytes object per position for other
+# sizes), so a move adds a few dozen bytes and undo/redo only move a cursor. It
+# is also the game's replay Recorder: its moves are the moves that lead to the
+# current position, so an undone branch never ends up in a replay.
+#
+# A saved game is a header and the arrays as they are in memory, so loading a
+# 10,000 move game is a handful of reads.
+
+MAGIC = b'H2048\x01'
+HEADER = struct.Struct('<QBBII')  # seed, rows, cols, positions, cursor
+
+
+def board_value(board):  # Immutable copy of the cells of a Board
+    if board.packed is not None:
+        return board.packed
+    return bytes(board.cells)
+
+
+def write_array(f, values):  # Arrays are saved little endian
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    values.tofile(f)
+
+
+def read_array(f, typecode, count):
+    values = array(typecode)
+    values.fromfile(f, count)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+#every position of a game with a cursor on the current one
+class History(replay.Recorder):
+    def __init__(self, seed, board):
+        super().__init__(seed, board)
+        self.boards = array('Q') if board.packed is not None else []  # Board value of every position
+        self.scores = array('Q')
+        self.counters = array('Q')  # SeededRNG counter of every position
+        self.directions = array('B')  # directions[i] leads from position i to position i + 1
+        self.cursor = -1  # Index of the current position
+        self.push()
+
+    def __len__(self):  # Number of positions, the undone ones included
+        return len(self.scores)
+
+    def push(self):  # Add the current position of the board, dropping the undone positions
+        keep = self.cursor + 1
+        if keep < len(self):
+            del self.boards[keep:]
+            del self.scores[keep:]
+            del self.counters[keep:]
+            del self.directions[keep - 1:]
+        board = self.board
+        self.boards.append(board_value(board))
+        self.scores.append(board.score)
+        self.counters.append(board.rng.counter)
+        self.cursor += 1
+
+    def add(self, direction):  # A move that changed the board, called after its spawn
+        self.push()
+        self.directions.append(direction)
+        self.moves.append(direction)
+
+    def can_undo(self):
+        return self.cursor > 0
+
+    def can_redo(self):
+        return self.cursor < len(self) - 1
+
+    def undo(self):  # Go back one move, returns whether there was one
+        if not self.can_undo():
+            return False
+        self.cursor -= 1
+        self.moves.pop()
+        self.restore()
+        return True
+
+    def redo(self):  # Play the undone move again, returns whether there was one
+        if not self.can_redo():
+            return False
+        self.moves.append(self.directions[self.cursor])
+        self.cursor += 1
+        self.restore()
+        return True
+
+    def restore(self):  # Put the board and its RNG back to the current position
+        board = self.board
+        value = self.boards[self.cursor]
+        if board.packed is not None:
+            board.set_packed(value)
+        else:
+            for index, (old, exp) in enumerate(zip(board.cells, value)):
+                if old != exp:
+                    board.set(index, exp)
+        board.score = self.scores[self.cursor]
+        board.moves = self.cursor
+        board.rng.setstate((self.seed, self.counters[self.cursor]))
+
+    def save_game(self, path):  # Write the whole history (Recorder.save still appends the replay)
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(self.seed, self.board.rows, self.board.cols, len(self), self.cursor))
+            if isinstance(self.boards, array):
+                write_array(f, self.boards)
+            else:
+                for value in self.boards:
+                    f.write(value)
+            write_array(f, self.scores)
+            write_array(f, self.counters)
+            write_array(f, self.directions)
+
+    #read a saved history, its board is at the saved position
+    @classmethod
+    def load_game(cls, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a saved game")
+            seed, rows, cols, count, cursor = HEADER.unpack(f.read(HEADER.size))
+            history = cls(seed, Board(rows, cols, replay.SeededRNG(seed)))
+            if isinstance(history.boards, array):
+                history.boards = read_array(f, 'Q', count)
+            else:
+                size = rows * cols
+                history.boards = [f.read(size) for _ in range(count)]
+            history.scores = read_array(f, 'Q', count)
+            history.counters = read_array(f, 'Q', count)
+            history.directions = read_array(f, 'B', count - 1)
+        history.cursor = cursor
+        history.moves = history.directions[:cursor].tolist()
+        history.restore()
+        return history
@@ -1,510 +1,218 @@
+import time
+START = time.perf_counter()  # Start of the --startup-profile timings, taken before the other imports
+
 import pygame
 import random
-import math
-
-pygame.init()  # Initialize Pygame
-
-FPS = 60  # Frames per second
-
-WIDTH, HEIGHT = 800, 800  # Width and height of the game window
-ROWS = 4  # Number of rows in the grid
-COL = 4  # Number of columns in the grid
-
-RECT_HEIGHT = HEIGHT // ROWS  # Height of each rectangle
-RECT_WIDTH = WIDTH // COL  # Width of each rectangle
-
-OUTLINE_COLOR = (187, 173, 160)  # Color of the outline of the rectangles
-OUTLINE_THICKNESS = 10  # Thickness of the outline of the rectangles
-BACKGROUND_COLOR = (205, 192, 180)  # Background color of the window
-FONT_COLOR = (119, 110, 101)  # Color of the font
-
-FONT = pygame.font.SysFont('comicsans', 60, bold=True)  # Font of the numbers
-MOVE_VEL = 50  # Velocity of the movement of the numbers
-
-WINDOW = pygame.display.set_mode((WIDTH, HEIGHT))  # Create the game window
-pygame.display.set_caption('2048')  # Set the title of the window
-
-# Load sound effects
-WIN_SOUND = pygame.mixer.Sound('win.mp3')
-LOSE_SOUND = pygame.mixer.Sound('lose.mp3')
-
-# Make the tiles for the game
-class Tile:
-    COLORS = [
-        (237, 229, 218),
-        (238, 225, 201),
-        (243, 178, 122),
-        (246, 150, 101),
-        (247, 124, 95),
-        (247, 95, 59),
-        (237, 208, 115),
-        (237, 204, 99),
-        (236, 202, 80),
-        (237, 200, 80),
-        (237, 197, 63),
-        (237, 194, 46),
-    ]
-
-    def __init__(self, value, row, col):    
-        self.value = value  # Value of the tile
-        self.row = row  # Row of the tile
-        self.col = col  # Column of the tile
-        self.x = col * RECT_WIDTH   # X position of the tile
-        self.y = row * RECT_HEIGHT  # Y position of the tile
-        
-
-    def get_color(self):    # Get the color of the tile based on the value
-        color_index = int(math.log2(self.value)) - 1    # Calculate the index of the color based on the value
-        return self.COLORS[color_index]   # Return the color based on the index
-    
-    def draw(self, window): # Draw the tile
-        color = self.get_color() # Get the color of the tile
-        pygame.draw.rect(window, color, (self.x, self.y, RECT_WIDTH, RECT_HEIGHT))  # Draw the tile
-
-        text = FONT.render(str(self.value), 1, FONT_COLOR) # Render the text of the value
-        window.blit(text, (self.x + RECT_WIDTH // 2 - text.get_width() // 2, self.y + RECT_HEIGHT // 2 - text.get_height() // 2)) # Draw the text
-
-    def set_pos(self, ceil= False): # Set the position of the tile
-        if ceil:   # If ceil is True, round up the position
-            self.row = math.ceil(self.y / RECT_HEIGHT)
-            self.col = math.ceil(self.x / RECT_WIDTH) 
-        else:  # Otherwise, round down the position
-            self.row = math.floor(self.y / RECT_HEIGHT)
-            self.col = math.floor(self.x / RECT_WIDTH)
-        
-
-    def move(self,delta): # Move the tile
-        self.x += delta[0] # Move the tile in the x direction
-        self.y += delta[1] # Move the tile in the y direction
-
-def draw_grid(window): # Draw the grid of the window
-    for row in range(1, ROWS): # Loop through the rows
-        y = row * RECT_HEIGHT   # Calculate the y position of the horizontal lines
-        pygame.draw.line(window, OUTLINE_COLOR, (0, y), (WIDTH, y), OUTLINE_THICKNESS)  # Draw the horizontal lines
-
-    for col in range(1, COL): # Loop through the columns
-        x = col * RECT_WIDTH    # Calculate the x position of the vertical lines
-        pygame.draw.line(window, OUTLINE_COLOR, (x, 0), (x, HEIGHT), OUTLINE_THICKNESS) # Draw the vertical lines
-
-    pygame.draw.rect(window, OUTLINE_COLOR, (0, 0, WIDTH, HEIGHT), OUTLINE_THICKNESS) # Draw the outline of the window
-
-def draw(window, tiles): # Draw the window
-    window.fill(BACKGROUND_COLOR) # Fill the window with the background color
-
-    for tile in tiles.values(): # Loop through the tiles
-        tile.draw(window)
-
-    draw_grid(window) # Draw the grid
-    pygame.display.update() # Update the window
-
-def draw_pause_menu(window):
-    window.fill(BACKGROUND_COLOR)  # Fill the window with the background color
-
-    title_font = pygame.font.SysFont('comicsans', 100, bold=True)  # Font for the title
-    button_font = pygame.font.SysFont('comicsans', 60)  # Font for the buttons
-
-    title_text = title_font.render("Paused", 1, FONT_COLOR)  # Render the title text
-    resume_text = button_font.render("RESUME", 1, FONT_COLOR)  # Render the resume button text
-    restart_text = button_font.render("RESTART", 1, FONT_COLOR)  # Render the restart button text
-    main_menu_text = button_font.render("MAIN MENU", 1, FONT_COLOR)  # Render the main menu button text
-
-    title_y = HEIGHT // 4  # Y position of the title
-    button_y = HEIGHT // 2 - 50  # Y position of the first button
-
-    resume_button = pygame.Rect(WIDTH // 2 - 150, button_y, 300, 60)  # Create the resume button
-    restart_button = pygame.Rect(WIDTH // 2 - 150, button_y + 100, 300, 60)  # Create the restart button
-    main_menu_button = pygame.Rect(WIDTH // 2 - 150, button_y + 200, 300, 60)  # Create the main menu button
-
-    mouse_pos = pygame.mouse.get_pos()  # Get the mouse position
-
-    if resume_button.collidepoint(mouse_pos):  # If the mouse is over the resume button
-        pygame.draw.rect(window, (150, 150, 150), resume_button)  # Highlight the resume button
-    else:
-        pygame.draw.rect(window, OUTLINE_COLOR, resume_button)  # Draw the resume button
-
-    if restart_button.collidepoint(mouse_pos):  # If the mouse is over the restart button
-        pygame.draw.rect(window, (150, 150, 150), restart_button)  # Highlight the restart button
-    else:
-        pygame.draw.rect(window, OUTLINE_COLOR, restart_button)  # Draw the restart button
-
-    if main_menu_button.collidepoint(mouse_pos):  # If the mouse is over the main menu button
-        pygame.draw.rect(window, (150, 150, 150), main_menu_button)  # Highlight the main menu button
-    else:
-        pygame.draw.rect(window, OUTLINE_COLOR, main_menu_button)  # Draw the main menu button
-
-    window.blit(title_text, (WIDTH // 2 - title_text.get_width() // 2, title_y))  # Draw the title text
-    window.blit(resume_text, (resume_button.x + resume_button.width // 2 - resume_text.get_width() // 2, resume_button.y + resume_button.height // 2 - resume_text.get_height() // 2))  # Draw the resume button text
-    window.blit(restart_text, (restart_button.x + restart_button.width // 2 - restart_text.get_width() // 2, restart_button.y + restart_button.height // 2 - restart_text.get_height() // 2))  # Draw the restart button text
-    window.blit(main_menu_text, (main_menu_button.x + main_menu_button.width // 2 - main_menu_text.get_width() // 2, main_menu_button.y + main_menu_button.height // 2 - main_menu_text.get_height() // 2))  # Draw the main menu button text
-
-    pygame.display.update()  # Update the window
-
-def draw_game_over(window, background):
-    window.blit(background, (0, 0))  # Use the captured background image
-
-    title_font = pygame.font.SysFont('comicsans', 100, bold=True)  # Font for the title
-    button_font = pygame.font.SysFont('comicsans', 60)  # Font for the buttons
-
-    title_text = title_font.render("Game Over", 1, FONT_COLOR)  # Render the title text
-    title_outline = title_font.render("Game Over", 1, (0, 0, 0))  # Render the title outline
-    restart_text = button_font.render("RESTART", 1, FONT_COLOR)  # Render the restart button text
-    main_menu_text = button_font.render("MAIN MENU", 1, FONT_COLOR)  # Render the main menu button text
-
-    title_y = HEIGHT // 4  # Y position of the title
-    button_y = HEIGHT // 2 - 50  # Y position of the first button
-
-    restart_button = pygame.Rect(WIDTH // 2 - 150, button_y, 300, 60)  # Create the restart button
-    main_menu_button = pygame.Rect(WIDTH // 2 - 150, button_y + 100, 300, 60)  # Create the main menu button
-
-    mouse_pos = pygame.mouse.get_pos()  # Get the mouse position
-
-    if restart_button.collidepoint(mouse_pos):  # If the mouse is over the restart button
-        pygame.draw.rect(window, (150, 150, 150), restart_button)  # Highlight the restart button
-    else:
-        pygame.draw.rect(window, OUTLINE_COLOR, restart_button)  # Draw the restart button
-
-    if main_menu_button.collidepoint(mouse_pos):  # If the mouse is over the main menu button
-        pygame.draw.rect(window, (150, 150, 150), main_menu_button)  # Highlight the main menu button
-    else:
-        pygame.draw.rect(window, OUTLINE_COLOR, main_menu_button)  # Draw the main menu button
-
-    # Draw the outline first
-    window.blit(title_outline, (WIDTH // 2 - title_outline.get_width() // 2 - 2, title_y - 2))
-    window.blit(title_outline, (WIDTH // 2 - title_outline.get_width() // 2 + 2, title_y - 2))
-    window.blit(title_outline, (WIDTH // 2 - title_outline.get_width() // 2 - 2, title_y + 2))
-    window.blit(title_outline, (WIDTH // 2 - title_outline.get_width() // 2 + 2, title_y + 2))
-
-    # Draw the title text
-    window.blit(title_text, (WIDTH // 2 - title_text.get_width() // 2, title_y))
-    window.blit(restart_text, (restart_button.x + restart_button.width // 2 - restart_text.get_width() // 2, restart_button.y + restart_button.height // 2 - restart_text.get_height() // 2))
-    window.blit(main_menu_text, (main_menu_button.x + main_menu_button.width // 2 - main_menu_text.get_width() // 2, main_menu_button.y + main_menu_button.height // 2 - main_menu_text.get_height() // 2))
-
-    pygame.display.update()  # Update the window
+import engine
+import menus
+import animation
+from board import Board
+import replay
+import history
+import hints
+import view
+import sounds
+import argparse
+import os
+from collections import deque
+
+STARTUP = [('imports', time.perf_counter())]  # (step, time it finished) for --startup-profile
+
+HINT_POLL = 100  # Milliseconds between checks for a better hint while the game waits for input
+
+HINTS = hints.HintEngine()  # Searches hints in a background process, started on the first 'H' (or 'P')
+AI = None  # Autoplay player of --weights or --workers, made on the first 'P' since its tables take a while to build
+AI_SEARCH = None  # (board, future) of the --workers search running on AI_THREAD
+AI_THREAD = None  # Thread the --workers search waits for its pool on, so the frames go on
+AUTOPLAY_BUDGET = 0.05  # Seconds autoplay lets the expectimax search deepen before it plays the best move found
+AUTOPLAY_DEPTH = 6  # Depth at which autoplay plays without waiting for the budget
+AI_WEIGHTS = None  # N-tuple checkpoint autoplay plays instead of the expectimax search, set with --weights
+AI_WORKERS = None  # Processes the autoplay search is split across, set with --workers
+MIN_WORKERS = 2  # Fewer processes than this search slower than ai.Expectimax alone
+STRATEGY = None  # solver.py table of optimal moves autoplay plays on its board size, loaded with --strategy
+REPLAY_FILE = None  # .r2048 file every finished game is appended to, set with --record
+SAVE_FILE = 'game.h2048'  # Where F5 saves the game and its history and F9 loads it, set with --save
+SERVER_ADDRESS = None  # "host:port" or Unix socket of a game server, set with --connect
+CONNECTION = None  # Open connection to that server
+TRACE_FILE = 'trace.json'  # Where F4 and --trace save the frame timings (.json or .csv)
+
+WINDOW = None  # The game window, opened by get_window()
+SOUNDS = sounds.SoundLoader({'win': 'win.mp3', 'lose': 'lose.mp3'})  # Sound effects, decoded in the background
+
+#open the window on first use and start loading the sounds behind it
+def get_window():
+    global WINDOW
+    if WINDOW is None:
+        pygame.display.init()  # Only what the first frame needs, the audio starts on the loader thread
+        pygame.font.init()
+        WINDOW = pygame.display.set_mode((view.WIDTH, view.HEIGHT))  # Create the game window
+        pygame.display.set_caption('2048')  # Set the title of the window
+        SOUNDS.start()
+    return WINDOW
+
+#events of the next frame: at FPS while something moves, otherwise sleep until an event
+#comes (or timeout milliseconds pass)
+def next_events(clock, idle, timeout=None):
+    if not idle:
+        clock.tick(view.FPS) # Control the FPS
+        return pygame.event.get()
+    event = pygame.event.wait(timeout) if timeout else pygame.event.wait()
+    if event.type == pygame.NOEVENT: # Timed out
+        return []
+    return [event] + pygame.event.get()
+
+PAUSE_MENU = menus.Menu("Paused", [("RESUME", "resume"), ("RESTART", "restart"), ("MAIN MENU", "main_menu")],
+                        300, -50, view.FONT_COLOR, view.OUTLINE_COLOR, background_color=view.BACKGROUND_COLOR)
+GAME_OVER_MENU = menus.Menu("Game Over", [("RESTART", "restart"), ("MAIN MENU", "main_menu")],
+                            300, -50, view.FONT_COLOR, view.OUTLINE_COLOR, title_outline=(0, 0, 0))
+WIN_MENU = menus.Menu("YOU WIN!", [("RESTART", "restart"), ("MAIN MENU", "main_menu")],
+                      300, -50, view.FONT_COLOR, view.OUTLINE_COLOR)
+MAIN_MENU = menus.Menu("2048", [("PLAY", "play"), ("QUIT", "quit")],
+                       200, 0, view.FONT_COLOR, view.OUTLINE_COLOR, background_color=view.BACKGROUND_COLOR)
 
 def game_over_menu(window, background):
-    run = True
-    LOSE_SOUND.play()  # Play lose sound
-    while run:
-        draw_game_over(window, background)
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                pygame.quit()
-                return "quit"
-            
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = pygame.mouse.get_pos()
-                
-                restart_button = pygame.Rect(WIDTH // 2 - 150, HEIGHT // 2 - 50, 300, 60)
-                main_menu_button = pygame.Rect(WIDTH // 2 - 150, HEIGHT // 2 + 50, 300, 60)
-                
-                if restart_button.collidepoint(mouse_pos):
-                    return "restart"
-                if main_menu_button.collidepoint(mouse_pos):
-                    return "main_menu"
-
-def get_random_pos(tiles): # Get a random position for the tile
-    row = None
-    col = None
-    while True:
-        row = random.randrange(0, ROWS)
-        col = random.randrange(0, COL)
-
-        if f"{row}{col}" not in tiles:
-            break
-    
-    return row, col
-
-#check if a merge is possible
-def merge_check(tile, next_tile, delta):
-    if delta[0] != 0:  # Horizontal movement
-        return abs(tile.x - next_tile.x) <= MOVE_VEL
-    else:  # Vertical movement
-        return abs(tile.y - next_tile.y) <= MOVE_VEL
-
-#animate the merging move
-def animate_merge(window, tile, next_tile, delta, clock, tiles):
-    merge_delta = (delta[0] * 1.5, delta[1] * 1.5)  # Increase the speed of the merge animation
-    while not merge_check(tile, next_tile, merge_delta):
-        tile.move(merge_delta)
-        tile.set_pos()
-        draw(window, tiles)
-        clock.tick(FPS)
-    draw(window, tiles)  # Ensure final position is drawn
-
-def move_tiles(window, tiles, clock, direction): # Move the tiles
-    updated = True
-    blocks = set() # Set of the tiles that have been merged
-    moved = False
-
-    if direction == 'left': # If the direction is left
-        sort_func = lambda x: x.col # Sort the tiles based on the column
-        reverse = False # Reverse the sorting
-        delta = (-MOVE_VEL, 0) # Set the delta of the movement
-        boundary_check = lambda tile: tile.col == 0 # Check if the tile is at the boundary
-        get_next_tile = lambda tile: tiles.get(f"{tile.row}{tile.col - 1}") # Get the next tile
-        move_check = lambda tile, next_tile: tile.x > next_tile.x + RECT_WIDTH + MOVE_VEL # Check if the tiles can move
-        ceil = True
-
-    elif direction == 'right':
-        sort_func = lambda x: x.col
-        reverse = True
-        delta = (MOVE_VEL, 0)
-        boundary_check = lambda tile: tile.col == COL - 1
-        get_next_tile = lambda tile: tiles.get(f"{tile.row}{tile.col + 1}")
-        move_check = lambda tile, next_tile: tile.x < next_tile.x - RECT_WIDTH - MOVE_VEL
-        ceil = False
-
-    elif direction == 'up':
-        sort_func = lambda x: x.row
-        reverse = False
-        delta = (0, -MOVE_VEL)
-        boundary_check = lambda tile: tile.row == 0
-        get_next_tile = lambda tile: tiles.get(f"{tile.row - 1}{tile.col}")
-        move_check = lambda tile, next_tile: tile.y > next_tile.y + RECT_HEIGHT + MOVE_VEL
-        ceil = True
-        
-    elif direction == 'down':
-        sort_func = lambda x: x.row
-        reverse = True
-        delta = (0, MOVE_VEL)
-        boundary_check = lambda tile: tile.row == ROWS - 1
-        get_next_tile = lambda tile: tiles.get(f"{tile.row + 1}{tile.col}")
-        move_check = lambda tile, next_tile: tile.y < next_tile.y - RECT_HEIGHT - MOVE_VEL 
-        ceil = False
-    
-    while updated:
-        clock.tick(FPS)
-        updated = False
-        sorted_tiles = sorted(tiles.values(), key=sort_func, reverse=reverse)
-
-        for i, tile in enumerate(sorted_tiles): 
-
-            if boundary_check(tile):
-                continue
-
-            next_tile = get_next_tile(tile)
-
-            if not next_tile:
-                tile.move(delta)
-                moved = True
-            elif (tile.value == next_tile.value and tile not in blocks and next_tile not in blocks):
-
-                if merge_check(tile, next_tile, delta):
-                    tile.move(delta)
-                    moved = True
-                else:
-                    # Animate the merging move
-                    animate_merge(window, tile, next_tile, delta, clock, tiles)
-                    next_tile.value *= 2
-                    sorted_tiles.pop(i)
-                    blocks.add(tile)
-                    blocks.add(next_tile)
-                    moved = True
-                    
-            elif move_check(tile, next_tile):
-                tile.move(delta)
-                moved = True
-            else:
-                continue
-        
-            tile.set_pos(ceil)
-            updated = True
-        update_tiles(window, tiles, sorted_tiles)
-    
-    if moved:
-        return end_move(tiles)
-    if len(tiles) == ROWS * COL and not can_move_or_merge(tiles):
-        return "lost"
-    return "continue"
-
-#for checking if any tiles can be merged when the board is full   
-def can_move_or_merge(tiles):
-    for tile in tiles.values():
-        # Check if any adjacent tiles can be merged
-        for delta in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            neighbor_row = tile.row + delta[0]
-            neighbor_col = tile.col + delta[1]
-            neighbor_key = f"{neighbor_row}{neighbor_col}"
-            if neighbor_key in tiles and tiles[neighbor_key].value == tile.value:
-                return True
-    return False
-
-#return the result of the move
-def end_move(tiles):
-    if len(tiles) == ROWS * COL and not can_move_or_merge(tiles):
-        return "lost"
-
-    row, col = get_random_pos(tiles)
-    tiles[f"{row}{col}"] = Tile(random.choice([2, 4]), row, col)
-    return "continue"
+    SOUNDS.play('lose')  # Play lose sound
+    result = GAME_OVER_MENU.run(window, background)
+    view.RENDER.invalidate() # The menu covered the board
+    if result == "quit":
+        pygame.quit()
+    return result
 
-#draw the tiles after the move
-def update_tiles(window, tiles, sorted_tiles):
-    tiles.clear()
-    for tile in sorted_tiles:
-        tiles[f"{tile.row}{tile.col}"] = tile
-    
-    draw(window, tiles)
+def get_random_pos(board): # Get a random position for the tile
+    return divmod(board.random_free(), view.COL)
 
 #generate the tiles at the start of the game
-def generate_tiles():
+def generate_tiles(board):
     tiles = {}
     for _ in range(2):
-        row, col = get_random_pos(tiles)
-        tiles[f"{row}{col}"] = Tile(2, row, col)
+        row, col = get_random_pos(board)
+        board.set(row * view.COL + col, 1)
+        tiles[row * view.COL + col] = view.Tile(2, row, col)
 
     return tiles
 
-#make the main menu for the game
-def draw_main_menu(window):
-    window.fill(BACKGROUND_COLOR)
-    
-    title_font = pygame.font.SysFont('comicsans', 100, bold=True)
-    button_font = pygame.font.SysFont('comicsans', 60)
-    
-    title_text = title_font.render("2048", 1, FONT_COLOR)
-    play_text = button_font.render("PLAY", 1, FONT_COLOR)
-    quit_text = button_font.render("QUIT", 1, FONT_COLOR)
-
-    play_button = pygame.Rect(WIDTH // 2 - 100, HEIGHT // 2, 200, 60)
-    quit_button = pygame.Rect(WIDTH // 2 - 100, HEIGHT // 2 + 100, 200, 60)
-
-    mouse_pos = pygame.mouse.get_pos()
-
-    if play_button.collidepoint(mouse_pos):
-        pygame.draw.rect(window, (150, 150, 150), play_button)
-    else:
-        pygame.draw.rect(window, OUTLINE_COLOR, play_button)
-    
-    if quit_button.collidepoint(mouse_pos):
-        pygame.draw.rect(window, (150, 150, 150), quit_button)
-    else:
-        pygame.draw.rect(window, OUTLINE_COLOR, quit_button)
-    
-    window.blit(title_text, (WIDTH // 2 - title_text.get_width() // 2, HEIGHT // 4))
-    window.blit(play_text, (play_button.x + play_button.width // 2 - play_text.get_width() // 2, play_button.y + play_button.height // 2 - play_text.get_height() // 2))
-    window.blit(quit_text, (quit_button.x + quit_button.width // 2 - quit_text.get_width() // 2, quit_button.y + quit_button.height // 2 - quit_text.get_height() // 2))
-
-    pygame.display.update()
-
-#draw the win screen
-def draw_win_screen(window, background):
-    window.blit(background, (0, 0))  # Use the captured background image
-    
-    title_font = pygame.font.SysFont('comicsans', 100, bold=True)
-    button_font = pygame.font.SysFont('comicsans', 60)
-    
-    title_text = title_font.render("YOU WIN!", 1, FONT_COLOR)
-    restart_text = button_font.render("RESTART", 1, FONT_COLOR)
-    main_menu_text = button_font.render("MAIN MENU", 1, FONT_COLOR)
-
-    title_y = HEIGHT // 4
-    button_y = HEIGHT // 2 - 50
-
-    restart_button = pygame.Rect(WIDTH // 2 - 150, button_y, 300, 60)
-    main_menu_button = pygame.Rect(WIDTH // 2 - 150, button_y + 100, 300, 60)
-    
-    mouse_pos = pygame.mouse.get_pos()
-    
-    if restart_button.collidepoint(mouse_pos):
-        pygame.draw.rect(window, (150, 150, 150), restart_button)
-    else:
-        pygame.draw.rect(window, OUTLINE_COLOR, restart_button)
-    
-    if main_menu_button.collidepoint(mouse_pos):
-        pygame.draw.rect(window, (150, 150, 150), main_menu_button)
-    else:
-        pygame.draw.rect(window, OUTLINE_COLOR, main_menu_button)
-    
-    window.blit(title_text, (WIDTH // 2 - title_text.get_width() // 2, title_y))
-    window.blit(restart_text, (restart_button.x + restart_button.width // 2 - restart_text.get_width() // 2, restart_button.y + restart_button.height // 2 - restart_text.get_height() // 2))
-    window.blit(main_menu_text, (main_menu_button.x + main_menu_button.width // 2 - main_menu_text.get_width() // 2, main_menu_button.y + main_menu_button.height // 2 - main_menu_text.get_height() // 2))
-    
-    pygame.display.update()
+#save the moves of a game when recording is on
+def save_replay(recorder):
+    if REPLAY_FILE and recorder is not None:
+        recorder.save(REPLAY_FILE)
+
+#start a new seeded game, dropping the animation and the queued moves of the old one
+def new_game(planner, moves, recorder=None):
+    save_replay(recorder)
+    planner.finish()
+    moves.clear()
+    seed = random.getrandbits(64) # The seed and the moves are enough to replay the game
+    if SERVER_ADDRESS:
+        board = remote_board(seed)
+        return board, view.tiles_from_board(board), replay.Recorder(seed, board)
+    board = Board(view.ROWS, view.COL, replay.SeededRNG(seed))
+    tiles = generate_tiles(board)
+    return board, tiles, history.History(seed, board)
+
+#go back (or forward again) one move, returns whether the board changed
+def undo_move(recorder, planner, moves, redo=False):
+    if not isinstance(recorder, history.History): # Server games have no history
+        return False
+    planner.finish()
+    moves.clear()
+    return recorder.redo() if redo else recorder.undo()
+
+#resume the game saved with F5, None if there is none for this grid
+def resume_game(planner, moves, recorder):
+    if not os.path.exists(SAVE_FILE) or SERVER_ADDRESS:
+        return None
+    saved = history.History.load_game(SAVE_FILE)
+    if (saved.board.rows, saved.board.cols) != (view.ROWS, view.COL):
+        return None
+    save_replay(recorder)
+    planner.finish()
+    moves.clear()
+    return saved.board, view.tiles_from_board(saved.board), saved
+
+#new game on the server given with --connect, the server keeps the rules and the spawns
+def remote_board(seed):
+    global CONNECTION
+    import server
+    if CONNECTION is None:
+        CONNECTION = server.Connection(SERVER_ADDRESS)
+    return server.RemoteBoard(CONNECTION, seed)
 
 #draw the game over screen
 def win_menu(window, background):
-    run = True
-    WIN_SOUND.play()  # Play win sound
-    while run:
-        draw_win_screen(window, background)
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                pygame.quit()
-                return "quit"
-            
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = pygame.mouse.get_pos()
-                
-                restart_button = pygame.Rect(WIDTH // 2 - 150, HEIGHT // 2 - 50, 300, 60)
-                main_menu_button = pygame.Rect(WIDTH // 2 - 150, HEIGHT // 2 + 50, 300, 60)
-                
-                if restart_button.collidepoint(mouse_pos):
-                    return "restart"
-                if main_menu_button.collidepoint(mouse_pos):
-                    return "main_menu"
+    SOUNDS.play('win')  # Play win sound
+    result = WIN_MENU.run(window, background)
+    view.RENDER.invalidate() # The menu covered the board
+    if result == "quit":
+        pygame.quit()
+    return result
 
 #check if the player has won
-def check_win(tiles):
-    for tile in tiles.values():
-        if tile.value == 2048:
-            return True
-    return False
+def check_win(board):
+    return board.has_won()
+
+#on AI_THREAD: best move of the --workers search, made with its pool on first use
+def parallel_move(packed):
+    global AI
+    if AI is None:
+        import parallel
+        AI = parallel.ParallelExpectimax(AI_WORKERS, time_budget=AUTOPLAY_BUDGET)  # The pool stays up between moves
+    return AI.best_move(packed)
+
+#let the AI pick the next move without holding up the frame: (ready, move), ready False
+#while the search still runs, move None when no move is left. The expectimax search
+#runs in the hint process and gets waited seconds since it started on this board
+def autoplay_move(board, waited):
+    global AI, AI_SEARCH, AI_THREAD
+    if STRATEGY is not None:
+        move, chance = STRATEGY.best_move(board.cells)
+        if chance is not None:
+            pygame.display.set_caption(f"2048 - optimal play, {chance:.2%} to reach {1 << STRATEGY.target}")
+        return True, None if move is None else engine.DIRECTION_NAMES[move]
+    if AI_WEIGHTS:  # A few microseconds a move, played at once
+        if AI is None:
+            import ntuple
+            AI = ntuple.NTuplePolicy(AI_WEIGHTS)
+        move = AI.best_move(board.packed)
+        pygame.display.set_caption(f"2048 - n-tuple AI {AI.latency * 1e6:,.0f} us/move")
+    elif AI_WORKERS:  # The pool searches, a thread waits for it
+        if AI_THREAD is None:
+            from concurrent.futures import ThreadPoolExecutor
+            AI_THREAD = ThreadPoolExecutor(1)
+        if AI_SEARCH is None or AI_SEARCH[0] != board.packed:
+            AI_SEARCH = (board.packed, AI_THREAD.submit(parallel_move, board.packed))
+        if not AI_SEARCH[1].done():
+            return False, None
+        move = AI_SEARCH[1].result()
+        AI_SEARCH = None
+        pygame.display.set_caption(f"2048 - AI {AI.nodes_per_sec:,.0f} nodes/s, {AI.hit_rate:.0%} table hits")
+    else:  # Deepened in the hint process until AUTOPLAY_DEPTH or AUTOPLAY_BUDGET
+        HINTS.request(board.packed)
+        found = HINTS.result(board.packed)
+        if found is None:
+            return False, None
+        depth, move = found
+        if move is not None and depth < AUTOPLAY_DEPTH and waited < AUTOPLAY_BUDGET and HINTS.pending(board.packed):
+            return False, None
+        pygame.display.set_caption(f"2048 - AI searched {depth} moves deep")
+    if move is None:
+        return True, None
+    return True, engine.DIRECTION_NAMES[move]
 
 #main menu
 def main_menu(window):
-    run = True
-    while run:
-        draw_main_menu(window)
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                pygame.quit()
-                return False
-            
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = pygame.mouse.get_pos()
-                
-                play_button = pygame.Rect(WIDTH // 2 - 100, HEIGHT // 2, 200, 60)
-                quit_button = pygame.Rect(WIDTH // 2 - 100, HEIGHT // 2 + 100, 200, 60)
-                
-                if play_button.collidepoint(mouse_pos):
-                    return True  # Start a new game
-                if quit_button.collidepoint(mouse_pos):
-                    run = False
-                    pygame.quit()
-                    return False
+    view.RENDER.invalidate() # The menu covers the board
+    if MAIN_MENU.run(window) == "play":
+        return True  # Start a new game
+    pygame.quit()
+    return False
 
 #pause menu
 def pause_menu(window):
-    run = True
-    while run:
-        draw_pause_menu(window)
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                pygame.quit()
-                return "quit"
-            
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = pygame.mouse.get_pos()
-                
-                resume_button = pygame.Rect(WIDTH // 2 - 150, HEIGHT // 2 - 50, 300, 60)
-                restart_button = pygame.Rect(WIDTH // 2 - 150, HEIGHT // 2 + 50, 300, 60)
-                main_menu_button = pygame.Rect(WIDTH // 2 - 150, HEIGHT // 2 + 150, 300, 60)
-                
-                if resume_button.collidepoint(mouse_pos):
-                    return "resume"
-                if restart_button.collidepoint(mouse_pos):
-                    return "restart"
-                if main_menu_button.collidepoint(mouse_pos):
-                    return "main_menu"
+    result = PAUSE_MENU.run(window)
+    view.RENDER.invalidate() # The menu covered the board
+    if result == "quit":
+        pygame.quit()
+    return result
 
 #main function
 def main(window):
@@ -515,63 +223,219 @@ def main(window):
         clock = pygame.time.Clock() # Clock object to control the FPS
         run = True  # Main loop flag
         
-        tiles = generate_tiles() # Create the tiles
         result = "continue"  # Initialize result variable
+        autoplay = False  # Whether the AI plays the moves
+        show_hints = False  # Whether the suggested move is drawn
+        planner = animation.AnimationPlanner()  # Animates the moves without blocking the loop
+        moves = deque()  # Moves pressed but not played yet
+        recorder = None  # Moves of the current game for its replay
+        board, tiles, recorder = new_game(planner, moves, recorder) # Create the board and its tiles
+
+        autoplay_board = None  # Board the autoplay search started on
+        autoplay_since = 0.0  # When it started
+        idle = False  # Nothing moves, the loop sleeps until an event
+        wait = None  # Milliseconds to sleep at most while idle, None for no limit
 
         while run:
-            clock.tick(FPS) # Control the FPS
+            events = next_events(clock, idle, wait)
+            view.PROFILER.begin_frame()
 
-            for event in pygame.event.get():
+            view.PROFILER.begin('events')
+            for event in events:
                 if event.type == pygame.QUIT:
                     run = False
                     break
+
+                elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE): # The screen has to be drawn again
+                    view.RENDER.invalidate()
                 
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
                         result = pause_menu(window)
-                        if result == "resume":
+                        if result == "quit":
+                            save_replay(recorder)
+                            return
+                        elif result == "resume":
                             continue
                         elif result == "restart":
-                            tiles = generate_tiles()
+                            board, tiles, recorder = new_game(planner, moves, recorder)
                         elif result == "main_menu":
+                            save_replay(recorder)
                             if not main_menu(window):
                                 return
-                            tiles = generate_tiles()
+                            board, tiles, recorder = new_game(planner, moves, recorder)
                             
                     elif event.key == pygame.K_r:
-                        tiles = generate_tiles()
+                        board, tiles, recorder = new_game(planner, moves, recorder)
+                    elif event.key == pygame.K_u or event.key == pygame.K_y:
+                        if undo_move(recorder, planner, moves, redo=event.key == pygame.K_y):
+                            tiles = view.tiles_from_board(board)
+                            result = "continue"
+                    elif event.key == pygame.K_F5 and isinstance(recorder, history.History):
+                        recorder.save_game(SAVE_FILE)
+                    elif event.key == pygame.K_F9:
+                        resumed = resume_game(planner, moves, recorder)
+                        if resumed is not None:
+                            board, tiles, recorder = resumed
+                            result = "continue"
+                    elif event.key == pygame.K_F3:
+                        view.PROFILER.toggle()
+                    elif event.key == pygame.K_F4:
+                        view.PROFILER.dump(TRACE_FILE)
+                    elif event.key == pygame.K_h and board.packed is not None: # Hints come from the 4x4 AI
+                        show_hints = not show_hints
+                        if not show_hints:
+                            HINTS.cancel()
+                    elif event.key == pygame.K_p and (board.packed is not None or STRATEGY is not None): # The AI plays 4x4 boards, a strategy table its own size
+                        autoplay = not autoplay
+                        if not autoplay:
+                            pygame.display.set_caption('2048')
+                            if not show_hints:
+                                HINTS.cancel() # Stop the search autoplay started
                     elif event.key == pygame.K_a or event.key == pygame.K_LEFT:
-                        result = move_tiles(window, tiles, clock, 'left')
+                        moves.append('left')
                     elif event.key == pygame.K_d or event.key == pygame.K_RIGHT:
-                        result = move_tiles(window, tiles, clock, 'right')
+                        moves.append('right')
                     elif event.key == pygame.K_w or event.key == pygame.K_UP:
-                        result = move_tiles(window, tiles, clock, 'up')
+                        moves.append('up')
                     elif event.key == pygame.K_s or event.key == pygame.K_DOWN:
-                        result = move_tiles(window, tiles, clock, 'down')
-
-                if result == "lost":
-                    background = window.copy()  # Capture the current screen
-                    result = game_over_menu(window, background)
-                    if result == "restart":
-                        tiles = generate_tiles()
-                    elif result == "main_menu":
-                        if not main_menu(window):
-                            return
-                        tiles = generate_tiles()
+                        moves.append('down')
+
+            if moves and show_hints: # The player moved, the hint of this board is not needed any more
+                HINTS.cancel()
+            view.PROFILER.end()
+
+            view.PROFILER.begin('logic')
+            if autoplay and run and not moves and not planner.active:
+                if board.packed is None or board.packed != autoplay_board:
+                    autoplay_board, autoplay_since = board.packed, time.perf_counter()
+                ready, move = autoplay_move(board, time.perf_counter() - autoplay_since)
+                if ready and move is None:
+                    result = "lost"
+                elif ready:
+                    moves.append(move)
+
+            if moves and run: # Play one queued move per frame
+                result = view.move_tiles(board, tiles, moves.popleft(), planner, recorder)
+            view.PROFILER.end()
+
+            if result == "lost":
+                background = window.copy()  # Capture the current screen
+                result = game_over_menu(window, background)
+                if result == "restart":
+                    board, tiles, recorder = new_game(planner, moves, recorder)
+                elif result == "main_menu":
+                    save_replay(recorder)
+                    if not main_menu(window):
+                        return
+                    board, tiles, recorder = new_game(planner, moves, recorder)
+                elif result == "quit":
+                    save_replay(recorder)
+                    return
                 
-                if check_win(tiles):
-                    background = window.copy()  # Capture the current screen
-                    result = win_menu(window, background)
-                    if result == "restart":
-                        tiles = generate_tiles()
-                    elif result == "main_menu":
-                        if not main_menu(window):
-                            return
-                        tiles = generate_tiles()
-
-            draw(window, tiles) # Draw the window
+            if check_win(board) and not planner.active:
+                background = window.copy()  # Capture the current screen
+                result = win_menu(window, background)
+                if result == "restart":
+                    board, tiles, recorder = new_game(planner, moves, recorder)
+                elif result == "main_menu":
+                    save_replay(recorder)
+                    if not main_menu(window):
+                        return
+                    board, tiles, recorder = new_game(planner, moves, recorder)
+                elif result == "quit":
+                    save_replay(recorder)
+                    return
+
+            hint = None
+            if show_hints and not autoplay and not moves and not planner.active and board.packed is not None:
+                HINTS.request(board.packed) # Starts searching once the board settled
+                found = HINTS.hint(board.packed)
+                if found is not None:
+                    hint = found[0]
+
+            view.render_frame(window, tiles, planner, hint) # Draw the window
+            view.PROFILER.end_frame()
+
+            idle = view.RENDER.current() and not (planner.active or moves or autoplay) # The settled board is on screen
+            wait = None
+            if show_hints and board.packed is not None and HINTS.pending(board.packed):
+                wait = HINT_POLL # A deeper hint may come in
  
+        save_replay(recorder)
         pygame.quit()
+        return
+
+#print how long each start up step took until the main menu was on screen
+def startup_profile():
+    window = get_window()
+    STARTUP.append(('window', time.perf_counter()))
+    MAIN_MENU.show(window)
+    STARTUP.append(('main menu', time.perf_counter()))
+    SOUNDS.wait()
+    last = START
+    for step, end in STARTUP:
+        print(f"{step:<14} {(end - last) * 1000:8.1f} ms")
+        last = end
+    print(f"{'first frame':<14} {(last - START) * 1000:8.1f} ms")
+    if SOUNDS.ready_time is not None:
+        print(f"{'sounds ready':<14} {(SOUNDS.ready_time - START) * 1000:8.1f} ms (background)")
+    pygame.quit()
 
 if __name__ == '__main__':
-    main(WINDOW)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='2048')
+    parser.add_argument('--record', metavar='PATH', help='append every game to this .r2048 replay file')
+    parser.add_argument('--trace', metavar='PATH', help='record frame timings and save them here at exit (.json or .csv)')
+    parser.add_argument('--save', metavar='PATH', default=SAVE_FILE, help='file F5 saves the game to and F9 loads it from')
+    parser.add_argument('--connect', metavar='ADDRESS', help='play on a game server (host:port or Unix socket path)')
+    parser.add_argument('--weights', metavar='PATH', help='let autoplay use this n-tuple checkpoint (from python -m ntuple train)')
+    parser.add_argument('--workers', type=int, metavar='N', help='split the autoplay search across N processes (at most one less than the cores)')
+    parser.add_argument('--strategy', metavar='PATH', help='let autoplay play the optimal moves of a solver table (python -m solver solve)')
+    parser.add_argument('--mosaic', type=int, metavar='BOARDS', help='watch this many AI games at once instead of playing')
+    parser.add_argument('--startup-profile', action='store_true', help='time the start up to the first main menu frame and exit')
+    args = parser.parse_args()
+    REPLAY_FILE = args.record
+    SAVE_FILE = args.save
+    SERVER_ADDRESS = args.connect
+    AI_WEIGHTS = args.weights
+    AI_WORKERS = min(args.workers or 0, (os.cpu_count() or 1) - 1)  # One core stays with the game
+    if AI_WORKERS < MIN_WORKERS:
+        if args.workers:
+            print(f"--workers: {os.cpu_count()} core(s) leave too few for a pool, autoplay searches in one process")
+        AI_WORKERS = None
+    if SERVER_ADDRESS and (view.ROWS, view.COL) != (engine.ROWS, engine.COL):
+        parser.error('the server plays 4x4 games only')
+    if args.record and not replay.can_append(args.record):
+        parser.error(f"--record: {args.record} is a replay file of an older version, record into a new one")
+    if args.weights and not os.path.isfile(args.weights):
+        parser.error(f"--weights: no n-tuple checkpoint at {args.weights}")
+    if args.workers and args.weights:
+        parser.error('--workers splits the expectimax search, the n-tuple network of --weights plays alone')
+    if args.strategy:
+        import solver
+        STRATEGY = solver.StrategyTable.load(args.strategy)
+        if (STRATEGY.rows, STRATEGY.cols) != (view.ROWS, view.COL):
+            parser.error(f"{args.strategy} is for {STRATEGY.rows}x{STRATEGY.cols} boards, the game is {view.ROWS}x{view.COL}")
+    if args.startup_profile:
+        startup_profile()
+        raise SystemExit
+    if args.mosaic:
+        import mosaic
+        try:
+            mosaic.run(get_window(), mosaic.Mosaic(args.mosaic, (view.WIDTH, view.HEIGHT), 'ntuple' if AI_WEIGHTS else 'greedy', AI_WEIGHTS))
+        finally:
+            pygame.quit()
+        raise SystemExit
+    if args.trace:
+        TRACE_FILE = args.trace
+        view.PROFILER.start_trace()
+    try:
+        main(get_window())
+    finally:
+        HINTS.close()
+        if AI_THREAD is not None:
+            AI_THREAD.shutdown()  # The search running on it ends within its budget
+        if AI_WORKERS and AI is not None:
+            AI.close()
+        if args.trace:
+            view.PROFILER.dump(TRACE_FILE)
\ No newline at end of file
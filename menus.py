@@ -0,0 +1,116 @@
+from functools import lru_cache
+import pygame
+
+# Event driven menu screens
+#
+# A menu builds its fonts, labels and button rects once, then sleeps in
+# pygame.event.wait and only repaints the buttons whose hover state changed.
+
+HOVER_COLOR = (150, 150, 150)  # Color of the button under the mouse
+TITLE_SIZE = 100  # Font size of the titles
+BUTTON_SIZE = 60  # Font size of the buttons
+BUTTON_HEIGHT = 60  # Height of the buttons
+BUTTON_SPACING = 100  # Distance between the tops of two buttons
+
+
+@lru_cache(maxsize=None)
+def get_font(size, bold=False):  # SysFont is slow, load every font only once
+    return pygame.font.SysFont('comicsans', size, bold=bold)
+
+
+#one menu screen: a title and a column of buttons
+class Menu:
+    def __init__(self, title, buttons, button_width, button_offset, font_color, button_color,
+                 background_color=None, title_outline=None):
+        self.title = title
+        self.buttons = buttons  # (label, result) pairs from top to bottom
+        self.button_width = button_width
+        self.button_offset = button_offset  # Top of the first button, in pixels below the middle
+        self.font_color = font_color
+        self.button_color = button_color
+        self.background_color = background_color  # Fill color, None draws on the background image
+        self.title_outline = title_outline  # Color of the title outline, None for no outline
+        self.size = None  # Window size the layout was built for
+        self.rects = []
+
+    def build(self, size):  # Render the labels and place the buttons for a window size
+        width, height = size
+        title_font = get_font(TITLE_SIZE, True)
+        button_font = get_font(BUTTON_SIZE)
+
+        self.title_text = title_font.render(self.title, 1, self.font_color)
+        self.title_pos = (width // 2 - self.title_text.get_width() // 2, height // 4)
+        self.outline_text = None
+        if self.title_outline is not None:
+            self.outline_text = title_font.render(self.title, 1, self.title_outline)
+
+        top = height // 2 + self.button_offset
+        self.rects = [pygame.Rect(width // 2 - self.button_width // 2, top + i * BUTTON_SPACING, self.button_width, BUTTON_HEIGHT)
+                      for i in range(len(self.buttons))]
+        self.labels = [button_font.render(label, 1, self.font_color) for label, _ in self.buttons]
+        self.size = size
+
+    def button_at(self, pos):  # Index of the button under pos, None if there is none
+        for i, rect in enumerate(self.rects):
+            if rect.collidepoint(pos):
+                return i
+        return None
+
+    def draw_button(self, window, index, hovered):
+        rect = self.rects[index]
+        label = self.labels[index]
+        pygame.draw.rect(window, HOVER_COLOR if hovered else self.button_color, rect)
+        window.blit(label, (rect.x + rect.width // 2 - label.get_width() // 2, rect.y + rect.height // 2 - label.get_height() // 2))
+
+    def draw(self, window, background, hovered):  # Paint the whole menu
+        if self.background_color is not None:
+            window.fill(self.background_color)
+        if background is not None:
+            window.blit(background, (0, 0))
+
+        x, y = self.title_pos
+        if self.outline_text is not None:
+            for dx, dy in ((-2, -2), (2, -2), (-2, 2), (2, 2)):
+                window.blit(self.outline_text, (x + dx, y + dy))
+        window.blit(self.title_text, (x, y))
+
+        for i in range(len(self.buttons)):
+            self.draw_button(window, i, i == hovered)
+
+    def show(self, window, background=None):  # Paint the menu once, returns the hovered button
+        if self.size != window.get_size():
+            self.build(window.get_size())
+
+        hovered = self.button_at(pygame.mouse.get_pos())
+        self.draw(window, background, hovered)
+        pygame.display.update()
+        return hovered
+
+    #show the menu until a button is clicked, returns its result or quit_result
+    def run(self, window, background=None, quit_result="quit"):
+        hovered = self.show(window, background)
+
+        while True:
+            event = pygame.event.wait()
+            if event.type == pygame.QUIT:
+                return quit_result
+
+            if event.type == pygame.MOUSEMOTION:
+                now = self.button_at(event.pos)
+                if now != hovered:  # Repaint only the buttons that changed
+                    dirty = []
+                    for index, state in ((hovered, False), (now, True)):
+                        if index is not None:
+                            self.draw_button(window, index, state)
+                            dirty.append(self.rects[index])
+                    hovered = now
+                    pygame.display.update(dirty)
+
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                index = self.button_at(event.pos)
+                if index is not None:
+                    return self.buttons[index][1]
+
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                self.draw(window, background, hovered)
+                pygame.display.update()
@@ -0,0 +1,267 @@
+import argparse
+import math
+import time
+
+import numpy as np
+import pygame
+
+import batch
+import engine
+import menus
+import view
+
+# Many AI games watched at once in one window
+#
+#   python -m mosaic --boards 64                       # 8x8 greedy games
+#   python -m mosaic --boards 100 --policy ntuple --weights weights.n2048
+#   python main.py --mosaic 64
+#
+# The games are stepped together by batch.BatchGame and the policies choose the
+# moves of every board with a few NumPy operations on the four afterstates. Each
+# board is the game's own layout (RECT_WIDTH, RECT_HEIGHT, OUTLINE_THICKNESS)
+# scaled down to its slot of the window. The 16 possible cells (empty, 2, ...,
+# 32768) are rendered once at that size, so a frame is a single window.blits()
+# of the cells whose exponent differs from what is on screen, followed by a
+# display.update() of the boards they belong to. Lost games stay on screen for
+# RESTART_DELAY seconds, then start over.
+
+SIZE = (view.WIDTH, view.HEIGHT)  # Window size
+BOARDS = 64
+MARGIN = 4  # Pixels between boards
+MOVES_PER_SECOND = view.FPS  # Moves of every game per second
+MAX_STEPS = 4  # Moves per frame at most, so a stalled frame does not pile up moves
+RESTART_DELAY = 1.0  # Seconds a lost board stays on screen
+CAPTION_EVERY = 1.0  # Seconds between updates of the window caption
+EMPTY_COLOR = view.BACKGROUND_COLOR
+NO_MOVE = -np.inf  # Score of directions that do not change the board
+
+
+def layout(count, size):  # (columns, rows, scale) fitting count boards in the window
+    columns = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    board_width = view.RECT_WIDTH * engine.COL
+    board_height = view.RECT_HEIGHT * engine.ROWS
+    scale = min((size[0] - MARGIN * (columns + 1)) / (columns * board_width),
+                (size[1] - MARGIN * (rows + 1)) / (rows * board_height))
+    return columns, rows, scale
+
+
+#cell surfaces of every exponent at the reduced size, numbers shrunk to fit
+def cell_sprites(width, height, font_size):
+    font = menus.get_font(max(6, font_size), True)
+    sprites = []
+    for exponent in range(16):
+        surface = pygame.Surface((width, height)).convert()
+        if exponent == 0:
+            surface.fill(EMPTY_COLOR)
+            sprites.append(surface)
+            continue
+        value = 1 << exponent
+        surface.fill(view.TILE_SPRITES.color(value))
+        text = font.render(str(value), 1, view.FONT_COLOR)
+        if text.get_width() > width - 2:  # Long numbers on small cells
+            ratio = (width - 2) / text.get_width()
+            text = pygame.transform.smoothscale(text, (width - 2, max(1, int(text.get_height() * ratio))))
+        surface.blit(text, (width // 2 - text.get_width() // 2, height // 2 - text.get_height() // 2))
+        sprites.append(surface)
+    return sprites
+
+
+def afterstates(boards):  # (4, N) boards after each move and the score it gains
+    moves = [batch.move_all(boards, direction) for direction in range(4)]
+    return np.stack([new for new, _ in moves]), np.stack([score for _, score in moves])
+
+
+def random_scores(after, gained, rng):
+    return rng.random(after.shape)
+
+
+HEURISTIC = {}  # 'table': ai.HEURISTIC as an array, built on first use
+
+
+def heuristic_scores(after, gained, rng):  # ai.evaluate of every afterstate, like the greedy selfplay policy
+    import ai
+    if 'table' not in HEURISTIC:
+        HEURISTIC['table'] = np.array(ai.HEURISTIC, dtype=np.float64)
+    table = HEURISTIC['table']
+    flat = after.ravel()
+    values = np.zeros(len(flat))
+    for part in batch.rows(flat) + batch.rows(batch.transpose(flat)):
+        values += table[part]
+    return values.reshape(after.shape)
+
+
+class NTupleScores:  # Score gained plus the network value of the afterstate
+    def __init__(self, weights):
+        import ntuple
+        self.network = ntuple.NTupleNetwork.load(weights)
+
+    def __call__(self, after, gained, rng):
+        return self.network.value_batch(after.ravel()).reshape(after.shape) + gained
+
+
+def make_scores(policy, weights=None):
+    if policy == 'random':
+        return random_scores
+    if policy == 'greedy':
+        return heuristic_scores
+    if policy == 'ntuple':
+        if weights is None:
+            raise ValueError("the ntuple policy needs --weights")
+        return NTupleScores(weights)
+    raise ValueError(f"unknown policy {policy!r}")
+
+
+POLICIES = ('random', 'greedy', 'ntuple')
+
+
+#the games and what the window shows of them
+class Mosaic:
+    def __init__(self, count=BOARDS, size=SIZE, policy='greedy', weights=None, seed=None):
+        self.games = batch.BatchGame(count, seed, win_exponent=16)  # Past 2048, until the board is lost
+        self.scores = make_scores(policy, weights)
+        self.size = size
+        self.columns, self.rows, scale = layout(count, size)
+        self.cell = (max(1, int(view.RECT_WIDTH * scale)), max(1, int(view.RECT_HEIGHT * scale)))
+        self.line = max(1, round(view.OUTLINE_THICKNESS * scale))  # Grid line between cells
+        self.font_size = int(view.FONT_SIZE * scale)
+        self.board_size = (self.cell[0] * engine.COL + self.line, self.cell[1] * engine.ROWS + self.line)
+        self.sprites = None  # Cell surface of every exponent, made with the window
+        self.positions = None  # Top left corner of every cell, board by board
+        self.rects = None  # Screen rect of every board
+        self.shown = None  # (N, 16) exponents on screen, None when the window has to be drawn whole
+        self.lost_at = np.full(count, np.inf)  # Time every board was lost
+        self.steps = 0.0  # Moves owed to every game, fractions carried between frames
+        self.total_moves = 0
+
+    def build(self):  # Sprites and positions, they need the window for convert()
+        self.sprites = cell_sprites(self.cell[0] - self.line, self.cell[1] - self.line, self.font_size)
+        board_width, board_height = self.board_size
+        used_width = self.columns * board_width + (self.columns - 1) * MARGIN
+        used_height = self.rows * board_height + (self.rows - 1) * MARGIN
+        left = (self.size[0] - used_width) // 2
+        top = (self.size[1] - used_height) // 2
+        self.rects = []
+        positions = []
+        for index in range(len(self.games)):
+            row, col = divmod(index, self.columns)
+            x = left + col * (board_width + MARGIN)
+            y = top + row * (board_height + MARGIN)
+            self.rects.append(pygame.Rect(x, y, board_width, board_height))
+            for cell in range(engine.CELLS):
+                cell_row, cell_col = divmod(cell, engine.COL)
+                positions.append((x + self.line + cell_col * self.cell[0], y + self.line + cell_row * self.cell[1]))
+        self.positions = positions
+
+    def invalidate(self):  # The next frame draws every board
+        self.shown = None
+
+    #play elapsed seconds worth of moves on every game, restart the ones lost long enough
+    def update(self, elapsed, now, speed=MOVES_PER_SECOND):
+        self.steps = min(self.steps + elapsed * speed, MAX_STEPS)
+        games = self.games
+        while self.steps >= 1:
+            self.steps -= 1
+            after, gained = afterstates(games.boards)
+            scores = self.scores(after, gained, games.rng)
+            scores = np.where(after != games.boards, scores, NO_MOVE)
+            moved, lost, _ = games.step(scores.argmax(axis=0))
+            self.total_moves += int(moved.sum())
+            self.lost_at = np.where(lost & np.isinf(self.lost_at), now, self.lost_at)
+        restart = now - self.lost_at >= RESTART_DELAY
+        if restart.any():
+            games.reset(restart)
+            self.lost_at[restart] = np.inf
+
+    #draw the cells that changed since the last frame, returns the screen rects to update
+    def draw(self, window):
+        if self.sprites is None:
+            self.build()
+        exponents = batch.cells(self.games.boards).astype(np.intp)
+        if self.shown is None:
+            window.fill(view.BACKGROUND_COLOR)
+            for rect in self.rects:
+                window.fill(view.OUTLINE_COLOR, rect)
+            changed = np.ones(exponents.shape, dtype=bool)
+            rects = [window.get_rect()]
+        else:
+            changed = exponents != self.shown
+            rects = [self.rects[index] for index in np.flatnonzero(changed.any(axis=1))]
+        cells = np.flatnonzero(changed)
+        if len(cells):
+            sprites = self.sprites
+            positions = self.positions
+            window.blits([(sprites[exponent], positions[cell])
+                          for cell, exponent in zip(cells.tolist(), exponents.ravel()[cells].tolist())], False)
+        self.shown = exponents
+        return rects
+
+    def caption(self, fps, moves_per_second):
+        best = 1 << int(batch.max_exponent(self.games.boards).max())
+        return (f"2048 mosaic - {len(self.games)} games, {fps:.0f} FPS, {moves_per_second:.0f} moves/s, "
+                f"best tile {best}")
+
+
+#show the mosaic until the window is closed or Escape, space pauses
+def run(window, mosaic, speed=MOVES_PER_SECOND, frames=None):
+    clock = pygame.time.Clock()
+    paused = False
+    last = time.perf_counter()
+    caption_at = last
+    caption_frames = 0
+    caption_moves = mosaic.total_moves
+    frame = 0
+    while frames is None or frame < frames:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    return
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+            if event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                mosaic.invalidate()
+
+        now = time.perf_counter()
+        if not paused:
+            mosaic.update(now - last, now, speed)
+        last = now
+        rects = mosaic.draw(window)
+        if rects:
+            pygame.display.update(rects)
+
+        frame += 1
+        caption_frames += 1
+        if now - caption_at >= CAPTION_EVERY:
+            moves = mosaic.total_moves - caption_moves
+            pygame.display.set_caption(mosaic.caption(caption_frames / (now - caption_at), moves / (now - caption_at)))
+            caption_at, caption_frames, caption_moves = now, 0, mosaic.total_moves
+        clock.tick(view.FPS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Watch many AI games of 2048 at once.')
+    parser.add_argument('--boards', type=int, default=BOARDS)
+    parser.add_argument('--policy', choices=POLICIES, default='greedy')
+    parser.add_argument('--weights', help='n-tuple checkpoint for --policy ntuple')
+    parser.add_argument('--speed', type=float, default=MOVES_PER_SECOND, help='moves per second of every game')
+    parser.add_argument('--size', type=int, nargs=2, default=SIZE, metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--frames', type=int, help='stop after this many frames')
+    args = parser.parse_args(argv)
+    if args.policy == 'ntuple' and not args.weights:
+        parser.error('--policy ntuple needs --weights')
+
+    pygame.display.init()
+    pygame.font.init()
+    window = pygame.display.set_mode(args.size)
+    pygame.display.set_caption('2048 mosaic')
+    try:
+        run(window, Mosaic(args.boards, tuple(args.size), args.policy, args.weights, args.seed), args.speed, args.frames)
+    finally:
+        pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
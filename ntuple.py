@@ -0,0 +1,327 @@
+import argparse
+import os
+import struct
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+import batch
+import engine
+
+# N-tuple network: a learned value of the board left by a move
+#
+#   python -m ntuple train --games 100000 --workers 8 --out weights.n2048
+#   python -m selfplay --policy ntuple --weights weights.n2048
+#   python main.py --weights weights.n2048       # then 'P' lets the network play
+#
+# The value of a packed 4x4 board is a sum of table lookups: every tuple of cells
+# in TUPLES, in each of the 8 rotations and mirror images of the board, reads its
+# exponents as an index into its own float32 table. Playing is one ply: the move
+# whose score gained plus the value of the board it leaves (its afterstate) is
+# highest.
+#
+# Training is TD(0) on afterstates. Workers play batches of games with the NumPy
+# batch engine on their own copy of the weights and move the value of every
+# afterstate towards the reward of the next move plus the value of the next
+# afterstate (0 when the game is lost). After every round the parent averages
+# what the workers learned into the shared weights and the next round starts
+# from those. Games go on past 2048, so the network learns the late game too.
+#
+# A checkpoint is a header, the tuples and the weights as they are in memory.
+# NTupleNetwork.load memory maps the weights read only, so every process playing
+# with the same file shares one copy of them in the page cache.
+
+TUPLES = (  # Cells of each tuple, index = row * 4 + col
+    (0, 1, 2, 3),  # Outer row
+    (4, 5, 6, 7),  # Inner row
+    (0, 1, 4, 5),  # Corner square
+    (1, 2, 5, 6),  # Edge square
+)
+ALPHA = 0.02  # Learning rate, shared by the lookups of a board (higher diverges with PARALLEL games updating at once)
+PARALLEL = 256  # Games a worker plays at once
+ROUND_GAMES = 1000  # Games per worker between two merges of the weights
+CHECKPOINT = 'weights.n2048'  # Default checkpoint path
+
+MAGIC = b'N2048\x01'
+HEADER = struct.Struct('<IIQ')  # tuples, cells per tuple, games trained
+ALIGN = 64  # The weights start at a multiple of this in the file
+
+
+def symmetries():  # The 8 cell permutations of the board: 4 rotations, each also mirrored
+    grids = []
+    grid = np.arange(engine.CELLS).reshape(engine.ROWS, engine.COL)
+    for _ in range(4):
+        grids += [grid, grid[:, ::-1]]
+        grid = np.rot90(grid)
+    return [g.ravel() for g in grids]
+
+
+#value function of afterstates over a set of tuples
+class NTupleNetwork:
+    def __init__(self, tuples=TUPLES, weights=None, games=0):
+        self.tuples = tuple(tuple(cells) for cells in tuples)
+        self.size = len(self.tuples[0])
+        if any(len(cells) != self.size for cells in self.tuples):
+            raise ValueError("all tuples need the same number of cells")
+        table = 1 << (4 * self.size)  # Entries of one tuple's table
+        if weights is None:
+            weights = np.zeros(len(self.tuples) * table, dtype=np.float32)
+        self.weights = weights  # Tables of all tuples one after another
+        self.games = games  # Games trained so far
+
+        # Every (symmetry, tuple) pair is a feature: its cells and the offset of its table
+        cells = [[perm[c] for c in t] for perm in symmetries() for t in self.tuples]
+        self.cells = np.array(cells, dtype=np.intp)
+        self.offsets = np.array([i * table for _ in range(8) for i in range(len(self.tuples))], dtype=np.intp)
+        self.nibbles = (np.arange(self.size) * 4).astype(np.intp)
+
+    def features(self, boards):  # (N, features) weight indices of every board
+        exps = batch.cells(np.asarray(boards, dtype=np.uint64)).astype(np.intp)
+        return (exps[:, self.cells] << self.nibbles).sum(axis=2) + self.offsets
+
+    def value_batch(self, boards):
+        return self.weights[self.features(boards)].sum(axis=1)
+
+    def value(self, board):  # Value of one packed board
+        return float(self.value_batch([board])[0])
+
+    #best move for the board, None when no move changes it
+    def best_move(self, board):
+        after = []
+        rewards = []
+        directions = []
+        for direction in range(4):
+            new, gained, moved = engine.move(board, direction)
+            if moved:
+                after.append(new)
+                rewards.append(gained)
+                directions.append(direction)
+        if not directions:
+            return None
+        values = self.value_batch(after) + rewards
+        return directions[int(values.argmax())]
+
+    def save(self, path):  # Write a checkpoint, replacing the file so open maps keep the old one
+        header = MAGIC + HEADER.pack(len(self.tuples), self.size, self.games) + bytes(sum(self.tuples, ()))
+        weights = np.asarray(self.weights, dtype='<f4')
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.write(bytes(-len(header) % ALIGN))
+            weights.tofile(f)
+        os.replace(tmp, path)
+
+    #network of a checkpoint, its weights memory mapped (copied when writable)
+    @classmethod
+    def load(cls, path, writable=False):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an n-tuple checkpoint")
+            count, size, games = HEADER.unpack(f.read(HEADER.size))
+            cells = f.read(count * size)
+        tuples = [tuple(cells[i:i + size]) for i in range(0, len(cells), size)]
+        header = len(MAGIC) + HEADER.size + len(cells)
+        weights = np.memmap(path, dtype='<f4', mode='r', offset=header + (-header % ALIGN),
+                            shape=(count << (4 * size),))
+        if writable:
+            weights = np.array(weights, dtype=np.float32)
+        return cls(tuples, weights, games)
+
+
+#play games with TD(0) afterstate learning, updating weights in place
+#
+#returns (scores, max exponents) of the finished games
+def train_games(network, games, rng, alpha=ALPHA, parallel=PARALLEL):
+    weights = network.weights
+    step = np.float32(alpha / len(network.offsets))
+    n = min(parallel, games)
+    boards = batch.new_boards(n, rng)
+    scores = np.zeros(n, dtype=np.int64)
+    last = np.zeros((n, len(network.offsets)), dtype=np.intp)  # Features of the previous afterstate
+    has_last = np.zeros(n, dtype=bool)
+    started = n
+    finished_scores = []
+    finished_tiles = []
+
+    while len(boards):
+        values = np.full((4, len(boards)), -np.inf)
+        after = np.empty((4, len(boards)), dtype=np.uint64)
+        gained = np.empty((4, len(boards)), dtype=np.int64)
+        features = []
+        for direction in range(4):
+            after[direction], gained[direction] = batch.move_all(boards, direction)
+            features.append(network.features(after[direction]))
+            moved = after[direction] != boards
+            values[direction, moved] = gained[direction, moved] + weights[features[-1][moved]].sum(axis=1)
+        best = values.argmax(axis=0)
+        index = np.arange(len(boards))
+        lost = np.isneginf(values[best, index])
+
+        # The previous afterstate moves towards reward + value of this one, or 0 when lost
+        target = np.where(lost, 0.0, values[best, index])
+        update = np.nonzero(has_last)[0]
+        error = target[update] - weights[last[update]].sum(axis=1)
+        np.add.at(weights, last[update], (step * error)[:, None].astype(np.float32))
+
+        last = np.stack(features)[best, index]
+        has_last[:] = True
+        scores += np.where(lost, 0, gained[best, index])
+        boards = batch.spawn(after[best, index], rng, ~lost)
+
+        if lost.any():
+            done = np.nonzero(lost)[0]
+            finished_scores.append(scores[done])
+            finished_tiles.append(batch.max_exponent(boards[done]))
+            restart = done[:max(0, games - started)]
+            started += len(restart)
+            boards[restart] = batch.new_boards(len(restart), rng)
+            scores[restart] = 0
+            has_last[restart] = False
+            keep = np.ones(len(boards), dtype=bool)
+            keep[done[len(restart):]] = False
+            boards, scores, last, has_last = boards[keep], scores[keep], last[keep], has_last[keep]
+
+    network.games += games
+    return np.concatenate(finished_scores), np.concatenate(finished_tiles)
+
+
+# Per-worker state set up by init_worker
+WORKER = {}
+
+
+def init_worker(shm_name, workers, tuples):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    network = NTupleNetwork(tuples)
+    size = len(network.weights)
+    WORKER['shm'] = shm  # Keep the mapping alive for the life of the worker
+    WORKER['master'] = np.ndarray(size, dtype=np.float32, buffer=shm.buf)
+    WORKER['deltas'] = np.ndarray((workers, size), dtype=np.float32, buffer=shm.buf, offset=size * 4)
+    WORKER['network'] = network
+
+
+def run_round(task):  # Train a copy of the shared weights, leave what changed in the worker's slot
+    slot, games, seed, alpha, parallel = task
+    network = WORKER['network']
+    master = WORKER['master']
+    network.weights = master.copy()
+    scores, tiles = train_games(network, games, np.random.default_rng(seed), alpha, parallel)
+    np.subtract(network.weights, master, out=WORKER['deltas'][slot])
+    return scores, tiles
+
+
+#train network over rounds of games on a pool, saving a checkpoint after every checkpoint_every rounds
+def train(network, games, workers=None, round_games=ROUND_GAMES, alpha=ALPHA, parallel=PARALLEL, seed=0,
+          path=None, checkpoint_every=10, log=print):
+    workers = workers or os.cpu_count() or 1
+    size = len(network.weights)
+    shm = shared_memory.SharedMemory(create=True, size=(workers + 1) * size * 4)
+    pool = None
+    try:
+        master = np.ndarray(size, dtype=np.float32, buffer=shm.buf)
+        deltas = np.ndarray((workers, size), dtype=np.float32, buffer=shm.buf, offset=size * 4)
+        master[:] = network.weights
+        if workers > 1:
+            pool = Pool(workers, initializer=init_worker, initargs=(shm.name, workers, network.tuples))
+        else:
+            init_worker(shm.name, workers, network.tuples)
+        seeds = np.random.SeedSequence(seed)
+        start_time = time.perf_counter()
+        done = 0
+        rounds = 0
+        while done < games:
+            count = min(round_games, -(-(games - done) // workers))
+            tasks = [(slot, min(count, games - done - slot * count), child, alpha, parallel)
+                     for slot, child in enumerate(seeds.spawn(workers))]
+            tasks = [task for task in tasks if task[1] > 0]
+            results = pool.map(run_round, tasks) if pool else [run_round(task) for task in tasks]
+            master += deltas[:len(tasks)].mean(axis=0)  # Average what the workers learned
+            scores = np.concatenate([scores for scores, _ in results])
+            tiles = np.concatenate([tiles for _, tiles in results])
+            done += len(scores)
+            rounds += 1
+            network.games += len(scores)
+            elapsed = time.perf_counter() - start_time
+            if log:
+                log(f"{done}/{games} games, mean score {scores.mean():,.0f}, "
+                    f"2048 in {(tiles >= engine.WIN_EXPONENT).mean():.1%}, {done / elapsed:,.1f} games/sec")
+            if path and rounds % checkpoint_every == 0:
+                network.weights = master.copy()
+                network.save(path)
+        network.weights = master.copy()
+        if path:
+            network.save(path)
+        del master, deltas
+    finally:
+        if pool is not None:
+            pool.terminate()
+        WORKER.clear()
+        shm.close()
+        shm.unlink()
+    return network
+
+
+#autoplay and selfplay policy playing the moves of a checkpoint
+class NTuplePolicy:
+    def __init__(self, path=CHECKPOINT):
+        self.network = NTupleNetwork.load(path)
+        self.moves = 0
+        self.time = 0.0
+
+    @property
+    def latency(self):  # Mean seconds per move
+        return self.time / self.moves if self.moves else 0.0
+
+    def best_move(self, board):
+        start = time.perf_counter()
+        move = self.network.best_move(board)
+        self.time += time.perf_counter() - start
+        self.moves += 1
+        return move
+
+    def __call__(self, board, rng):
+        return self.best_move(board)
+
+
+def eval_latency(network, count=10000, seed=0):  # (seconds per board alone, per board in a batch)
+    rng = np.random.default_rng(seed)
+    boards = batch.spawn(batch.spawn(batch.new_boards(count, rng), rng), rng)
+    start = time.perf_counter()
+    for board in boards[:1000].tolist():
+        network.value(board)
+    single = (time.perf_counter() - start) / min(count, 1000)
+    start = time.perf_counter()
+    network.value_batch(boards)
+    return single, (time.perf_counter() - start) / count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train and evaluate an n-tuple network by TD self-play.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    train_parser = commands.add_parser('train', help='train by self-play across processes')
+    train_parser.add_argument('--games', type=int, default=10000)
+    train_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    train_parser.add_argument('--round-games', type=int, default=ROUND_GAMES, help='games per worker between merges')
+    train_parser.add_argument('--alpha', type=float, default=ALPHA)
+    train_parser.add_argument('--seed', type=int, default=0)
+    train_parser.add_argument('--out', default=CHECKPOINT, help='checkpoint to write')
+    train_parser.add_argument('--resume', action='store_true', help='start from the weights in --out')
+    latency_parser = commands.add_parser('latency', help='time the evaluation of a checkpoint')
+    latency_parser.add_argument('weights', nargs='?', default=CHECKPOINT)
+    args = parser.parse_args(argv)
+
+    if args.command == 'train':
+        network = NTupleNetwork.load(args.out, writable=True) if args.resume else NTupleNetwork()
+        start = time.perf_counter()
+        train(network, args.games, args.workers, args.round_games, args.alpha, seed=args.seed, path=args.out)
+        elapsed = time.perf_counter() - start
+        print(f"{args.games} games in {elapsed:.1f}s ({args.games / elapsed:,.1f} games/sec), "
+              f"{network.games} trained in total, saved to {args.out}")
+    else:
+        network = NTupleNetwork.load(args.weights)
+    single, batched = eval_latency(network)
+    print(f"evaluation: {single * 1e6:.1f} us/board alone, {batched * 1e6:.2f} us/board in batches")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+import argparse
+import os
+import random
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+import ai
+import engine
+
+# Expectimax searched by a warm process pool
+#
+#   python -m parallel scaling --workers 1 2 4 8 --depth 3
+#   python main.py --workers 8        # then 'P' searches on 8 processes
+#
+# The parent splits the top of the tree into subtrees for the pool. It starts
+# from the root moves and keeps splitting the biggest subtree left, a chance
+# node into its spawns or a max node into its moves, until there are
+# TASKS_PER_WORKER subtrees per worker and none is more than BALANCE times the
+# average size, so a full board (few spawns) or a move with a deep, likely line
+# is split deeper than the rest. The size of a subtree is estimated from its
+# depth, its empty cells and its probability. Every subtree is searched by a
+# worker like Expectimax does below that point, and the parent puts the values
+# back together up the split tree (spawns averaged, moves maxed) and keeps the
+# best root move, like Expectimax.search_root. Tasks go to the pool's shared
+# queue biggest first and a worker takes the next one as soon as it is done, so
+# a worker stuck in a deep subtree does not hold up the others. Python processes
+# cannot take frames off each other's stacks, so splitting big subtrees before
+# the search and this queue stand in for work stealing: nothing is split again
+# once a worker has started on it.
+#
+# Workers share one transposition table in shared memory, keyed by the packed
+# board. An entry is two 64 bit words: the bits of the value as a double, and the
+# board XOR those bits XOR the depth times HASH_MULTIPLIER. A reader knows the
+# board, so it gets the depth back by multiplying with the inverse and takes the
+# entry only when that is a depth at all (below 256). Writers store the value
+# word first, so a slot torn by another process, or holding another board, reads
+# as a miss with odds of 2 ** -56 against, and no lock is needed. The value comes
+# back bit for bit. Slots are always replaced. The parent searches the shallow
+# iterations itself on the same table, which leaves their values there for the
+# workers. The table outlives the move, so the next search starts from what the
+# last one found, and the pool outlives it too: the workers are forked once,
+# with the heuristic tables of ai.py already built.
+
+WORKERS = os.cpu_count() or 1
+TABLE_BITS = 22  # 4M entries of 16 bytes, 64 MiB of shared memory
+TASKS_PER_WORKER = 8  # Subtrees per worker the split aims for
+BALANCE = 4.0  # Subtrees bigger than this many times the average are split further
+MAX_TASKS_PER_WORKER = 64  # The split stops here whatever the sizes
+SERIAL_DEPTH = 2  # Iterations this shallow are searched by the parent, quicker than handing them out
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15  # Fibonacci hashing
+WORD_MASK = (1 << 64) - 1
+DEPTH_INVERSE = pow(HASH_MULTIPLIER, -1, 1 << 64)  # Undoes the multiplication the depth is stored with
+MAX_DEPTH = 0xFF  # Deepest depth an entry holds
+BENCH_BOARDS = 12  # Boards of the scaling benchmark
+BENCH_SEED = 2048
+
+
+#lock-free transposition table over a shared buffer of 2 ** bits entries
+class SharedTable:
+    def __init__(self, buffer, bits):
+        self.words = buffer.cast('Q')
+        self.shift = 64 - bits
+        scratch = bytearray(8)  # Reinterprets a word as a double and back
+        self.word = memoryview(scratch).cast('Q')
+        self.double = memoryview(scratch).cast('d')
+
+    def release(self):  # Let go of the buffer so its shared memory can be closed
+        self.words.release()
+
+    def get(self, board, depth):  # Value of board searched at least depth deep, None if there is none
+        slot = ((board * HASH_MULTIPLIER) & WORD_MASK) >> self.shift << 1
+        data = self.words[slot + 1]
+        stored = ((self.words[slot] ^ data ^ board) * DEPTH_INVERSE) & WORD_MASK
+        if not depth <= stored <= MAX_DEPTH:
+            return None
+        self.word[0] = data
+        return self.double[0]
+
+    def put(self, board, depth, value):  # depth up to MAX_DEPTH
+        slot = ((board * HASH_MULTIPLIER) & WORD_MASK) >> self.shift << 1
+        self.double[0] = value
+        data = self.word[0]
+        self.words[slot + 1] = data
+        self.words[slot] = board ^ data ^ ((depth * HASH_MULTIPLIER) & WORD_MASK)
+
+
+#expectimax over the shared table, the parent keeps the time
+class SharedExpectimax(ai.Expectimax):
+    def __init__(self, table, prob_cutoff=1e-4):
+        super().__init__(time_budget=None, prob_cutoff=prob_cutoff)
+        self.shared = table
+
+    def lookup(self, board, depth):
+        return self.shared.get(board, depth)
+
+    def store(self, board, depth, value):
+        self.shared.put(board, depth, value)
+
+
+WORKER = {}
+
+
+def init_worker(shm_name, bits, prob_cutoff):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    WORKER['shm'] = shm  # Keep the mapping alive for the life of the worker
+    WORKER['search'] = SharedExpectimax(SharedTable(shm.buf, bits), prob_cutoff)
+
+
+#value of one subtree, None when the deadline passed first
+def run_task(task):
+    key, chance, board, depth, prob, deadline = task
+    search = WORKER['search']
+    search.deadline = deadline  # perf_counter is the same monotonic clock in every process
+    search.reset_stats()
+    try:
+        if chance:  # A board after a move: the mean over its spawns
+            value = search.chance_node(board, depth, prob)
+        else:  # A board after a spawn: its best move
+            value = search.max_node(board, depth, prob)
+    except ai.SearchTimeout:
+        value = None
+    return key, value, search.nodes, search.lookups, search.hits
+
+
+#a node at the top of the search tree, searched by a worker or split into its children
+class Split:
+    def __init__(self, chance, board, depth, prob, prob_cutoff):
+        self.chance = chance  # Chance node (after a move) or max node (after a spawn)
+        self.board = board
+        self.depth = depth
+        self.prob = prob
+        self.children = None  # Split nodes below, None while this is a task
+        self.value = None
+        cells = len(engine.empty_cells(board))
+        self.cells = cells
+        # Rough node count of the subtree: 8 children per empty cell and move, one level per depth
+        self.size = prob * (8 * max(1, cells)) ** depth
+        if chance:
+            self.splittable = depth >= 2 and prob >= prob_cutoff and cells > 0
+        else:
+            self.splittable = depth >= 2
+
+    def split(self, prob_cutoff):  # Make the children, returns them (none for a max node without moves)
+        self.children = []
+        if self.chance:
+            prob = self.prob / self.cells * ai.SPAWN_PROBABILITY
+            for index in engine.empty_cells(self.board):
+                for exp in engine.SPAWN_EXPONENTS:
+                    self.children.append(Split(False, self.board | exp << (4 * index), self.depth, prob, prob_cutoff))
+        else:
+            for direction in (engine.LEFT, engine.RIGHT, engine.UP, engine.DOWN):
+                new, _, moved = engine.move(self.board, direction)
+                if moved:
+                    self.children.append(Split(True, new, self.depth - 1, self.prob, prob_cutoff))
+        return self.children
+
+    def resolve(self):  # Value from the children, the way Expectimax combines them
+        if self.children is None:
+            return self.value
+        values = [child.resolve() for child in self.children]
+        if self.chance:
+            self.value = sum(values) * ai.SPAWN_PROBABILITY / self.cells
+        else:
+            self.value = max([0.0] + values)
+        return self.value
+
+
+#expectimax with the same answers as ai.Expectimax, searched across processes
+class ParallelExpectimax:
+    def __init__(self, workers=WORKERS, max_depth=6, time_budget=0.05, table_bits=TABLE_BITS, prob_cutoff=1e-4,
+                 tasks_per_worker=TASKS_PER_WORKER):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.time_budget = time_budget  # Seconds per move, None searches max_depth fully
+        self.table_bits = table_bits
+        self.prob_cutoff = prob_cutoff
+        self.tasks_per_worker = tasks_per_worker
+        self.shm = None
+        self.pool = None
+        self.local = None  # Search of the parent for the shallow iterations
+        self.nodes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.search_time = 0.0
+        self.depth_reached = 0
+
+    nodes_per_sec = ai.Expectimax.nodes_per_sec
+    hit_rate = ai.Expectimax.hit_rate
+    reset_stats = ai.Expectimax.reset_stats
+
+    def start(self):  # Make the table and fork the workers, done once
+        if self.pool is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=16 << self.table_bits)
+            self.local = SharedExpectimax(SharedTable(self.shm.buf, self.table_bits), self.prob_cutoff)
+            self.pool = Pool(self.workers, initializer=init_worker,
+                             initargs=(self.shm.name, self.table_bits, self.prob_cutoff))
+
+    def clear(self):  # Forget every stored value
+        if self.shm is not None:
+            words = np.frombuffer(self.shm.buf, dtype=np.uint64)
+            words.fill(0)
+            del words  # The shared memory cannot be closed while a view is left
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.local.shared.release()
+            self.shm.close()
+            self.shm.unlink()
+            self.pool = self.shm = self.local = None
+
+    #best move for the board, None when no move changes it
+    def best_move(self, board):
+        self.start()
+        start = time.perf_counter()
+        deadline = start + self.time_budget if self.time_budget else None
+        best = None
+        try:
+            for depth in range(1, self.max_depth + 1):
+                if depth <= SERIAL_DEPTH:
+                    best = self.search_local(board, depth, deadline)
+                else:
+                    best = self.search_root(board, depth, deadline)
+                self.depth_reached = depth
+                if best is None:
+                    break
+        except ai.SearchTimeout:
+            pass
+        if best is None:  # The budget ran out before depth 1 finished
+            best = self.search_local(board, 1, None)
+        self.search_time += time.perf_counter() - start
+        return best
+
+    def search_local(self, board, depth, deadline):  # Search in this process
+        local = self.local
+        local.reset_stats()
+        local.deadline = deadline
+        try:
+            return local.search_root(board, depth)
+        finally:
+            self.nodes += local.nodes
+            self.lookups += local.lookups
+            self.hits += local.hits
+
+    #split tree of every root move and the subtrees the workers search, biggest first
+    def split(self, board, depth):
+        roots = {}  # Root move -> its chance node
+        for direction in (engine.LEFT, engine.RIGHT, engine.UP, engine.DOWN):
+            new, _, moved = engine.move(board, direction)
+            if moved:
+                roots[direction] = Split(True, new, depth, 1.0, self.prob_cutoff)
+        tasks = list(roots.values())
+        target = self.workers * self.tasks_per_worker
+        while len(tasks) < self.workers * MAX_TASKS_PER_WORKER:
+            splittable = [task for task in tasks if task.splittable]
+            if not splittable:
+                break
+            biggest = max(splittable, key=lambda task: task.size)
+            if len(tasks) >= target and biggest.size <= BALANCE * sum(task.size for task in tasks) / len(tasks):
+                break
+            tasks.remove(biggest)
+            tasks.extend(biggest.split(self.prob_cutoff))
+        tasks.sort(key=lambda task: -task.size)
+        return roots, tasks
+
+    def search_root(self, board, depth, deadline=None):
+        roots, tasks = self.split(board, depth)
+        timed_out = False
+        work = [(key, task.chance, task.board, task.depth, task.prob, deadline) for key, task in enumerate(tasks)]
+        for key, value, nodes, lookups, hits in self.pool.imap_unordered(run_task, work):
+            self.nodes += nodes
+            self.lookups += lookups
+            self.hits += hits
+            if value is None:
+                timed_out = True  # Keep reading, the rest of the tasks stop at once
+            tasks[key].value = value
+        if timed_out:
+            raise ai.SearchTimeout
+
+        best = None
+        best_value = -1.0
+        for direction, root in roots.items():
+            value = root.resolve()
+            if value > best_value:
+                best, best_value = direction, value
+        return best
+
+
+def bench_boards(count=BENCH_BOARDS, seed=BENCH_SEED):  # Mid and late game boards of greedy games
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = engine.new_board(rng)
+        stop = rng.randrange(100, 600)
+        for _ in range(stop):
+            moves = [(ai.evaluate(new), new) for new, _, moved in (engine.move(board, d) for d in range(4)) if moved]
+            if not moves:
+                break
+            board = engine.spawn(max(moves)[1], rng)
+        if not engine.is_lost(board):
+            boards.append(board)
+    return boards
+
+
+#search every board to depth on 1 process, then on each pool size, returns report rows
+def scaling(workers_list, depth, boards, log=print):
+    single = ai.Expectimax(max_depth=depth, time_budget=None)
+    start = time.perf_counter()
+    expected = []
+    for board in boards:
+        single.table.clear()
+        expected.append(single.best_move(board))
+    base = time.perf_counter() - start
+    log(f"{'workers':>7} {'seconds':>8} {'speedup':>8} {'efficiency':>10} {'nodes/s':>10} {'hits':>5} {'same':>5}")
+    log(f"{'search':>7} {base:8.2f} {1.0:8.2f} {1.0:10.0%} {single.nodes_per_sec:10,.0f} {single.hit_rate:5.0%} "
+        f"{len(boards):5}")
+    rows = [{'workers': 0, 'seconds': base, 'speedup': 1.0, 'efficiency': 1.0, 'nodes_per_sec': single.nodes_per_sec}]
+    for workers in workers_list:
+        search = ParallelExpectimax(workers, max_depth=depth, time_budget=None)
+        warm = time.perf_counter()
+        search.start()
+        search.pool.map(int, range(workers))  # Wait until the workers are up
+        warm = time.perf_counter() - warm
+        try:
+            start = time.perf_counter()
+            same = 0
+            for board, move in zip(boards, expected):
+                search.clear()
+                same += search.best_move(board) == move
+            elapsed = time.perf_counter() - start
+        finally:
+            search.close()
+        speedup = base / elapsed
+        log(f"{workers:7} {elapsed:8.2f} {speedup:8.2f} {speedup / workers:10.0%} {search.nodes_per_sec:10,.0f} "
+            f"{search.hit_rate:5.0%} {same:5}   (pool start {warm * 1000:.0f} ms, once)")
+        rows.append({'workers': workers, 'seconds': elapsed, 'speedup': speedup, 'efficiency': speedup / workers,
+                     'nodes_per_sec': search.nodes_per_sec, 'same_moves': same, 'pool_start': warm})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parallel expectimax search.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    scaling_parser = commands.add_parser('scaling', help='time a fixed set of boards against the 1 process search')
+    scaling_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, WORKERS] if WORKERS > 2 else [1, 2])
+    scaling_parser.add_argument('--depth', type=int, default=3)
+    scaling_parser.add_argument('--boards', type=int, default=BENCH_BOARDS)
+    args = parser.parse_args(argv)
+
+    boards = bench_boards(args.boards)
+    print(f"{len(boards)} boards, depth {args.depth}, {os.cpu_count()} cpus")
+    scaling(args.workers, args.depth, boards)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import csv
+import json
+import time
+from collections import deque
+
+# Frame profiler with an on-screen overlay
+#
+# The game marks the phases of each frame with begin(name) / end(). While the
+# profiler is disabled those calls return straight away, so it can stay in the
+# game loop. While enabled, every frame and its phase spans go into a ring buffer
+# that can be written out as Chrome trace-event JSON (chrome://tracing, Perfetto)
+# or CSV.
+
+OVERLAY_COLOR = (255, 255, 255)  # Text color of the overlay
+OVERLAY_BACKGROUND = (0, 0, 0, 160)  # Translucent box behind the text
+OVERLAY_REFRESH = 0.25  # Seconds between two updates of the overlay text
+STATS_FRAMES = 120  # Frames the overlay statistics are taken over
+
+
+def percentile(values, fraction):  # Value below which fraction of the sorted values fall
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class FrameProfiler:
+    def __init__(self, capacity=3600, clock=time.perf_counter):
+        self.enabled = False  # Record frames and spans
+        self.overlay = False  # Draw the statistics on the screen
+        self.tracing = False  # Record until exit whatever the overlay does (--trace)
+        self.clock = clock
+        self.frames = deque(maxlen=capacity)  # (start, end, spans) of the last frames
+        self.frame_start = None
+        self.spans = []  # (name, start, end) of the running frame
+        self.stack = []  # (name, start) of the open phases
+        self.overlay_text = []
+        self.overlay_time = 0.0
+
+    def toggle(self):  # Show or hide the overlay, it records while shown, the frames so far are kept
+        self.overlay = not self.overlay
+        self.enabled = self.overlay or self.tracing
+
+    def start_trace(self):  # Record every frame from now on, for a dump at exit
+        self.tracing = self.enabled = True
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.frame_start = self.clock()
+        self.spans = []
+        self.stack = []
+
+    def end_frame(self):
+        if not self.enabled or self.frame_start is None:
+            return
+        self.frames.append((self.frame_start, self.clock(), self.spans))
+        self.frame_start = None
+
+    def begin(self, name):  # Open a phase of the running frame
+        if not self.enabled:
+            return
+        self.stack.append((name, self.clock()))
+
+    def end(self):  # Close the last opened phase
+        if not self.enabled or not self.stack:
+            return
+        name, start = self.stack.pop()
+        self.spans.append((name, start, self.clock()))
+
+    #fps, p50 and p99 frame time in ms and mean ms per phase over the last frames
+    def stats(self, count=STATS_FRAMES):
+        frames = list(self.frames)[-count:]
+        if len(frames) < 2:
+            return 0.0, 0.0, 0.0, {}
+        fps = (len(frames) - 1) / (frames[-1][0] - frames[0][0])
+        times = sorted((end - start) * 1000 for start, end, _ in frames)
+        phases = {}
+        for _, _, spans in frames:
+            for name, start, end in spans:
+                phases[name] = phases.get(name, 0.0) + (end - start) * 1000
+        return fps, percentile(times, 0.5), percentile(times, 0.99), {name: total / len(frames) for name, total in phases.items()}
+
+    def draw_overlay(self, window, font):  # Draw the statistics in the top left corner
+        import pygame
+        now = self.clock()
+        if now - self.overlay_time >= OVERLAY_REFRESH:  # Rendering text is slow, refresh it a few times a second
+            fps, p50, p99, phases = self.stats()
+            lines = [f"{fps:5.1f} fps  p50 {p50:5.2f} ms  p99 {p99:5.2f} ms"]
+            lines += [f"{name:<8} {ms:6.2f} ms" for name, ms in sorted(phases.items())]
+            self.overlay_text = [font.render(line, 1, OVERLAY_COLOR) for line in lines]
+            self.overlay_time = now
+        if not self.overlay_text:
+            return
+        width = max(text.get_width() for text in self.overlay_text) + 10
+        height = sum(text.get_height() for text in self.overlay_text) + 10
+        box = pygame.Surface((width, height), pygame.SRCALPHA)
+        box.fill(OVERLAY_BACKGROUND)
+        window.blit(box, (0, 0))
+        y = 5
+        for text in self.overlay_text:
+            window.blit(text, (5, y))
+            y += text.get_height()
+
+    def trace_events(self):  # Recorded frames as Chrome trace events, times in microseconds
+        events = []
+        for start, end, spans in self.frames:
+            events.append({'name': 'frame', 'ph': 'X', 'ts': start * 1e6, 'dur': (end - start) * 1e6, 'pid': 1, 'tid': 1})
+            for name, span_start, span_end in spans:
+                events.append({'name': name, 'ph': 'X', 'ts': span_start * 1e6, 'dur': (span_end - span_start) * 1e6,
+                               'pid': 1, 'tid': 1})
+        return events
+
+    def dump(self, path):  # Write the recorded frames, CSV for a .csv path and trace JSON otherwise
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['frame', 'phase', 'start_ms', 'duration_ms'])
+                for i, (start, end, spans) in enumerate(self.frames):
+                    writer.writerow([i, 'frame', f"{start * 1000:.3f}", f"{(end - start) * 1000:.3f}"])
+                    for name, span_start, span_end in spans:
+                        writer.writerow([i, name, f"{span_start * 1000:.3f}", f"{(span_end - span_start) * 1000:.3f}"])
+        else:
+            with open(path, 'w') as f:
+                json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,69 @@
+import pygame
+
+# Redraw only what changed
+#
+# The empty board and the grid lines never change, so they are drawn once into
+# two layers: the background and a grid with a color key, blitted over the
+# tiles. The scheduler remembers what the last full or partial frame showed
+# (tile values per cell and the hint) and gives back the screen rects that
+# differ for the next one: nothing when the board is unchanged, a few cells after
+# a move. Anything it cannot follow, like a menu drawn over the game or a window
+# expose, calls invalidate() and the next frame is drawn whole.
+
+COLORKEY = (255, 0, 255)  # Transparent color of the grid layer
+
+
+class RenderScheduler:
+    def __init__(self, cell_size, cols, background_color, draw_grid, hint_rect=None):
+        self.cell_size = cell_size  # (width, height) of one cell
+        self.cols = cols
+        self.background_color = background_color
+        self.draw_grid = draw_grid  # Draws the grid lines on a surface
+        self.hint_rect = hint_rect  # Screen rect the hint is drawn in
+        self.size = None  # Window size the layers were built for
+        self.background = None
+        self.grid = None
+        self.scene = None  # ({cell index: value}, hint) on screen, None when unknown
+
+    def layers(self, window):  # (background, grid) surfaces for the window, built on first use
+        if self.size != window.get_size():
+            self.size = window.get_size()
+            self.background = pygame.Surface(self.size).convert()
+            self.background.fill(self.background_color)
+            self.grid = pygame.Surface(self.size).convert()
+            self.grid.fill(COLORKEY)
+            self.grid.set_colorkey(COLORKEY)
+            self.draw_grid(self.grid)
+        return self.background, self.grid
+
+    def invalidate(self):  # The screen no longer shows the last frame
+        self.scene = None
+
+    def current(self):  # Whether the screen shows the settled frame last remembered
+        return self.scene is not None
+
+    def remember(self, tiles, hint):  # The frame just drawn shows these settled tiles
+        self.scene = ({index: tile.value for index, tile in tiles.items()}, hint)
+
+    #rects that changed since the last frame, None when the frame has to be drawn whole
+    def dirty_rects(self, tiles, hint):
+        if self.scene is None:
+            return None
+        cells, old_hint = self.scene
+        width, height = self.cell_size
+        rects = []
+        for index in cells.keys() | tiles.keys():
+            tile = tiles.get(index)
+            if cells.get(index) != (tile.value if tile is not None else None):
+                row, col = divmod(index, self.cols)
+                rects.append(pygame.Rect(col * width, row * height, width, height))
+        if hint != old_hint and self.hint_rect is not None:
+            rects.append(self.hint_rect)
+        return rects
+
+    def cells_in(self, rect):  # Cell indices touching a screen rect
+        width, height = self.cell_size
+        cols = range(max(0, rect.left // width), min(self.cols, (rect.right - 1) // width + 1))
+        for row in range(max(0, rect.top // height), (rect.bottom - 1) // height + 1):
+            for col in cols:
+                yield row * self.cols + col
@@ -0,0 +1,375 @@
+import argparse
+import os
+import random
+import struct
+import time
+import zlib
+from collections import namedtuple
+from multiprocessing import Pool
+
+import numpy as np
+
+import batch
+import engine
+from board import Board
+
+# Seeded games and compact .r2048 replay files
+#
+# A game is fully described by its seed and the moves that changed the board, so
+# a replay stores just those: 2 bits per move. A file is the magic bytes followed
+# by any number of records, each one a fixed header and the packed moves, which
+# lets writers append games and readers stream them one at a time. Verifying
+# replays 4x4 games in chunks with the NumPy batch engine and a vectorized copy
+# of SeededRNG, so the Python loop runs once per move index, not per move. The
+# parent only reads the record headers to cut every file into chunks of
+# BATCH_SIZE records, and the workers of a pool read and replay one chunk each,
+# so a single big file uses every core.
+#
+# Version 1 files come from before Board picked its spawn cells in index order.
+# Their 4x4 games replay the same, their other games cannot be replayed: they
+# are read with replayable False, verify skips them and new games are not
+# appended to such a file.
+#
+#   python -m replay verify games.r2048 --workers 1 2 4 8   # moves/sec of each pool size
+#   python -m replay record games.r2048 --games 1000 --policy greedy
+
+MAGIC = b'R2048\x02'
+OLD_MAGIC = b'R2048\x01'  # Version 1, see above
+RECORD_HEADER = struct.Struct('<QBBIQQ')  # seed, rows, cols, move count, score, final board key
+
+MASK64 = (1 << 64) - 1
+GAMMA = 0x9E3779B97F4A7C15
+MIX1 = 0xBF58476D1CE4E5B9
+MIX2 = 0x94D049BB133111EB
+BATCH_SIZE = 4096  # 4x4 records verified together
+
+# One game read from a replay file, moves holds 4 moves per byte
+Record = namedtuple('Record', 'seed rows cols count score final moves replayable', defaults=(True,))
+
+
+#counter based random numbers (SplitMix64), the whole state is the seed and a counter
+class SeededRNG:
+    def __init__(self, seed, counter=0):
+        self.seed = seed & MASK64
+        self.counter = counter
+
+    def next64(self):
+        self.counter += 1
+        z = (self.seed + self.counter * GAMMA) & MASK64
+        z = ((z ^ (z >> 30)) * MIX1) & MASK64
+        z = ((z ^ (z >> 27)) * MIX2) & MASK64
+        return z ^ (z >> 31)
+
+    def randrange(self, n):  # Integer in [0, n)
+        return (self.next64() * n) >> 64
+
+    def random(self):  # Float in [0, 1)
+        return (self.next64() >> 11) * (1.0 / (1 << 53))
+
+    def choice(self, seq):
+        return seq[self.randrange(len(seq))]
+
+    def getstate(self):
+        return self.seed, self.counter
+
+    def setstate(self, state):
+        self.seed, self.counter = state
+
+
+def board_key(board):  # 64 bit fingerprint of a Board, the packing itself for 4x4
+    if board.packed is not None:
+        return board.packed
+    data = bytes(board.cells) if board.max_exp < 256 else str(board.cells).encode()
+    return zlib.crc32(data) | len(board) << 32
+
+
+def pack_moves(moves):  # Directions (0-3) to bytes, 4 per byte
+    data = bytearray((len(moves) + 3) // 4)
+    for i, direction in enumerate(moves):
+        data[i >> 2] |= direction << ((i & 3) * 2)
+    return bytes(data)
+
+
+def unpack_moves(data, count):  # Bytes back to a list of directions
+    return [(data[i >> 2] >> ((i & 3) * 2)) & 3 for i in range(count)]
+
+
+def new_board(seed, rows=engine.ROWS, cols=engine.COL):  # Board of a seeded game after its two starting tiles
+    board = Board(rows, cols, SeededRNG(seed))
+    for _ in range(2):
+        board.set(board.random_free(), 1)
+    return board
+
+
+#collects the moves of one game
+class Recorder:
+    def __init__(self, seed, board):
+        self.seed = seed
+        self.board = board
+        self.moves = []
+        self.saved = False
+
+    def add(self, direction):  # A move that changed the board
+        self.moves.append(direction)
+
+    def record(self):
+        board = self.board
+        return Record(self.seed, board.rows, board.cols, len(self.moves), board.score,
+                      board_key(board), pack_moves(self.moves))
+
+    def save(self, path):  # Append the game to a replay file, once
+        if self.saved or not self.moves:
+            return
+        with open_writer(path) as f:
+            write_record(f, self.record())
+        self.saved = True
+
+
+def can_append(path):  # Whether new games can go to path: no file yet or a file of this version
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return True
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_writer(path):  # Open a replay file for appending, writing the magic for a new file
+    if not can_append(path):
+        raise ValueError(f"{path} is not a version {MAGIC[-1]} .r2048 file, record into a new one")
+    f = open(path, 'ab')
+    if f.tell() == 0:
+        f.write(MAGIC)
+    return f
+
+
+def write_record(f, record):
+    f.write(RECORD_HEADER.pack(record.seed, record.rows, record.cols, record.count, record.score, record.final))
+    f.write(record.moves)
+
+
+#stream the records of a replay file without loading the whole file, or limit
+#records from a byte offset that chunks() gave
+def read_records(path, offset=None, limit=None):
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+        if magic not in (MAGIC, OLD_MAGIC):
+            raise ValueError(f"{path} is not a .r2048 replay file")
+        if offset is not None:
+            f.seek(offset)
+        while limit is None or limit > 0:
+            if limit is not None:
+                limit -= 1
+            header = f.read(RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) < RECORD_HEADER.size:
+                raise ValueError(f"{path} ends in the middle of a record")
+            seed, rows, cols, count, score, final = RECORD_HEADER.unpack(header)
+            moves = f.read((count + 3) // 4)
+            yield Record(seed, rows, cols, count, score, final, moves,
+                         magic == MAGIC or (rows, cols) == (engine.ROWS, engine.COL))
+
+
+#replay a record, returns (final board key, score, whether it matches the record)
+def replay(record):
+    if (record.rows, record.cols) == (engine.ROWS, engine.COL):
+        moves = unpack_moves(record.moves, record.count)
+        rng = SeededRNG(record.seed)
+        board = engine.new_board(rng)
+        score = 0
+        ok = True
+        for direction in moves:
+            board, gained, moved = engine.move(board, direction)
+            if not moved:  # Recorded moves always change the board
+                ok = False
+                break
+            board = engine.spawn(board, rng)
+            score += gained
+        return board, score, ok and board == record.final and score == record.score
+
+    board = new_board(record.seed, record.rows, record.cols)
+    ok = True
+    for direction in unpack_moves(record.moves, record.count):
+        _, moved, _ = board.move(direction, with_paths=False)
+        if not moved:
+            ok = False
+            break
+        board.spawn()
+    key = board_key(board)
+    return key, board.score, ok and key == record.final and board.score == record.score
+
+
+#SeededRNG.next64 for arrays of seeds and counters, counters are advanced in place
+def next64_batch(seeds, counters, index):
+    counters[index] += np.uint64(1)
+    z = seeds[index] + counters[index] * np.uint64(GAMMA)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(MIX1)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(MIX2)
+    return z ^ (z >> np.uint64(31))
+
+
+def randrange_batch(seeds, counters, index, n):  # SeededRNG.randrange for arrays, n below 2 ** 32
+    z = next64_batch(seeds, counters, index)
+    n = np.asarray(n, dtype=np.uint64)
+    high = z >> np.uint64(32)
+    low = z & np.uint64(0xFFFFFFFF)
+    return (high * n + ((low * n) >> np.uint64(32))) >> np.uint64(32)  # (z * n) >> 64 without overflow
+
+
+def spawn_batch(boards, seeds, counters, index, exps=None):  # engine.spawn for the boards at index
+    empty = batch.cells(boards[index]) == 0
+    picks = randrange_batch(seeds, counters, index, empty.sum(axis=1)).astype(np.int64)
+    cells = np.argmax(np.cumsum(empty, axis=1) > picks[:, None], axis=1).astype(np.uint64)
+    if exps is None:
+        exps = batch.SPAWN_EXPONENTS[randrange_batch(seeds, counters, index, len(batch.SPAWN_EXPONENTS)).astype(np.intp)]
+    boards[index] |= exps << (cells * np.uint64(4))
+
+
+#replay many 4x4 records at once, returns a mask of the records that match
+#
+#observe(moves played, index, boards) is called after every move with the
+#games that made it and the boards of all games
+def replay_batch(records, observe=None):
+    size = len(records)
+    seeds = np.array([record.seed for record in records], dtype=np.uint64)
+    counts = np.array([record.count for record in records], dtype=np.int64)
+    finals = np.array([record.final for record in records], dtype=np.uint64)
+    scores = np.array([record.score for record in records], dtype=np.int64)
+    width = max(1, max(len(record.moves) for record in records))
+    moves = np.zeros((size, width), dtype=np.uint8)
+    for i, record in enumerate(records):
+        moves[i, :len(record.moves)] = np.frombuffer(record.moves, dtype=np.uint8)
+
+    counters = np.zeros(size, dtype=np.uint64)
+    boards = np.zeros(size, dtype=np.uint64)
+    everyone = np.arange(size)
+    for _ in range(2):  # Starting tiles, like engine.new_board
+        spawn_batch(boards, seeds, counters, everyone, np.ones(size, dtype=np.uint64))
+
+    score = np.zeros(size, dtype=np.int64)
+    ok = np.ones(size, dtype=bool)
+    for step in range(int(counts.max()) if size else 0):
+        index = np.nonzero((step < counts) & ok)[0]
+        if not len(index):
+            break
+        directions = (moves[index, step >> 2] >> ((step & 3) * 2)) & 3
+        new, gained, moved = batch.move(boards[index], directions)
+        ok[index[~moved]] = False  # Recorded moves always change the board
+        index = index[moved]
+        boards[index] = new[moved]
+        score[index] += gained[moved]
+        spawn_batch(boards, seeds, counters, index)
+        if observe is not None:
+            observe(step + 1, index, boards)
+    return ok & (boards == finals) & (score == scores)
+
+
+def chunks(path, size=BATCH_SIZE):  # (path, byte offset, records) of every size records, from the headers alone
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) not in (MAGIC, OLD_MAGIC):
+            raise ValueError(f"{path} is not a .r2048 replay file")
+        offset = f.tell()
+        records = 0
+        while True:
+            start = f.tell()
+            header = f.read(RECORD_HEADER.size)
+            if not header:
+                break
+            if records == size:
+                yield path, offset, records
+                offset = start
+                records = 0
+            records += 1
+            if len(header) < RECORD_HEADER.size:  # read_records reports the cut record
+                break
+            f.seek((RECORD_HEADER.unpack(header)[3] + 3) // 4, os.SEEK_CUR)
+        if records:
+            yield path, offset, records
+
+
+def verify_chunk(task):  # (games, moves, mismatching games, games that cannot be replayed) of one chunk
+    path, offset, limit = task
+    games = moves = bad = skipped = 0
+    packed = []
+    for record in read_records(path, offset, limit):
+        games += 1
+        if not record.replayable:
+            skipped += 1
+            continue
+        moves += record.count
+        if (record.rows, record.cols) == (engine.ROWS, engine.COL):
+            packed.append(record)
+        elif not replay(record)[2]:
+            bad += 1
+    if packed:
+        bad += int((~replay_batch(packed)).sum())
+    return games, moves, bad, skipped
+
+
+#verify the chunks of many files in parallel, returns (games, moves, mismatching games, skipped games, seconds)
+def verify(paths, workers=None):
+    start = time.perf_counter()
+    tasks = (task for path in paths for task in chunks(path))
+    workers = workers or os.cpu_count() or 1
+    totals = []
+    if workers == 1:
+        totals = [verify_chunk(task) for task in tasks]
+    else:
+        with Pool(workers) as pool:
+            totals = list(pool.imap_unordered(verify_chunk, tasks))
+    games, moves, bad, skipped = (sum(column) for column in zip(*totals)) if totals else (0, 0, 0, 0)
+    return games, moves, bad, skipped, time.perf_counter() - start
+
+
+#play seeded headless games with a selfplay policy and append them to a file
+def record_games(path, games, policy_name='greedy', seed=0, depth=1, weights=None):
+    import selfplay
+    policy = selfplay.make_policy(policy_name, depth, weights)
+    policy_rng = random.Random(seed)  # Kept apart from the spawn RNG so replays do not need the policy
+    with open_writer(path) as f:
+        for game in range(games):
+            game_seed = (seed * 1000003 + game) & MASK64
+            board = new_board(game_seed)
+            recorder = Recorder(game_seed, board)
+            while not board.has_won():
+                direction = policy(board.packed, policy_rng)
+                if direction is None:
+                    break
+                board.move(direction, with_paths=False)
+                board.spawn()
+                recorder.add(direction)
+            write_record(f, recorder.record())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record and verify .r2048 replay files.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    check = commands.add_parser('verify', help='replay every game and compare its final board and score')
+    check.add_argument('paths', nargs='+')
+    check.add_argument('--workers', type=int, nargs='+', default=[os.cpu_count()],
+                       help='pool sizes to verify with, each one prints its own throughput')
+    make = commands.add_parser('record', help='append headless self-play games to a replay file')
+    make.add_argument('path')
+    make.add_argument('--games', type=int, default=100)
+    make.add_argument('--policy', default='greedy')
+    make.add_argument('--depth', type=int, default=1)
+    make.add_argument('--seed', type=int, default=0)
+    make.add_argument('--weights', help='checkpoint of the ntuple policy')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        record_games(args.path, args.games, args.policy, args.seed, args.depth, args.weights)
+        return
+
+    for workers in args.workers:
+        games, moves, bad, skipped, elapsed = verify(args.paths, workers)
+        rate = moves / elapsed if elapsed else 0.0
+        print(f"{workers} workers: {games} games, {moves} moves in {elapsed:.2f}s ({rate:,.0f} moves/sec, "
+              f"{rate / workers:,.0f} per worker), {bad} mismatches")
+    if skipped:
+        print(f"{skipped} games skipped: non-4x4 games of version 1 files, recorded with another spawn order")
+    if bad:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import argparse
+import os
+import random
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+import ai
+import engine
+import ntuple
+
+# Headless self-play across a process pool
+#
+#   python -m selfplay --games 1000000 --workers 8 --policy greedy
+#
+# Workers write one record per game straight into a shared memory array, so the
+# parent only receives chunk counts back and reads the results without copies.
+
+RESULT_DTYPE = np.dtype([
+    ('score', '<i8'),  # Final score
+    ('max_tile', '<i4'),  # Value of the biggest tile
+    ('moves', '<i4'),  # Moves that changed the board
+    ('won', '?'),  # Whether check_win fired
+])
+
+
+def random_policy(board, rng):  # Any move that changes the board
+    moves = [d for d in range(4) if engine.move(board, d)[2]]
+    return rng.choice(moves) if moves else None
+
+
+def greedy_policy(board, rng):  # Move with the best heuristic one ply ahead
+    best = None
+    best_value = None
+    for direction in range(4):
+        new, _, moved = engine.move(board, direction)
+        if moved:
+            value = ai.evaluate(new)
+            if best_value is None or value > best_value:
+                best, best_value = direction, value
+    return best
+
+
+#fixed-depth expectimax, time budget off so results do not depend on machine load
+class ExpectimaxPolicy:
+    def __init__(self, depth=1):
+        self.search = ai.Expectimax(max_depth=depth, time_budget=None)
+
+    def __call__(self, board, rng):
+        return self.search.best_move(board)
+
+
+POLICIES = {
+    'random': random_policy,
+    'greedy': greedy_policy,
+    'expectimax': ExpectimaxPolicy,
+    'ntuple': ntuple.NTuplePolicy,  # Plays the checkpoint given as weights, memory mapped
+}
+
+
+def make_policy(name, depth=1, weights=None):  # Build the policy callable for a name in POLICIES
+    policy = POLICIES[name]
+    if policy is ntuple.NTuplePolicy:
+        return policy(weights or ntuple.CHECKPOINT)
+    if isinstance(policy, type):
+        return policy(depth)
+    return policy
+
+
+#play one game until it is lost or check_win fires
+def play_game(policy, rng):
+    board = engine.new_board(rng)
+    score = 0
+    moves = 0
+    while True:
+        direction = policy(board, rng)
+        if direction is None:  # No move changes the board, the game is lost
+            return score, 1 << engine.max_exponent(board), moves, False
+        board, gained, _ = engine.step(board, direction, rng)
+        score += gained
+        moves += 1
+        if engine.has_won(board):
+            return score, 1 << engine.max_exponent(board), moves, True
+
+
+# Per-worker state set up by init_worker
+WORKER = {}
+
+
+def init_worker(shm_name, games, policy_name, depth, weights):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    WORKER['shm'] = shm  # Keep the mapping alive for the life of the worker
+    WORKER['results'] = np.ndarray(games, dtype=RESULT_DTYPE, buffer=shm.buf)
+    WORKER['policy'] = make_policy(policy_name, depth, weights)
+
+
+def run_chunk(task):  # Play games [start, stop) and store their records
+    start, stop, seed = task
+    results = WORKER['results']
+    policy = WORKER['policy']
+    rng = random.Random(seed)
+    for i in range(start, stop):
+        results[i] = play_game(policy, rng)
+    return stop - start
+
+
+#play the games on a pool and return a copy of the results
+def run(games, workers=None, policy='random', depth=1, seed=0, chunk_size=None, report_every=5.0, log=print,
+        weights=None):
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, min(1000, games // (workers * 8) or 1))
+    tasks = [(start, min(start + chunk_size, games), seed * 1000003 + start)
+             for start in range(0, games, chunk_size)]
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, games * RESULT_DTYPE.itemsize))
+    try:
+        results = np.ndarray(games, dtype=RESULT_DTYPE, buffer=shm.buf)
+        results[:] = 0
+        start_time = time.perf_counter()
+        last_report = start_time
+        done = 0
+        with Pool(workers, initializer=init_worker, initargs=(shm.name, games, policy, depth, weights)) as pool:
+            for count in pool.imap_unordered(run_chunk, tasks):
+                done += count
+                now = time.perf_counter()
+                if log and now - last_report >= report_every:
+                    log(f"{done}/{games} games, {done / (now - start_time):,.0f} games/sec")
+                    last_report = now
+        elapsed = time.perf_counter() - start_time
+        if log:
+            log(f"{games} games in {elapsed:.1f}s, {games / elapsed if elapsed else 0:,.0f} games/sec")
+        output = results.copy()
+        del results
+    finally:
+        shm.close()
+        shm.unlink()
+    return output
+
+
+def summary(results):  # Aggregate statistics of a results array
+    tiles, counts = np.unique(results['max_tile'], return_counts=True)
+    return {
+        'games': int(len(results)),
+        'mean_score': float(results['score'].mean()) if len(results) else 0.0,
+        'mean_moves': float(results['moves'].mean()) if len(results) else 0.0,
+        'win_rate': float(results['won'].mean()) if len(results) else 0.0,
+        'max_tile': {int(tile): int(count) for tile, count in zip(tiles, counts)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run headless 2048 games across processes.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random')
+    parser.add_argument('--depth', type=int, default=1, help='search depth of the expectimax policy')
+    parser.add_argument('--weights', help='checkpoint of the ntuple policy (default weights.n2048)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--report-every', type=float, default=5.0, help='seconds between progress lines')
+    parser.add_argument('--out', help='save the per-game results to this .npy file')
+    args = parser.parse_args(argv)
+
+    results = run(args.games, args.workers, args.policy, args.depth, args.seed, report_every=args.report_every,
+                  weights=args.weights)
+    if args.out:
+        np.save(args.out, results)
+    stats = summary(results)
+    print(f"mean score {stats['mean_score']:.0f}, mean moves {stats['mean_moves']:.0f}, win rate {stats['win_rate']:.2%}")
+    for tile, count in stats['max_tile'].items():
+        print(f"  {tile:>6}: {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import json
+import random
+import socket
+import time
+
+import engine
+import perf
+import replay
+from board import Board
+
+# Game server: many 4x4 sessions against one copy of the rules
+#
+#   python -m server serve --port 2048          # or --unix /tmp/2048.sock
+#   python -m server load --players 1000 --moves 200
+#   python main.py --connect localhost:2048     # the pygame window as a thin client
+#
+# The protocol is one JSON object per line in each direction, answered in order.
+# A connection plays one game at a time:
+#   {"op": "new", "seed": 5}    -> {"op": "board", "cells": [16 exponents], "score": 0, "seed": 5}
+#   {"op": "move", "dir": "up"} -> {"op": "delta", "moved": true, "cells": [[index, exponent], ...],
+#                                   "spawn": [index, exponent], "gained": 4, "score": 12, "state": "continue"}
+#   {"op": "state"}             -> the "board" reply for the running game
+# cells of a delta are the cells the move changed before the spawn, and state is
+# "continue", "lost" or "won" like the results of move_tiles and check_win. Bad
+# requests get {"op": "error", "error": "..."} and the connection stays open.
+#
+# A session is the packed board, the score and the (seed, counter) state of its
+# SeededRNG, a few dozen bytes, so a server holds thousands of them easily.
+
+MAX_LINE = 4096  # Longest request line accepted
+BACKLOG = 1024  # Pending connections, the load generator opens many at once
+
+
+#one game of one connection
+class Session:
+    __slots__ = ('board', 'rng', 'score', 'moves', 'state')
+
+    def __init__(self, seed):
+        self.rng = replay.SeededRNG(seed)
+        self.board = engine.new_board(self.rng)  # Same start as replay.new_board, so the game can be replayed
+        self.score = 0
+        self.moves = 0
+        self.state = "continue"
+
+    #play a move like move_tiles, returns (moved, changed cells, spawn, score gained)
+    def move(self, direction):
+        old = self.board
+        new, gained, moved = engine.move(old, direction)
+        if not moved:
+            if engine.is_lost(old):
+                self.state = "lost"
+            return False, [], None, 0
+        changed = [[index, (new >> (4 * index)) & 0xF] for index in range(engine.CELLS)
+                   if ((old ^ new) >> (4 * index)) & 0xF]
+        self.score += gained
+        self.moves += 1
+        spawn = engine.spawn_cell(new, self.rng)
+        if spawn is not None:
+            index, exp = spawn
+            new |= exp << (4 * index)
+            spawn = [index, exp]
+        self.board = new
+        if engine.has_won(new):
+            self.state = "won"
+        elif engine.is_lost(new):
+            self.state = "lost"
+        return True, changed, spawn, gained
+
+    def snapshot(self):
+        return {'op': 'board', 'cells': [(self.board >> (4 * i)) & 0xF for i in range(engine.CELLS)],
+                'score': self.score, 'seed': self.rng.seed, 'state': self.state}
+
+
+#all sessions of a server
+class GameServer:
+    def __init__(self):
+        self.sessions = {}  # Connection number -> Session
+        self.connections = 0
+        self.requests = 0
+
+    def handle(self, key, request):  # Answer one request of a connection
+        op = request.get('op')
+        session = self.sessions.get(key)
+        if op == 'new':
+            seed = request.get('seed')
+            if seed is None:
+                seed = random.getrandbits(64)
+            session = self.sessions[key] = Session(int(seed))
+            return session.snapshot()
+        if session is None:
+            return {'op': 'error', 'error': 'no game, send {"op": "new"} first'}
+        if op == 'state':
+            return session.snapshot()
+        if op == 'move':
+            direction = engine.DIRECTIONS.get(request.get('dir'))
+            if direction is None:
+                return {'op': 'error', 'error': f"unknown direction: {request.get('dir')!r}"}
+            if session.state != "continue":
+                return {'op': 'error', 'error': f"the game is {session.state}, send {{\"op\": \"new\"}}"}
+            moved, changed, spawn, gained = session.move(direction)
+            return {'op': 'delta', 'moved': moved, 'cells': changed, 'spawn': spawn, 'gained': gained,
+                    'score': session.score, 'state': session.state}
+        return {'op': 'error', 'error': f"unknown op: {op!r}"}
+
+    async def serve_client(self, reader, writer):
+        self.connections += 1
+        key = self.connections
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):  # Line over MAX_LINE or the client went away
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    reply = self.handle(key, request) if isinstance(request, dict) else {'op': 'error', 'error': 'expected an object'}
+                except (ValueError, TypeError) as error:
+                    reply = {'op': 'error', 'error': str(error)}
+                self.requests += 1
+                writer.write(json.dumps(reply, separators=(',', ':')).encode() + b'\n')
+                await writer.drain()
+        finally:
+            self.sessions.pop(key, None)
+            writer.close()
+
+
+async def serve(host='127.0.0.1', port=2048, unix=None, log=print):
+    game = GameServer()
+    if unix:
+        server = await asyncio.start_unix_server(game.serve_client, unix, limit=MAX_LINE, backlog=BACKLOG)
+    else:
+        server = await asyncio.start_server(game.serve_client, host, port, limit=MAX_LINE, backlog=BACKLOG)
+    if log:
+        log(f"serving on {unix or f'{host}:{port}'}")
+    async with server:
+        await server.serve_forever()
+
+
+async def open_connection(host, port, unix):
+    if unix:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+
+#one simulated player: new games and random moves, appending the latency of every request
+async def play(host, port, unix, moves, latencies, seed):
+    reader, writer = await open_connection(host, port, unix)
+    rng = random.Random(seed)
+    try:
+        async def request(message):
+            start = time.perf_counter()
+            writer.write(json.dumps(message).encode() + b'\n')
+            reply = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            return reply
+
+        reply = await request({'op': 'new', 'seed': seed})
+        for _ in range(moves):
+            if reply.get('state', "continue") != "continue":
+                reply = await request({'op': 'new'})
+                continue
+            reply = await request({'op': 'move', 'dir': rng.choice(engine.DIRECTION_NAMES)})
+    finally:
+        writer.close()
+
+
+#run players concurrent players, returns (requests, seconds, latencies in ms sorted)
+async def load(host='127.0.0.1', port=2048, unix=None, players=100, moves=100, seed=0):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(play(host, port, unix, moves, latencies, seed * 1000003 + i) for i in range(players)))
+    elapsed = time.perf_counter() - start
+    return len(latencies), elapsed, sorted(latency * 1000 for latency in latencies)
+
+
+#blocking client connection for "host:port" or a Unix socket path
+class Connection:
+    def __init__(self, address):
+        if ':' in address:
+            host, port = address.rsplit(':', 1)
+            self.sock = socket.create_connection((host, int(port)))
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(address)
+        self.lines = self.sock.makefile('rb')
+
+    def request(self, message):  # Send one request and wait for its reply
+        self.sock.sendall(json.dumps(message).encode() + b'\n')
+        reply = json.loads(self.lines.readline())
+        if reply.get('op') == 'error':
+            raise RuntimeError(reply['error'])
+        return reply
+
+    def close(self):
+        self.lines.close()
+        self.sock.close()
+
+
+#board of a game played on a server
+#
+#it stands in for Board in main.py: move() asks the server, applies the changed
+#cells and keeps the spawn for the following spawn() call, like end_move expects
+class RemoteBoard(Board):
+    def __init__(self, connection, seed=None):
+        super().__init__(engine.ROWS, engine.COL)
+        self.connection = connection
+        self.pending = None  # Spawn of the last move, placed by spawn()
+        self.state = "continue"
+        reply = connection.request({'op': 'new', 'seed': seed})
+        self.seed = reply['seed']
+        for index, exp in enumerate(reply['cells']):
+            self.set(index, exp)
+
+    def move(self, direction, with_paths=True):
+        old = self.packed
+        paths = []
+        if self.state != "continue":  # The server refuses moves once the game is over
+            return 0, False, paths
+        reply = self.connection.request({'op': 'move', 'dir': engine.DIRECTION_NAMES[direction]})
+        self.state = reply['state']
+        if not reply['moved']:
+            return 0, False, paths
+        if with_paths:
+            paths = [(row * self.cols + col, new_row * self.cols + new_col, merged)
+                     for (row, col), (new_row, new_col), merged in engine.transitions(old, direction)]
+        for index, exp in reply['cells']:
+            self.set(index, exp)
+        self.pending = reply['spawn']
+        self.score = reply['score']
+        self.moves += 1
+        return reply['gained'], True, paths
+
+    def spawn(self, rng=None):  # The tile the server added after the last move
+        spawn, self.pending = self.pending, None
+        if spawn is None:
+            return None
+        index, exp = spawn
+        self.set(index, exp)
+        return index, exp
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve 2048 games over line-delimited JSON, or load test a server.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('serve', 'run the game server'), ('load', 'simulate concurrent players against a server')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=2048)
+        command.add_argument('--unix', metavar='PATH', help='use a Unix socket instead of TCP')
+    load_parser = commands.choices['load']
+    load_parser.add_argument('--players', type=int, default=100)
+    load_parser.add_argument('--moves', type=int, default=100, help='requests per player')
+    load_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    count, elapsed, latencies = asyncio.run(load(args.host, args.port, args.unix, args.players, args.moves, args.seed))
+    print(f"{args.players} players, {count} requests in {elapsed:.2f}s ({count / elapsed:,.0f} requests/sec)")
+    print(f"latency ms: p50 {perf.percentile(latencies, 0.5):.2f}  p90 {perf.percentile(latencies, 0.9):.2f}  "
+          f"p99 {perf.percentile(latencies, 0.99):.2f}  max {latencies[-1] if latencies else 0:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+import argparse
+import os
+import shutil
+import struct
+import sys
+import time
+
+import numpy as np
+
+import engine
+from board import Board
+
+# Exact solution of small boards: the best move of every reachable position
+#
+#   python -m solver solve --rows 3 --cols 3 --target 512 --out 3x3_512.s2048
+#   python -m solver solve --rows 3 --cols 3 --target 512 --work /scratch/layers
+#   python main.py --strategy 3x3_512.s2048     # with ROWS = COL = 3 in view.py, then 'P'
+#
+# A position packs the exponent of cell i into bits 4 * i of an integer, like
+# engine.py does for 4x4, so boards up to 16 cells fit in a uint64. The rules are
+# main.py's: a game starts with two 2 tiles, a move that changes the board spawns
+# a 2 or a 4 (even odds) on a uniformly picked empty cell, and the game is won as
+# soon as a tile reaches the target, lost when no move changes the board.
+#
+# Every move adds 2 or 4 to the sum of the tiles and merges keep it, so the
+# positions split into layers by tile sum and a position only leads to the two
+# layers above its own. The forward pass builds every layer, from the starting
+# positions up, as a sorted array of unique positions. The backward pass walks the
+# layers down: the chance of a move is 1 when it makes the target tile, otherwise
+# the mean over its spawns of the chances in the layers above, found with
+# searchsorted. The best move and its chance are kept for every position. At any
+# time only three layers are needed, so with --work the layers live in .npy files
+# and are memory mapped when used.
+#
+# The result is an open addressing hash table (positions, moves, chances) written
+# like the n-tuple checkpoints: a header, then arrays that StrategyTable.load
+# memory maps, so looking up a position is a hash and a probe or two.
+
+MAGIC = b'S2048\x01'
+HEADER = struct.Struct('<BBBxQQd')  # Rows, cols, target exponent, positions, slots, chance from the start
+ALIGN = 64  # Arrays start on a multiple of this
+NO_MOVE = 255  # Move of a lost position
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15  # Fibonacci hashing
+CHUNK = 1 << 20  # Positions processed at once
+MAX_CELLS = 16  # 4 bits per cell in a uint64
+NIBBLE = np.uint64(0xF)
+
+
+def peak_memory():  # Peak resident memory of this process in bytes, None where it cannot be read
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Bytes on macOS, KiB elsewhere
+
+
+def slide_table(length):  # Every line of 4 bit exponents slid towards index 0
+    table = np.zeros(16 ** length, dtype=np.uint64)
+    for code in range(16 ** length):
+        line = [(code >> (4 * i)) & 0xF for i in range(length)]
+        out, _, _ = engine.slide_line(line, limit=None)
+        table[code] = sum(exp << (4 * i) for i, exp in enumerate(out))
+    return table
+
+
+#moves, spawns and the win check of a rows x cols board on uint64 arrays
+class Rules:
+    def __init__(self, rows, cols, target):
+        if rows * cols > MAX_CELLS:
+            raise ValueError(f"a {rows}x{cols} board does not fit in 64 bits")
+        if not 3 <= target <= engine.MAX_EXPONENT:
+            raise ValueError(f"the target must be a tile from 8 to {1 << engine.MAX_EXPONENT}")
+        self.rows = rows
+        self.cols = cols
+        self.target = target  # Exponent that wins
+        self.shifts = [np.uint64(4 * index) for index in range(rows * cols)]
+        tables = {length: slide_table(length) for length in {rows, cols}}
+        board = Board(rows, cols)
+        # Per direction: (table, shifts of the cells of every line, from the side tiles move to)
+        self.lines = [[(tables[len(line)], [self.shifts[index] for index in line]) for line in board.lines[direction]]
+                      for direction in range(4)]
+
+    def move(self, boards, direction):  # Boards after the move, unchanged when it does not move
+        new = np.zeros_like(boards)
+        for table, shifts in self.lines[direction]:
+            code = np.zeros_like(boards)
+            for i, shift in enumerate(shifts):
+                code |= ((boards >> shift) & NIBBLE) << np.uint64(4 * i)
+            out = table[code.astype(np.intp)]
+            for i, shift in enumerate(shifts):
+                new |= ((out >> np.uint64(4 * i)) & NIBBLE) << shift
+        return new
+
+    def won(self, boards):  # Whether a tile reached the target
+        result = np.zeros(len(boards), dtype=bool)
+        for shift in self.shifts:
+            result |= ((boards >> shift) & NIBBLE) >= self.target
+        return result
+
+    def empty(self, boards, shift):  # Whether the cell at shift is empty
+        return ((boards >> shift) & NIBBLE) == 0
+
+    def starts(self):  # Every start with two 2 tiles, all equally likely
+        cells = self.rows * self.cols
+        return np.array(sorted((1 << (4 * a)) | (1 << (4 * b)) for a in range(cells) for b in range(a + 1, cells)),
+                        dtype=np.uint64)
+
+    #positions after a 2 and after a 4 spawned on the moves of boards that did not win
+    def successors(self, boards):
+        afters = np.unique(np.concatenate([new[new != boards] for new in (self.move(boards, d) for d in range(4))]))
+        afters = afters[~self.won(afters)]
+        twos, fours = [], []
+        for shift in self.shifts:
+            free = afters[self.empty(afters, shift)]
+            twos.append(free | (np.uint64(1) << shift))
+            fours.append(free | (np.uint64(2) << shift))
+        return np.unique(np.concatenate(twos)), np.unique(np.concatenate(fours))
+
+
+#named arrays in memory, or in .npy files memory mapped when read
+class LayerStore:
+    def __init__(self, folder=None):
+        self.folder = folder
+        self.arrays = {}
+
+    def path(self, name):
+        return os.path.join(self.folder, name + '.npy')
+
+    def put(self, name, array):
+        if self.folder is None:
+            self.arrays[name] = array
+        else:
+            np.save(self.path(name), array)
+
+    def has(self, name):
+        return name in self.arrays if self.folder is None else os.path.exists(self.path(name))
+
+    def get(self, name):
+        if self.folder is None:
+            return self.arrays[name]
+        return np.load(self.path(name), mmap_mode='r')
+
+    def drop(self, name):
+        if self.folder is None:
+            self.arrays.pop(name, None)
+        elif os.path.exists(self.path(name)):
+            os.remove(self.path(name))
+
+
+def table_slots(count):  # Power of two keeping the table at most 3/4 full
+    return 1 << max(4, (count * 4 // 3).bit_length())
+
+
+def hash_slots(keys, bits):
+    product = keys * np.uint64(HASH_MULTIPLIER)  # Wraps around, as the hash wants
+    return (product >> np.uint64(64 - bits)).astype(np.intp)
+
+
+#put new keys into an open addressing table in place, linear probing, returns their slots
+def insert(table_keys, keys, bits):
+    mask = (1 << bits) - 1
+    result = np.empty(len(keys), dtype=np.intp)
+    left = np.arange(len(keys))  # Keys not placed yet
+    slots = hash_slots(keys, bits)
+    while len(left):
+        free = table_keys[slots] == 0
+        # One key per free slot this round, the others probe on
+        unique, first = np.unique(slots[free], return_index=True)
+        placed = np.flatnonzero(free)[first]
+        table_keys[unique] = keys[left[placed]]
+        result[left[placed]] = unique
+        keep = np.ones(len(left), dtype=bool)
+        keep[placed] = False
+        left = left[keep]
+        slots = (slots[keep] + 1) & mask
+    return result
+
+
+#solve a board to the target tile, writes the table and returns a report dict
+def solve(rows, cols, target, path, work=None, log=print):
+    rules = Rules(rows, cols, target)
+    store = LayerStore(os.path.join(work, 'layers') if work else None)
+    if store.folder is not None:
+        os.makedirs(store.folder, exist_ok=True)
+    start = time.perf_counter()
+
+    # Forward: every reachable layer, by tile sum
+    pending = {4: [rules.starts()]}
+    sums = []
+    count = 0
+    while pending:
+        total = min(pending)
+        layer = np.unique(np.concatenate(pending.pop(total)))
+        store.put(f'states_{total}', layer)
+        sums.append(total)
+        count += len(layer)
+        for begin in range(0, len(layer), CHUNK):
+            twos, fours = rules.successors(np.asarray(layer[begin:begin + CHUNK]))
+            for gained, found in ((2, twos), (4, fours)):
+                if len(found):
+                    pending.setdefault(total + gained, []).append(found)
+        for later in pending.values():  # Merge the chunks so duplicates do not pile up
+            if len(later) > 1:
+                later[:] = [np.unique(np.concatenate(later))]
+    forward = time.perf_counter() - start
+    log(f"{count:,} positions in {len(sums)} layers, {count / forward:,.0f} positions/s")
+
+    # Backward: best move and chance of every position, into the table file
+    bits = table_slots(count).bit_length() - 1
+    slots = 1 << bits
+    offsets = table_offsets(rows * cols, slots)
+    with open(path + '.tmp', 'wb') as f:
+        f.truncate(offsets[-1])
+    table = np.memmap(path + '.tmp', mode='r+')
+    keys = table[offsets[0]:offsets[1]].view('<u8')
+    moves = table[offsets[1]:offsets[2]]
+    chances = table[offsets[2]:offsets[3]].view('<f4')
+    moves[:] = NO_MOVE
+
+    backward_start = time.perf_counter()
+    for total in reversed(sums):
+        layer = store.get(f'states_{total}')
+        above = {gained: (store.get(f'states_{total + gained}'), store.get(f'chances_{total + gained}'))
+                 for gained in (2, 4) if store.has(f'states_{total + gained}')}
+        best_chances = np.empty(len(layer), dtype=np.float64)
+        for begin in range(0, len(layer), CHUNK):
+            boards = np.asarray(layer[begin:begin + CHUNK])
+            afters = np.stack([rules.move(boards, direction) for direction in range(4)])
+            moved = afters != boards
+            # Many positions share a board after their move, work out each one once
+            unique, inverse = np.unique(afters[moved], return_inverse=True)
+            move_chance = np.full(afters.shape, -1.0)
+            move_chance[moved] = move_chances(rules, unique, above)[inverse]
+            best = np.full(len(boards), -1.0)
+            best_move = np.full(len(boards), NO_MOVE, dtype=np.uint8)
+            for direction, chance in enumerate(move_chance):
+                better = chance > best
+                best[better] = chance[better]
+                best_move[better] = direction
+            best = np.maximum(best, 0.0)  # Lost positions
+            best_chances[begin:begin + CHUNK] = best
+            where = insert(keys, boards, bits)
+            moves[where] = best_move
+            chances[where] = best
+        store.put(f'chances_{total}', best_chances)
+        for gained in (6, 8):  # Layers the next ones down do not need
+            store.drop(f'states_{total + gained}')
+            store.drop(f'chances_{total + gained}')
+    start_chance = float(np.mean(store.get('chances_4')))
+    backward = time.perf_counter() - backward_start
+
+    table.flush()
+    del keys, moves, chances, table
+    with open(path + '.tmp', 'r+b') as f:
+        f.write(MAGIC + HEADER.pack(rows, cols, target, count, slots, start_chance))
+    os.replace(path + '.tmp', path)
+    if store.folder is not None:
+        shutil.rmtree(store.folder, ignore_errors=True)
+    elapsed = time.perf_counter() - start
+    return {'rows': rows, 'cols': cols, 'target': 1 << target, 'chance': start_chance, 'positions': count,
+            'layers': len(sums), 'forward': forward, 'backward': backward, 'seconds': elapsed,
+            'positions_per_sec': count / elapsed, 'peak_memory': peak_memory(),
+            'table_bytes': os.path.getsize(path)}
+
+
+#chance of winning of every board left by a move (1 when it has the target tile)
+def move_chances(rules, after, above):
+    won = rules.won(after)
+    total = np.zeros(len(after))
+    free = np.zeros(len(after))
+    for shift in rules.shifts:
+        spawns = rules.empty(after, shift) & ~won
+        if not spawns.any():
+            continue
+        free += spawns
+        for gained, exp in ((2, np.uint64(1)), (4, np.uint64(2))):
+            states, chances = above[gained]  # Reached by the forward pass, so the layer exists
+            boards = after[spawns] | (exp << shift)
+            total[spawns] += 0.5 * np.asarray(chances)[np.searchsorted(states, boards)]
+    return np.where(won, 1.0, total / np.maximum(free, 1))
+
+
+def table_offsets(cells, slots):  # Byte offsets of the keys, moves, chances and the end of a table file
+    header = len(MAGIC) + HEADER.size
+    keys = header + (-header % ALIGN)
+    moves = keys + 8 * slots
+    chances = moves + slots + (-(moves + slots) % ALIGN)
+    return keys, moves, chances, chances + 4 * slots
+
+
+#optimal moves of a solved board size, memory mapped
+class StrategyTable:
+    def __init__(self, rows, cols, target, keys, moves, chances, start_chance):
+        self.rows = rows
+        self.cols = cols
+        self.target = target  # Exponent of the tile the table plays for
+        self.keys = keys
+        self.moves = moves
+        self.chances = chances
+        self.start_chance = start_chance  # Chance of winning from a new game
+        self.bits = len(keys).bit_length() - 1
+        self.rules = None  # Rules for the moves past the target, made on first use
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a solver table")
+            rows, cols, target, count, slots, start_chance = HEADER.unpack(f.read(HEADER.size))
+        offsets = table_offsets(rows * cols, slots)
+        data = np.memmap(path, mode='r')
+        return cls(rows, cols, target, data[offsets[0]:offsets[1]].view('<u8'), data[offsets[1]:offsets[2]],
+                   data[offsets[2]:offsets[3]].view('<f4'), start_chance)
+
+    def lookup(self, key):  # (move, chance) of a packed position, None if it is not in the table
+        mask = len(self.keys) - 1
+        slot = ((key * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> (64 - self.bits)
+        while True:
+            found = int(self.keys[slot])
+            if found == key:
+                move = int(self.moves[slot])
+                return (None if move == NO_MOVE else move), float(self.chances[slot])
+            if not found:
+                return None
+            slot = (slot + 1) & mask
+
+    #(move, chance) for a list of cell exponents, chance None past the target where
+    #the move is the one leaving the most empty cells
+    def best_move(self, cells):
+        if max(cells) > engine.MAX_EXPONENT:  # Does not fit the packing
+            return None, None
+        key = 0
+        for index, exp in enumerate(cells):
+            key |= exp << (4 * index)
+        if max(cells) < self.target:
+            found = self.lookup(key)
+            if found is not None:
+                return found
+        if self.rules is None:
+            self.rules = Rules(self.rows, self.cols, min(engine.MAX_EXPONENT, self.target))
+        board = np.array([key], dtype=np.uint64)
+        best, most = None, -1
+        for direction in range(4):
+            after = self.rules.move(board, direction)
+            if after[0] != key:
+                free = sum(int(self.rules.empty(after, shift)[0]) for shift in self.rules.shifts)
+                if free > most:
+                    best, most = direction, free
+        return best, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solve small 2048 boards exactly.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    solve_parser = commands.add_parser('solve', help='compute the optimal moves of a board size')
+    solve_parser.add_argument('--rows', type=int, default=3)
+    solve_parser.add_argument('--cols', type=int, default=3)
+    solve_parser.add_argument('--target', type=int, default=256, help='tile that wins, e.g. 256')
+    solve_parser.add_argument('--out', help='table file (default ROWSxCOLS_TARGET.s2048)')
+    solve_parser.add_argument('--work', help='folder for the layers on disk, for boards that do not fit in memory')
+    show_parser = commands.add_parser('show', help='print the header of a table')
+    show_parser.add_argument('table')
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        table = StrategyTable.load(args.table)
+        print(f"{table.rows}x{table.cols} to {1 << table.target}: {np.count_nonzero(table.keys):,} positions, "
+              f"{table.start_chance:.6%} chance of winning from the start")
+        return
+
+    if args.target < 8 or args.target & (args.target - 1):
+        parser.error('--target must be a power of two, at least 8')
+    target = args.target.bit_length() - 1
+    out = args.out or f"{args.rows}x{args.cols}_{args.target}.s2048"
+    try:
+        report = solve(args.rows, args.cols, target, out, args.work)
+    except ValueError as error:
+        parser.error(str(error))
+    print(f"{args.rows}x{args.cols} to {args.target}: {report['chance']:.6%} chance of winning with optimal play")
+    print(f"{report['positions']:,} positions in {report['layers']} layers, forward {report['forward']:.1f}s, "
+          f"backward {report['backward']:.1f}s, {report['positions_per_sec']:,.0f} positions/s")
+    peak = report['peak_memory']
+    print(f"peak memory {'n/a' if peak is None else f'{peak / 2 ** 20:,.1f} MiB'}, table {report['table_bytes'] / 2 ** 20:,.1f} MiB "
+          f"saved to {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import os
+import threading
+import time
+import pygame
+
+# Sound effects loaded on a background thread
+#
+# Opening the audio device and decoding the mp3 files is the slowest part of
+# starting the game, so the loader runs next to the main menu instead of before
+# it. A sound that is not decoded yet is skipped when played, and without an
+# audio device the game simply stays silent.
+
+HERE = os.path.dirname(os.path.abspath(__file__))  # The sound files sit next to the code, not in the cwd
+
+
+class SoundLoader:
+    def __init__(self, files):
+        self.files = files  # name -> file name next to this module
+        self.sounds = {}  # name -> decoded pygame.mixer.Sound
+        self.thread = None
+        self.ready_time = None  # perf_counter() when the loader finished
+
+    def start(self):  # Begin loading, only the first call does anything
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.load, name='sounds', daemon=True)
+            self.thread.start()
+
+    def load(self):
+        try:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+            for name, file in self.files.items():
+                self.sounds[name] = pygame.mixer.Sound(os.path.join(HERE, file))
+        except pygame.error:  # No audio device or unreadable file, keep what loaded
+            pass
+        self.ready_time = time.perf_counter()
+
+    def wait(self, timeout=None):  # Block until the loader is done
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def play(self, name):
+        sound = self.sounds.get(name)
+        if sound is not None:
+            sound.play()
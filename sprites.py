@@ -0,0 +1,52 @@
+from collections import OrderedDict
+import pygame
+
+# Pre-rendered tile surfaces
+#
+# Rendering the number of a tile with font.render is the slowest part of drawing
+# a frame, so every value is drawn once (background and centered text) and the
+# finished surface is blitted afterwards.
+
+
+#bounded cache of one tile surface per value
+class TileSprites:
+    def __init__(self, colors, font_color, max_size=32):
+        self.colors = colors  # Background color for 2, 4, 8, ...
+        self.font_color = font_color
+        self.max_size = max_size  # Values kept before the least recently used one is dropped
+        self.cache = OrderedDict()  # value -> surface, least recently used first
+        self.font = None
+        self.size = None
+
+    def clear(self):
+        self.cache.clear()
+
+    def color(self, value):  # Background color of a value, the last color for values past the list
+        index = value.bit_length() - 2
+        return self.colors[max(0, min(index, len(self.colors) - 1))]
+
+    def render(self, value):  # Draw the surface of one tile
+        width, height = self.size
+        surface = pygame.Surface((width, height))
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()  # Match the window format for fast blits
+        surface.fill(self.color(value))
+        text = self.font.render(str(value), 1, self.font_color)
+        surface.blit(text, (width // 2 - text.get_width() // 2, height // 2 - text.get_height() // 2))
+        return surface
+
+    #surface of a value for this font and tile size, rendered on first use
+    def get(self, value, font, size):
+        if font is not self.font or size != self.size:  # Resolution or font changed
+            self.clear()
+            self.font = font
+            self.size = size
+
+        sprite = self.cache.get(value)
+        if sprite is None:
+            sprite = self.cache[value] = self.render(value)
+            if len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(value)
+        return sprite
@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+import engine
+from board import Board
+
+# The running totals of board.Board against a recount of its cells
+#
+#   python -m pytest test_board.py
+#
+# Every move, spawn and set updates the empty cells, the Fenwick tree of the
+# rows, the row masks, the touching pairs and the biggest exponent in place.
+# The reference below recounts all of them from the flat list of cells after
+# every step of random games on square, long and wide boards.
+
+SEED = 2048
+SIZES = [(2, 2), (3, 5), (4, 4), (5, 3), (7, 7), (1, 9), (17, 11), (32, 32)]
+
+
+def reference_pairs(board):  # Touching cells holding the same tile, counted once
+    cells, cols = board.cells, board.cols
+    pairs = 0
+    for index, exp in enumerate(cells):
+        row, col = divmod(index, cols)
+        if exp and col + 1 < cols and cells[index + 1] == exp:
+            pairs += 1
+        if exp and row + 1 < board.rows and cells[index + cols] == exp:
+            pairs += 1
+    return pairs
+
+
+def check_totals(board):
+    cells = board.cells
+    free = [index for index, exp in enumerate(cells) if not exp]
+    assert board.empty == len(free)
+    assert len(board) == len(cells) - len(free)
+    assert board.max_exp == max(cells)
+    assert board.pairs == reference_pairs(board)
+    assert board.has_merge() == (board.pairs > 0)
+    assert board.is_lost() == (not free and not reference_pairs(board))
+    for row in range(board.rows):
+        line = cells[row * board.cols:(row + 1) * board.cols]
+        assert board.row_bits[row] == sum(1 << col for col, exp in enumerate(line) if not exp)
+    for exp in range(len(board.counts)):
+        assert board.counts[exp] == cells.count(exp)
+    if board.packed is not None:
+        assert board.packed == sum(exp << (4 * index) for index, exp in enumerate(cells))
+
+
+def check_free_cells(board):  # Every k picks the k-th empty cell in index order
+    free = [index for index, exp in enumerate(board.cells) if not exp]
+    for k, index in enumerate(free):
+        assert board.random_free(FixedPick(k)) == index
+
+
+class FixedPick:  # Stands in for the RNG, always picks k
+    def __init__(self, k):
+        self.k = k
+
+    def randrange(self, stop):
+        assert 0 <= self.k < stop
+        return self.k
+
+
+@pytest.mark.parametrize('rows, cols', SIZES)
+def test_totals_after_random_moves(rows, cols):
+    rng = random.Random(SEED + rows * 100 + cols)
+    board = Board(rows, cols, rng)
+    check_totals(board)
+    board.spawn()
+    board.spawn()
+    for step in range(400):
+        _, moved, _ = board.move(rng.randrange(4), with_paths=False)
+        if moved:
+            board.spawn()
+        check_totals(board)
+        if step % 20 == 0:
+            check_free_cells(board)
+        if board.is_lost():
+            board = Board(rows, cols, rng)
+            board.spawn()
+
+
+@pytest.mark.parametrize('rows, cols', SIZES)
+def test_totals_after_random_sets(rows, cols):  # Filled, emptied and replaced cells in any order
+    rng = random.Random(SEED - rows * 100 - cols)
+    board = Board(rows, cols)
+    for step in range(2000):
+        board.set(rng.randrange(rows * cols), rng.choice((0, 0, 1, 2, 3, rng.randint(1, 15))))
+        if step % 50 == 0:
+            check_totals(board)
+            check_free_cells(board)
+    check_totals(board)
+
+
+def test_packed_board_matches_engine():
+    rng = random.Random(SEED)
+    board = Board(engine.ROWS, engine.COL, rng)
+    board.spawn()
+    for _ in range(300):
+        direction = rng.randrange(4)
+        new, score, moved = engine.move(board.packed, direction)
+        gained, changed, _ = board.move(direction, with_paths=False)
+        assert (board.packed, gained, changed) == (new, score, moved)
+        if changed:
+            board.spawn()
+        check_totals(board)
+        if board.is_lost():
+            break
@@ -0,0 +1,122 @@
+import random
+
+import numpy as np
+import pytest
+
+import batch
+import engine
+
+# The packed engine and the NumPy batch engine against plain lists
+#
+#   python -m pytest test_engine.py
+#
+# The reference below plays a 4x4 grid of exponents the way the original game
+# did, one line at a time, so the row tables of engine.py and the vectorized
+# moves of batch.py are checked against rules written out in full.
+
+SEED = 2048
+BOARDS = 2000
+
+
+def reference_slide(line):  # (line slid towards index 0, score), each tile merges once, 15 never merges
+    tiles = [exp for exp in line if exp]
+    out = []
+    score = 0
+    i = 0
+    while i < len(tiles):
+        if i + 1 < len(tiles) and tiles[i] == tiles[i + 1] and tiles[i] < engine.MAX_EXPONENT:
+            out.append(tiles[i] + 1)
+            score += 1 << (tiles[i] + 1)
+            i += 2
+        else:
+            out.append(tiles[i])
+            i += 1
+    return out + [0] * (len(line) - len(out)), score
+
+
+def reference_move(grid, direction):  # (new grid, score) of a list of rows
+    size = len(grid)
+    new = [row[:] for row in grid]
+    score = 0
+    for index in range(size):
+        if direction in (engine.LEFT, engine.RIGHT):
+            cells = [(index, col) for col in range(size)]
+        else:
+            cells = [(row, index) for row in range(size)]
+        if direction in (engine.RIGHT, engine.DOWN):
+            cells.reverse()
+        line, gained = reference_slide([grid[row][col] for row, col in cells])
+        score += gained
+        for (row, col), exp in zip(cells, line):
+            new[row][col] = exp
+    return new, score
+
+
+def reference_has_merge(grid):
+    size = len(grid)
+    return any(grid[row][col] and ((col + 1 < size and grid[row][col] == grid[row][col + 1])
+                                   or (row + 1 < size and grid[row][col] == grid[row + 1][col]))
+               for row in range(size) for col in range(size))
+
+
+def to_grid(board):
+    return [[engine.get_exponent(board, row, col) for col in range(engine.COL)] for row in range(engine.ROWS)]
+
+
+def to_board(grid):
+    return sum(exp << (4 * (row * engine.COL + col)) for row, line in enumerate(grid) for col, exp in enumerate(line))
+
+
+def random_grids(count=BOARDS, seed=SEED):  # Sparse, crowded and capped boards, many with equal neighbours
+    rng = random.Random(seed)
+    grids = []
+    for _ in range(count):
+        top = rng.choice((3, 6, 11, engine.MAX_EXPONENT))
+        empty = rng.random()
+        grids.append([[0 if rng.random() < empty else rng.randint(1, top) for _ in range(engine.COL)]
+                      for _ in range(engine.ROWS)])
+    return grids
+
+
+@pytest.mark.parametrize('direction', range(4))
+def test_move(direction):
+    for grid in random_grids():
+        board = to_board(grid)
+        expected, expected_score = reference_move(grid, direction)
+        new, score, moved = engine.move(board, direction)
+        assert to_grid(new) == expected
+        assert score == expected_score
+        assert moved == (expected != grid)
+
+
+def test_has_merge_and_empty_cells():
+    for grid in random_grids():
+        board = to_board(grid)
+        assert engine.has_merge(board) == reference_has_merge(grid)
+        assert engine.empty_cells(board) == [index for index in range(engine.CELLS)
+                                             if not grid[index // engine.COL][index % engine.COL]]
+        assert engine.is_lost(board) == (not engine.empty_cells(board) and not reference_has_merge(grid))
+
+
+@pytest.mark.parametrize('direction', range(4))
+def test_batch_move(direction):
+    grids = random_grids(seed=SEED + 1)
+    boards = np.array([to_board(grid) for grid in grids], dtype=np.uint64)
+    new, score, moved = batch.move(boards, direction)
+    for grid, board, gained, changed in zip(grids, new.tolist(), score.tolist(), moved.tolist()):
+        expected, expected_score = reference_move(grid, direction)
+        assert to_grid(board) == expected
+        assert gained == expected_score
+        assert changed == (expected != grid)
+
+
+def test_batch_mixed_directions_and_checks():
+    grids = random_grids(seed=SEED + 2)
+    boards = np.array([to_board(grid) for grid in grids], dtype=np.uint64)
+    directions = np.random.default_rng(SEED).integers(0, 4, len(grids))
+    new, score, _ = batch.move(boards, directions)
+    for grid, direction, board, gained in zip(grids, directions.tolist(), new.tolist(), score.tolist()):
+        assert (to_grid(board), gained) == reference_move(grid, direction)
+    assert batch.has_merge(boards).tolist() == [reference_has_merge(grid) for grid in grids]
+    assert batch.is_lost(boards).tolist() == [engine.is_lost(board) for board in boards.tolist()]
+    assert batch.to_grid(boards).tolist() == grids
@@ -0,0 +1,131 @@
+import random
+
+import pytest
+
+import replay
+from history import History
+
+# Undo, redo and saved games against snapshots of a played game
+#
+#   python -m pytest test_history.py
+#
+# A seeded game is played with random moves while full copies of every
+# position (cells, score, RNG counter) are kept aside. Random undo and redo
+# steps must bring back exactly those positions, the same spawns must follow
+# them, and a saved game must load at the same position with the same history.
+
+SEED = 2048
+SIZES = [(4, 4), (3, 3), (5, 7)]
+
+
+def snapshot(board):
+    return list(board.cells), board.score, board.rng.counter, board.empty, board.max_exp, board.pairs
+
+
+def new_game(seed, rows, cols):  # Starts with two 2 tiles like main.py
+    board = replay.new_board(seed, rows, cols)
+    return board, History(seed, board)
+
+
+def play_move(board, history, rng):  # One random move that changes the board, False if none is left
+    for direction in rng.sample(range(4), 4):
+        _, moved, _ = board.move(direction, with_paths=False)
+        if moved:
+            board.spawn()
+            history.add(direction)
+            return True
+    return False
+
+
+def check_position(board, history, positions, directions):
+    assert snapshot(board) == positions[history.cursor]
+    assert board.moves == history.cursor
+    assert history.moves == directions[:history.cursor]
+
+
+@pytest.mark.parametrize('rows, cols', SIZES)
+def test_undo_redo_brings_back_every_position(rows, cols):
+    rng = random.Random(SEED + rows * cols)
+    board, history = new_game(SEED, rows, cols)
+    positions = [snapshot(board)]
+    directions = []
+    for _ in range(2000):
+        action = rng.random()
+        if action < 0.2:
+            can_undo = history.can_undo()
+            assert history.undo() == can_undo
+        elif action < 0.4:
+            can_redo = history.can_redo()
+            assert history.redo() == can_redo
+        elif play_move(board, history, rng):
+            del positions[history.cursor:]  # The new move dropped the undone ones
+            del directions[history.cursor - 1:]
+            positions.append(snapshot(board))
+            directions.append(history.directions[-1])
+        assert len(history) == len(positions)
+        check_position(board, history, positions, directions)
+
+
+@pytest.mark.parametrize('rows, cols', SIZES)
+def test_undone_move_spawns_the_same_again(rows, cols):
+    rng = random.Random(SEED)
+    board, history = new_game(SEED + 1, rows, cols)
+    for _ in range(30):
+        if not play_move(board, history, rng):
+            break
+        after = snapshot(board)
+        direction = history.directions[-1]
+        history.undo()
+        board.move(direction, with_paths=False)
+        board.spawn()
+        history.add(direction)
+        assert snapshot(board) == after
+    assert replay.replay(history.record())[2]  # Only the moves that lead here are in the replay
+
+
+def test_undo_and_redo_at_the_ends():
+    board, history = new_game(SEED, 4, 4)
+    start = snapshot(board)
+    assert not history.undo() and not history.redo()
+    play_move(board, history, random.Random(SEED))
+    assert not history.redo()
+    assert history.undo() and snapshot(board) == start
+    assert not history.undo()
+
+
+@pytest.mark.parametrize('rows, cols', SIZES)
+def test_save_and_load(tmp_path, rows, cols):
+    rng = random.Random(SEED)
+    board, history = new_game(SEED + 2, rows, cols)
+    for _ in range(60):
+        if not play_move(board, history, rng):
+            break
+    for _ in range(7):
+        history.undo()
+    path = str(tmp_path / 'game.h2048')
+    history.save_game(path)
+
+    loaded = History.load_game(path)
+    assert (loaded.seed, loaded.cursor, len(loaded)) == (history.seed, history.cursor, len(history))
+    assert snapshot(loaded.board) == snapshot(board)
+    assert loaded.moves == history.moves
+    assert list(loaded.directions) == list(history.directions)
+    assert loaded.record() == history.record()
+
+    while history.redo():  # The undone moves come back on the loaded game too
+        assert loaded.redo()
+        assert snapshot(loaded.board) == snapshot(board)
+    assert not loaded.redo()
+    for _ in range(10):  # And a new move spawns the same tile on both
+        direction = rng.randrange(4)
+        for game in (board, loaded.board):
+            if game.move(direction, with_paths=False)[1]:
+                game.spawn()
+        assert snapshot(loaded.board) == snapshot(board)
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.h2048'
+    path.write_bytes(b'R2048\x02')
+    with pytest.raises(ValueError):
+        History.load_game(str(path))
@@ -0,0 +1,141 @@
+import random
+import struct
+
+import pytest
+
+import ai
+import engine
+import parallel
+
+# The shared transposition table and the split of the parallel search
+#
+#   python -m pytest test_parallel.py
+#
+# SharedTable is checked on a plain buffer: a value must come back bit for bit
+# at the depth it was stored with (or a shallower one) and never for another
+# board of its slot. The split tree is searched in this process without any
+# table, so the value it puts together for every root move must be the one
+# ai.Expectimax finds for that move, whatever the number of workers it is cut
+# for. A small pool checks that the processes give legal moves.
+
+SEED = 2048
+BITS = 6  # 64 slots, so boards share slots often
+
+
+def new_table(bits=BITS):
+    return parallel.SharedTable(memoryview(bytearray(16 << bits)), bits)
+
+
+def slot(board, bits=BITS):
+    return ((board * parallel.HASH_MULTIPLIER) & parallel.WORD_MASK) >> (64 - bits)
+
+
+def same_bits(a, b):
+    return struct.pack('<d', a) == struct.pack('<d', b)
+
+
+def random_values(rng, count):  # Doubles of every kind, also the ones whose bits look like a depth
+    values = [0.0, -0.0, 1.0, 1e-300, -1e300, float('inf'), 5e-324, struct.unpack('<d', struct.pack('<Q', 3))[0]]
+    while len(values) < count:
+        values.append(struct.unpack('<d', struct.pack('<Q', rng.getrandbits(64)))[0])
+    return values
+
+
+class NoTable(ai.Expectimax):  # Expectimax that searches every node
+    def lookup(self, board, depth):
+        return None
+
+    def store(self, board, depth, value):
+        pass
+
+
+def boards(count=6):
+    return parallel.bench_boards(count, SEED)
+
+
+def test_values_come_back_exact():
+    rng = random.Random(SEED)
+    table = new_table(16)
+    for value in random_values(rng, 2000):
+        board = rng.getrandbits(64) or 1
+        depth = rng.randint(1, parallel.MAX_DEPTH)
+        table.put(board, depth, value)
+        found = table.get(board, depth)
+        if value != value:  # NaN
+            assert found != found and same_bits(found, value)
+        else:
+            assert found is not None and same_bits(found, value)
+
+
+def test_depth_is_kept():
+    rng = random.Random(SEED)
+    table = new_table()
+    for _ in range(500):
+        board = rng.getrandbits(64) or 1
+        depth = rng.randint(1, parallel.MAX_DEPTH)
+        value = rng.random()
+        table.put(board, depth, value)
+        for asked in (1, max(1, depth // 2), depth):  # Shallower asks are answered too
+            assert table.get(board, asked) == value
+        if depth < parallel.MAX_DEPTH:
+            assert table.get(board, depth + 1) is None
+
+
+def test_other_boards_of_a_slot_miss():
+    rng = random.Random(SEED)
+    table = new_table()
+    by_slot = {}
+    while len(by_slot) < 64 or min(len(found) for found in by_slot.values()) < 2:
+        board = rng.getrandbits(64) or 1
+        by_slot.setdefault(slot(board), []).append(board)
+    for first, second, *_ in by_slot.values():
+        table.put(first, 3, 0.25)
+        assert table.get(second, 1) is None
+        table.put(second, 5, 0.5)  # The newer entry takes the slot
+        assert table.get(first, 1) is None
+        assert table.get(second, 5) == 0.5
+
+
+def test_empty_table_misses():
+    table = new_table()
+    rng = random.Random(SEED)
+    for _ in range(200):
+        assert table.get(rng.getrandbits(64) or 1, 1) is None
+
+
+@pytest.mark.parametrize('workers', [1, 2, 3, 8])
+@pytest.mark.parametrize('depth', [2, 3])
+def test_split_values_match_expectimax(workers, depth):
+    reference = NoTable(time_budget=None)
+    search = NoTable(time_budget=None)
+    for board in boards(6 if depth == 2 else 2):  # Depth 3 without a table takes seconds a board
+        expected = {}
+        for direction in range(4):
+            new, _, moved = engine.move(board, direction)
+            if moved:
+                expected[direction] = reference.chance_node(new, depth, 1.0)
+
+        roots, tasks = parallel.ParallelExpectimax(workers).split(board, depth)
+        assert len(tasks) >= min(workers, len(roots))
+        for task in tasks:
+            if task.chance:
+                task.value = search.chance_node(task.board, task.depth, task.prob)
+            else:
+                task.value = search.max_node(task.board, task.depth, task.prob)
+        found = {direction: root.resolve() for direction, root in roots.items()}
+        assert found.keys() == expected.keys()
+        for direction, value in expected.items():
+            assert found[direction] == pytest.approx(value, rel=1e-12)
+
+
+def test_pool_plays_legal_moves():
+    search = parallel.ParallelExpectimax(2, max_depth=3, time_budget=None, table_bits=12)
+    try:
+        for board in boards(3):
+            move = search.best_move(board)
+            assert engine.move(board, move)[2]
+        lost = sum((1 + (row + col) % 2) << (4 * (row * engine.COL + col))  # 2s and 4s, no two alike touching
+                   for row in range(engine.ROWS) for col in range(engine.COL))
+        assert engine.is_lost(lost) and search.best_move(lost) is None
+    finally:
+        search.close()
@@ -0,0 +1,149 @@
+import random
+
+import numpy as np
+import pytest
+
+import engine
+import replay
+
+# Seeded replays: recorded games, the scalar replay and the NumPy batch replay
+#
+#   python -m pytest test_replay.py
+#
+# Games are played on board.Board with SeededRNG spawns and random moves, the
+# way main.py records them. Replaying a record must give back its final board
+# and score, and replay_batch must agree with replay() game by game and move by
+# move, also for records that were tampered with.
+
+SEED = 2048
+GAMES = 200
+SIZES = [(4, 4), (3, 3), (2, 5), (5, 4), (6, 6)]
+
+
+def play(seed, rows=engine.ROWS, cols=engine.COL, moves=None):  # Record of a seeded game of random moves
+    board = replay.new_board(seed, rows, cols)
+    recorder = replay.Recorder(seed, board)
+    rng = random.Random(seed)
+    while not board.is_lost() and (moves is None or len(recorder.moves) < moves):
+        direction = rng.randrange(4)
+        _, moved, _ = board.move(direction, with_paths=False)
+        if moved:
+            board.spawn()
+            recorder.add(direction)
+    return recorder.record()
+
+
+def games(count=GAMES, sizes=((engine.ROWS, engine.COL),)):
+    rng = random.Random(SEED)
+    return [play(rng.getrandbits(64), *sizes[i % len(sizes)], moves=rng.choice((None, 0, 1, 30)))
+            for i in range(count)]
+
+
+def tampered(records):  # A wrong score, a wrong final board or one move changed
+    rng = random.Random(SEED)
+    out = []
+    for i, record in enumerate(records):
+        if not record.count:
+            continue
+        if i % 3 == 0:
+            record = record._replace(score=record.score + 4)
+        elif i % 3 == 1:
+            record = record._replace(final=record.final ^ 1)
+        else:
+            moves = replay.unpack_moves(record.moves, record.count)
+            step = rng.randrange(len(moves))
+            moves[step] = moves[step - 1] if step else moves[0] ^ 1
+            record = record._replace(moves=replay.pack_moves(moves))
+        out.append(record)
+    return out
+
+
+def test_seeded_rng_matches_batch():
+    rng = random.Random(SEED)
+    seeds = np.array([rng.getrandbits(64) for _ in range(100)], dtype=np.uint64)
+    counters = np.zeros(len(seeds), dtype=np.uint64)
+    scalar = [replay.SeededRNG(int(seed)) for seed in seeds]
+    for n in (1, 2, 3, 10, 16, 1000):
+        values = replay.randrange_batch(seeds, counters, np.arange(len(seeds)), n)
+        assert values.tolist() == [generator.randrange(n) for generator in scalar]
+
+
+def test_pack_moves_round_trip():
+    rng = random.Random(SEED)
+    for count in range(13):
+        moves = [rng.randrange(4) for _ in range(count)]
+        assert replay.unpack_moves(replay.pack_moves(moves), count) == moves
+
+
+@pytest.mark.parametrize('rows, cols', SIZES)
+def test_replay_gives_back_the_game(rows, cols):
+    for record in games(40, [(rows, cols)]):
+        assert replay.replay(record)[2]
+
+
+def test_packed_and_board_games_spawn_the_same():  # engine.new_board and replay.new_board from one seed
+    rng = random.Random(SEED)
+    for _ in range(50):
+        seed = rng.getrandbits(64)
+        assert replay.new_board(seed).packed == engine.new_board(replay.SeededRNG(seed))
+
+
+def test_batch_matches_scalar_replay():
+    records = games()
+    records += tampered(records)
+    expected = [replay.replay(record)[2] for record in records]
+    assert replay.replay_batch(records).tolist() == expected
+    assert not all(expected) and any(expected)
+
+
+def test_batch_boards_match_every_move():
+    records = [record for record in games() if record.count]
+    boards = []
+    for record in records:
+        rng = replay.SeededRNG(record.seed)
+        board = engine.new_board(rng)
+        steps = [board]
+        for direction in replay.unpack_moves(record.moves, record.count):
+            board = engine.spawn(engine.move(board, direction)[0], rng)
+            steps.append(board)
+        boards.append(steps)
+
+    def observe(moves, index, current):
+        for i in index.tolist():
+            assert int(current[i]) == boards[i][moves]
+
+    assert replay.replay_batch(records, observe).all()
+
+
+def test_file_chunks_and_verify(tmp_path):
+    path = str(tmp_path / 'games.r2048')
+    records = [record for record in games(60, SIZES) if record.count]
+    bad = tampered(records[:9])
+    with replay.open_writer(path) as f:
+        for record in records + bad:
+            replay.write_record(f, record)
+
+    read = [record for task in replay.chunks(path, 7) for record in replay.read_records(*task)]
+    assert read == list(replay.read_records(path)) == records + bad
+    sizes = [7] * (len(read) // 7) + ([len(read) % 7] if len(read) % 7 else [])
+    assert [task[2] for task in replay.chunks(path, 7)] == sizes
+
+    results = [replay.verify_chunk(task) for task in replay.chunks(path, 7)]
+    games_, moves, mismatched, skipped = (sum(column) for column in zip(*results))
+    assert (games_, mismatched, skipped) == (len(read), len(bad), 0)
+    assert moves == sum(record.count for record in read)
+    assert replay.verify([path], workers=1)[:4] == (games_, moves, mismatched, skipped)
+
+
+def test_version_1_files(tmp_path):  # 4x4 games still verify, the others are skipped
+    path = str(tmp_path / 'old.r2048')
+    records = [record for record in games(20, SIZES) if record.count]
+    with open(path, 'wb') as f:
+        f.write(replay.OLD_MAGIC)
+        for record in records:
+            replay.write_record(f, record)
+    read = list(replay.read_records(path))
+    assert [record.replayable for record in read] == [(record.rows, record.cols) == (engine.ROWS, engine.COL) for record in records]
+    assert not replay.can_append(path)
+    games_, _, mismatched, skipped = replay.verify_chunk(next(replay.chunks(path)))
+    assert (games_, mismatched, skipped) == (len(records), 0, sum(not record.replayable for record in read))
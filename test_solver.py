@@ -0,0 +1,127 @@
+from functools import lru_cache
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+import solver
+
+# Solver tables against a brute force expectimax on tiny boards
+#
+#   python -m pytest test_solver.py
+#
+# The reference below walks the game tree of a rows x cols board recursively
+# with plain lists, one position at a time, and takes the exact chance of making
+# the target with the best moves. Every position in a solved table must hold that
+# chance and a move that reaches it, and the table's chance from a new game must
+# be the mean over the starting positions.
+
+CASES = [(2, 2, 3), (2, 2, 4), (2, 2, 5), (2, 3, 5), (3, 2, 5), (2, 3, 6)]
+TOLERANCE = 1e-5  # Chances are stored as float32
+
+
+def reference_slide(line):  # Line slid towards index 0, each tile merges once
+    tiles = [exp for exp in line if exp]
+    out = []
+    i = 0
+    while i < len(tiles):
+        if i + 1 < len(tiles) and tiles[i] == tiles[i + 1]:
+            out.append(tiles[i] + 1)
+            i += 2
+        else:
+            out.append(tiles[i])
+            i += 1
+    return out + [0] * (len(line) - len(out))
+
+
+def reference_move(cells, rows, cols, direction):  # Cells after a move, directions as in engine.py
+    lines = {
+        0: [[row * cols + col for col in range(cols)] for row in range(rows)],
+        1: [[row * cols + col for col in reversed(range(cols))] for row in range(rows)],
+        2: [[row * cols + col for row in range(rows)] for col in range(cols)],
+        3: [[row * cols + col for row in reversed(range(rows))] for col in range(cols)],
+    }[direction]
+    new = list(cells)
+    for line in lines:
+        for index, exp in zip(line, reference_slide([cells[i] for i in line])):
+            new[index] = exp
+    return tuple(new)
+
+
+def brute_force(rows, cols, target):  # Chance of the best move from a position, and of every move
+    @lru_cache(maxsize=None)
+    def moves(cells):
+        chances = {}
+        for direction in range(4):
+            after = reference_move(cells, rows, cols, direction)
+            if after == cells:
+                continue
+            if max(after) >= target:
+                chances[direction] = 1.0
+                continue
+            free = [index for index, exp in enumerate(after) if not exp]
+            total = 0.0
+            for index in free:
+                for exp in (1, 2):
+                    spawned = list(after)
+                    spawned[index] = exp
+                    total += 0.5 * best(tuple(spawned))
+            chances[direction] = total / len(free)
+        return chances
+
+    def best(cells):
+        return max(moves(cells).values(), default=0.0)
+
+    return moves, best
+
+
+def to_cells(key, size):
+    return tuple((key >> (4 * index)) & 0xF for index in range(size))
+
+
+def solved(tmp_path, rows, cols, target):
+    path = str(tmp_path / f'{rows}x{cols}_{1 << target}.s2048')
+    result = solver.solve(rows, cols, target, path, log=lambda message: None)
+    return result, solver.StrategyTable.load(path)
+
+
+@pytest.mark.parametrize('rows, cols, target', CASES)
+def test_table_matches_brute_force(tmp_path, rows, cols, target):
+    result, table = solved(tmp_path, rows, cols, target)
+    moves, best = brute_force(rows, cols, target)
+    size = rows * cols
+
+    keys = np.asarray(table.keys)
+    positions = [int(key) for key in keys[keys != 0]]
+    assert len(positions) == result['positions']
+    for key in positions:
+        cells = to_cells(key, size)
+        chances = moves(cells)
+        move, chance = table.lookup(key)
+        assert chance == pytest.approx(best(cells), abs=TOLERANCE)
+        if chances:
+            assert chances[move] == pytest.approx(best(cells), abs=TOLERANCE)
+        else:
+            assert move is None
+        assert table.best_move(list(cells)) == (move, chance)
+
+    starts = [tuple(1 if index in pair else 0 for index in range(size)) for pair in combinations(range(size), 2)]
+    expected = sum(best(cells) for cells in starts) / len(starts)
+    assert result['chance'] == pytest.approx(expected, abs=TOLERANCE)
+    assert table.start_chance == result['chance']
+
+
+def test_work_folder_gives_the_same_table(tmp_path):  # Layers on disk instead of in memory
+    rows, cols, target = 2, 3, 5
+    in_memory = str(tmp_path / 'memory.s2048')
+    on_disk = str(tmp_path / 'disk.s2048')
+    solver.solve(rows, cols, target, in_memory, log=lambda message: None)
+    solver.solve(rows, cols, target, on_disk, work=str(tmp_path), log=lambda message: None)
+    with open(in_memory, 'rb') as a, open(on_disk, 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_positions_past_the_target(tmp_path):  # Not in the table, the move leaving most empty cells
+    _, table = solved(tmp_path, 2, 2, 3)
+    assert table.best_move([3, 3, 0, 0]) == (0, None)
+    assert table.best_move([3, 1, 2, 4]) == (None, None)
@@ -0,0 +1,213 @@
+import pygame
+import engine
+import sprites
+import menus
+import animation
+import perf
+import render
+
+# Layout, tiles and drawing of the game window
+#
+# main.py plays the game in this window, export.py draws replays with the same
+# Tile, draw and move_tiles into a hidden one and mosaic.py shrinks its layout and
+# colors, so the three share the look without importing the game itself. Set ROWS
+# and COL here to play (and draw) another board size.
+
+FPS = 60  # Frames per second
+
+WIDTH, HEIGHT = 800, 800  # Width and height of the game window
+ROWS = 4  # Number of rows in the grid (any size up to 32 works)
+COL = 4  # Number of columns in the grid (any size up to 32 works)
+
+RECT_HEIGHT = HEIGHT // ROWS  # Height of each rectangle
+RECT_WIDTH = WIDTH // COL  # Width of each rectangle
+
+OUTLINE_COLOR = (187, 173, 160)  # Color of the outline of the rectangles
+OUTLINE_THICKNESS = 10  # Thickness of the outline of the rectangles
+BACKGROUND_COLOR = (205, 192, 180)  # Background color of the window
+FONT_COLOR = (119, 110, 101)  # Color of the font
+
+FONT_SIZE = 60  # Font size of the numbers
+HINT_COLOR = (119, 110, 101, 140)  # Color of the hint arrow, translucent
+
+HINT_ARROWS = {}  # Direction -> rendered hint arrow
+
+PROFILER = perf.FrameProfiler()  # Frame timings, F3 shows them and F4 saves them
+
+# Make the tiles for the game
+class Tile:
+    COLORS = [
+        (237, 229, 218),
+        (238, 225, 201),
+        (243, 178, 122),
+        (246, 150, 101),
+        (247, 124, 95),
+        (247, 95, 59),
+        (237, 208, 115),
+        (237, 204, 99),
+        (236, 202, 80),
+        (237, 200, 80),
+        (237, 197, 63),
+        (237, 194, 46),
+    ]
+
+    def __init__(self, value, row, col):    
+        self.value = value  # Value of the tile
+        self.row = row  # Row of the tile
+        self.col = col  # Column of the tile
+        self.x = col * RECT_WIDTH   # X position of the tile
+        self.y = row * RECT_HEIGHT  # Y position of the tile
+        
+
+    def get_color(self):    # Get the color of the tile based on the value
+        return TILE_SPRITES.color(self.value)   # Return the color based on the value
+    
+    def draw(self, window, scale=1.0): # Draw the tile
+        sprite = TILE_SPRITES.get(self.value, menus.get_font(FONT_SIZE, True), (RECT_WIDTH, RECT_HEIGHT)) # Pre-rendered tile with its number
+        if scale < 1.0: # Growing tile, draw it smaller around its center
+            width, height = max(1, int(RECT_WIDTH * scale)), max(1, int(RECT_HEIGHT * scale))
+            sprite = pygame.transform.smoothscale(sprite, (width, height))
+            window.blit(sprite, (self.x + (RECT_WIDTH - width) // 2, self.y + (RECT_HEIGHT - height) // 2))
+            return
+        window.blit(sprite, (self.x, self.y)) # Draw the tile
+
+TILE_SPRITES = sprites.TileSprites(Tile.COLORS, FONT_COLOR)  # Cache of the rendered tiles
+
+def draw_grid(window): # Draw the grid of the window
+    for row in range(1, ROWS): # Loop through the rows
+        y = row * RECT_HEIGHT   # Calculate the y position of the horizontal lines
+        pygame.draw.line(window, OUTLINE_COLOR, (0, y), (WIDTH, y), OUTLINE_THICKNESS)  # Draw the horizontal lines
+
+    for col in range(1, COL): # Loop through the columns
+        x = col * RECT_WIDTH    # Calculate the x position of the vertical lines
+        pygame.draw.line(window, OUTLINE_COLOR, (x, 0), (x, HEIGHT), OUTLINE_THICKNESS) # Draw the vertical lines
+
+    pygame.draw.rect(window, OUTLINE_COLOR, (0, 0, WIDTH, HEIGHT), OUTLINE_THICKNESS) # Draw the outline of the window
+
+#draw a translucent arrow in the middle of the board pointing to the hinted move
+def draw_hint(window, direction):
+    arrow = HINT_ARROWS.get(direction)
+    if arrow is None:
+        size = HINT_SIZE
+        arrow = pygame.Surface((size, size), pygame.SRCALPHA)
+        shape = [(0.1, 0.35), (0.55, 0.35), (0.55, 0.15), (0.9, 0.5), (0.55, 0.85), (0.55, 0.65), (0.1, 0.65)]
+        pygame.draw.polygon(arrow, HINT_COLOR, [(x * size, y * size) for x, y in shape]) # Pointing right
+        angle = {engine.RIGHT: 0, engine.UP: 90, engine.LEFT: 180, engine.DOWN: 270}[direction]
+        arrow = HINT_ARROWS[direction] = pygame.transform.rotate(arrow, angle)
+    window.blit(arrow, (WIDTH // 2 - arrow.get_width() // 2, HEIGHT // 2 - arrow.get_height() // 2))
+
+HINT_SIZE = min(WIDTH, HEIGHT) // 3  # Side of the square the hint arrow is drawn in
+RENDER = render.RenderScheduler((RECT_WIDTH, RECT_HEIGHT), COL, BACKGROUND_COLOR, draw_grid,
+                                pygame.Rect(WIDTH // 2 - HINT_SIZE // 2, HEIGHT // 2 - HINT_SIZE // 2, HINT_SIZE, HINT_SIZE))
+
+def draw(window, tiles, planner=None, hint=None): # Draw the window
+    background, grid = RENDER.layers(window)
+    window.blit(background, (0, 0)) # Fill the window with the background color
+
+    PROFILER.begin('tiles')
+    animated = planner is not None and planner.active
+    if animated: # A move is still animating
+        for tile, scale in planner.frame():
+            tile.draw(window, scale)
+    else:
+        for tile in tiles.values(): # Loop through the tiles
+            tile.draw(window)
+    PROFILER.end()
+
+    PROFILER.begin('grid')
+    window.blit(grid, (0, 0)) # Draw the grid, rendered once
+    PROFILER.end()
+    if hint is not None:
+        draw_hint(window, hint)
+    if PROFILER.overlay:
+        PROFILER.draw_overlay(window, menus.get_font(20))
+
+    PROFILER.begin('update')
+    pygame.display.update() # Update the window
+    PROFILER.end()
+    if animated or PROFILER.overlay:
+        RENDER.invalidate()
+    else:
+        RENDER.remember(tiles, hint)
+
+#redraw only the cells (and the hint) that changed since the last frame
+def draw_changes(window, tiles, hint, rects):
+    if not rects: # Nothing changed, the screen is already right
+        return
+    background, grid = RENDER.layers(window)
+    PROFILER.begin('tiles')
+    for rect in rects:
+        window.set_clip(rect)
+        window.blit(background, rect, rect)
+        for index in RENDER.cells_in(rect):
+            tile = tiles.get(index)
+            if tile is not None:
+                tile.draw(window)
+        window.blit(grid, rect, rect)
+        if hint is not None:
+            draw_hint(window, hint)
+    window.set_clip(None)
+    PROFILER.end()
+
+    PROFILER.begin('update')
+    pygame.display.update(rects) # Only the changed parts of the window
+    PROFILER.end()
+    RENDER.remember(tiles, hint)
+
+#draw the next frame, the whole window while something moves and only the changes otherwise
+def render_frame(window, tiles, planner, hint):
+    rects = None
+    if not planner.active and not PROFILER.overlay:
+        rects = RENDER.dirty_rects(tiles, hint)
+    if rects is None:
+        draw(window, tiles, planner, hint)
+    else:
+        draw_changes(window, tiles, hint, rects)
+
+#build the tiles of a board
+def tiles_from_board(board):
+    tiles = {}
+    for row, col, value in board.tiles():
+        tiles[row * COL + col] = Tile(value, row, col)
+    return tiles
+
+def move_tiles(board, tiles, direction, planner=None, recorder=None): # Move the tiles
+    _, moved, paths = board.move(engine.DIRECTIONS[direction])
+
+    if not moved:
+        if board.is_lost():
+            return "lost"
+        return "continue"
+
+    transitions = []
+    for index, new_index, merged in paths:
+        row, col = divmod(index, COL)
+        new_row, new_col = divmod(new_index, COL)
+        start = (col * RECT_WIDTH, row * RECT_HEIGHT)
+        end = (new_col * RECT_WIDTH, new_row * RECT_HEIGHT)
+        transitions.append(animation.Transition(tiles[index], start, end, 'merge' if merged else 'move'))
+
+    tiles.clear()
+    tiles.update(tiles_from_board(board))
+    before = set(tiles)
+    result = end_move(board, tiles)
+    if recorder is not None:
+        recorder.add(engine.DIRECTIONS[direction])
+    for index in set(tiles) - before: # The spawned tile
+        tile = tiles[index]
+        transitions.append(animation.Transition(tile, (tile.x, tile.y), (tile.x, tile.y), 'spawn'))
+
+    if planner is not None:
+        planner.finish() # Fast-forward the previous move if the player is ahead
+        planner.start(transitions, tiles.values())
+    return result
+
+#return the result of the move
+def end_move(board, tiles):
+    if board.is_lost():
+        return "lost"
+
+    index, exp = board.spawn()
+    row, col = divmod(index, COL)
+    tiles[index] = Tile(1 << exp, row, col)
+    return "continue"